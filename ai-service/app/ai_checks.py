@@ -1,20 +1,32 @@
 from __future__ import annotations
 import io
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 from PIL import Image, ImageFile, ImageOps
 import imagehash
 from loguru import logger
 
+from .batching import MicroBatcher
+from .cascade import Cascade, Stage
+from .face_detect import FaceDetector, make_face_detector
+from .forensics import ELA_QUALITY, blur_scores, blur_thumbnail, ela_buffer, ela_score
+from .ingest import UnsupportedImage
+from .metrics import stage, timed
+from .onnx_backend import BACKENDS, ORT_OK, OrtModule, ensure_graph
+from .shared_weights import load_shared
+
 import torch
 import timm
-from sklearn.metrics.pairwise import cosine_similarity
 import open_clip
-import numpy as np
-import math
-from PIL import ImageChops
 try:
     import cv2
     OPENCV_OK = True
@@ -24,6 +36,32 @@ except Exception:
 # Make PIL robust to truncated images
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+# Smallest short side any downstream check needs (models ~224, blur 256, size gate 160), with headroom
+DECODE_MIN_SIDE = int(os.getenv('DECODE_MIN_SIDE', '512'))
+# Upper bound on pixels in an upload (decompression-bomb guard); 0 disables
+MAX_DECODE_PIXELS = int(os.getenv('MAX_DECODE_PIXELS', str(64_000_000)))
+if MAX_DECODE_PIXELS > 0:
+    Image.MAX_IMAGE_PIXELS = MAX_DECODE_PIXELS
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def _load(img: Image.Image) -> None:
+    # A body with a valid signature can still fail to decode
+    try:
+        img.load()
+    except (OSError, SyntaxError, ValueError) as e:
+        raise UnsupportedImage(f"image could not be decoded ({e})") from e
+
+
+@dataclass
+class PersonSignals:
+    face_area_frac: float  # largest detected face, as a fraction of the frame
+    skin_ratio: float      # share of skin-coloured pixels
+
+
 @dataclass
 class Thresholds:
     phash_max_hamming: int = 5
@@ -34,131 +72,526 @@ class Thresholds:
     min_clip_margin: float = 0.20     # require positive vs negative prompt margin
 
 
+# Longest side of the shared working copy used by ratio checks and model preprocessing
+WORKING_MAX_SIDE = int(os.getenv('WORKING_MAX_SIDE', '1024'))
+# Selfie check: face detector (see face_detect.py) and the long side of the frame it and skin detection run on
+FACE_DETECTOR = os.getenv('FACE_DETECTOR', 'haar').lower()
+FACE_MODEL_PATH = os.getenv('FACE_MODEL_PATH', '')
+FACE_SCORE_THRESHOLD = float(os.getenv('FACE_SCORE_THRESHOLD', '0.7'))
+FACE_DETECT_MAX_SIDE = int(os.getenv('FACE_DETECT_MAX_SIDE', '640'))
+
+
+class ImageBundle:
+    """One decoded upload plus the derived views every check needs.
+
+    Views are built lazily on first use and then shared, so one request does
+    a single EXIF transpose and a single downscale instead of one per check.
+    `source` is the image exactly as decoded; pHash, ELA and ORB keep using
+    it so stored hashes stay comparable. `read_image_from_bytes` only parses
+    the header; pixels are decoded when the first view needs them, under the
+    `decode` stage. `upload` (the raw bytes) lets ELA decode at full
+    resolution when `source` is a reduced-resolution JPEG decode.
+    """
+
+    def __init__(self, img: Image.Image, upload: Optional[bytes] = None):
+        self._image = img
+        self.upload = upload
+        # (positive, negative) CLIP probabilities and the L2-normalised image
+        # features behind them, set by the CLIP pass
+        self.clip_stats: Optional[Tuple[float, float]] = None
+        self.clip_features: Optional[np.ndarray] = None
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        # Size as uploaded, before any reduced-resolution decode
+        return self._image.info.get('original_size', self._image.size)
+
+    @cached_property
+    def source(self) -> Image.Image:
+        with stage('decode'):
+            _load(self._image)
+        return self._image
+
+    @cached_property
+    def rgb(self) -> Image.Image:
+        # EXIF-corrected RGB at full resolution; skip copies when nothing changes
+        with stage('decode'):
+            img = self._image
+            _load(img)
+            self.__dict__.setdefault('source', img)  # loaded: no second decode stage for pHash, ELA, ORB
+            if img.getexif().get(0x0112, 1) != 1:
+                img = ImageOps.exif_transpose(img)
+            return img if img.mode == 'RGB' else img.convert('RGB')
+
+    @cached_property
+    def working(self) -> Image.Image:
+        # Downscaled RGB copy (aspect preserved) for area ratios and model inputs
+        img = self.rgb
+        w, h = img.size
+        scale = WORKING_MAX_SIDE / float(max(w, h))
+        if scale >= 1.0:
+            return img
+        return img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BICUBIC)
+
+    @cached_property
+    def working_array(self) -> np.ndarray:
+        return np.asarray(self.working)
+
+    @cached_property
+    def clip_tensor(self) -> torch.Tensor:
+        return ensure_models_loaded().clip_preprocess(self.working)
+
+    @cached_property
+    def encoder_tensor(self) -> torch.Tensor:
+        return ensure_models_loaded().encoder_tf(self.working)
+
+    @cached_property
+    def blur_thumb(self) -> np.ndarray:
+        # The low-frequency window of the blur score is symmetric, so the
+        # EXIF-corrected working view scores the same as the upload
+        working = self.working
+        with stage('blur'):
+            return blur_thumbnail(working)
+
+    @cached_property
+    def blur(self) -> float:
+        return _blur_many([self.blur_thumb])[0]
+
+    @cached_property
+    def ela_pixels(self) -> np.ndarray:
+        # ELA measures the upload's JPEG block grid, which a reduced-resolution (DCT-scaled)
+        # decode does not keep, so that is redone at full size; only the crop is kept
+        if self.upload is None or self.source.size == self.size:
+            return ela_buffer(self.source)
+        with stage('decode'):
+            full = Image.open(io.BytesIO(self.upload))
+            _load(full)
+        return ela_buffer(full).copy()
+
+    @cached_property
+    def orb_features(self) -> Tuple[list, Optional[np.ndarray]]:
+        return _orb_detect(self.source)
+
+    @cached_property
+    def person(self) -> PersonSignals:
+        return _person_signals(self.working_array)
+
+    @cached_property
+    def vegetation(self) -> float:
+        return ensure_models_loaded().vegetation_ratio(self)
+
+
+ImageLike = Union[Image.Image, ImageBundle]
+
+
+def as_bundle(img: ImageLike) -> ImageBundle:
+    return img if isinstance(img, ImageBundle) else ImageBundle(img)
+
+
+def source_image(img: ImageLike) -> Image.Image:
+    return img.source if isinstance(img, ImageBundle) else img
+
+
+DEFAULT_CLIP_POSITIVE = [
+    "a photo of a tree",
+    "an image of a tree in nature",
+    "a single tree outdoors",
+    "a forest tree"
+]
+DEFAULT_CLIP_NEGATIVE = [
+    "a human face",
+    "a selfie",
+    "an indoor room",
+    "a wall",
+    "a person portrait"
+]
+
+
+def load_clip_prompts() -> Tuple[List[str], List[str]]:
+    """Resolve the CLIP prompt set.
+
+    CLIP_PROMPTS_FILE points at a JSON file {"positive": [...], "negative": [...]};
+    otherwise CLIP_POSITIVE_PROMPTS / CLIP_NEGATIVE_PROMPTS hold '|'-separated
+    prompts. Anything unset falls back to the built-in defaults.
+    """
+    positive, negative = list(DEFAULT_CLIP_POSITIVE), list(DEFAULT_CLIP_NEGATIVE)
+    path = os.getenv('CLIP_PROMPTS_FILE')
+    if path:
+        with open(path, 'r', encoding='utf-8') as fh:
+            data = json.load(fh)
+        positive = list(data.get('positive') or positive)
+        negative = list(data.get('negative') or negative)
+    pos_env = os.getenv('CLIP_POSITIVE_PROMPTS')
+    neg_env = os.getenv('CLIP_NEGATIVE_PROMPTS')
+    if pos_env:
+        positive = [p.strip() for p in pos_env.split('|') if p.strip()]
+    if neg_env:
+        negative = [p.strip() for p in neg_env.split('|') if p.strip()]
+    return positive, negative
+
+
+# Where weights come from. MODEL_CACHE_DIR is the download cache for timm and
+# open_clip (pre-populate it to boot offline); MODEL_ARTIFACT_DIR holds traced
+# TorchScript models written by `python -m app.export_models`, which load
+# without building the eager models or touching the network.
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR') or None
+MODEL_ARTIFACT_DIR = os.getenv('MODEL_ARTIFACT_DIR') or None
+ARTIFACT_MANIFEST = 'manifest.json'
+# Pretrained weights memory-mapped from this directory, so every worker process
+# shares one copy (see shared_weights.py); empty keeps private copies
+SHARED_WEIGHTS_DIR = os.getenv('SHARED_WEIGHTS_DIR') or None
+ENCODER_NAME = 'efficientnet_b0'
+CLIP_NAME = 'ViT-B-32'
+CLIP_PRETRAINED = 'openai'
+# Runtime for the two image encoders: eager torch (the reference), ONNX Runtime,
+# or ONNX Runtime with int8 dynamic quantisation. Graphs are exported on first
+# use into ONNX_MODEL_DIR (or pre-built by `python -m app.export_models --onnx`).
+INFER_BACKEND = os.getenv('INFER_BACKEND', 'torch').lower()
+ONNX_MODEL_DIR = os.getenv('ONNX_MODEL_DIR') or os.path.join(
+    MODEL_ARTIFACT_DIR or MODEL_CACHE_DIR or os.path.join(os.path.expanduser('~'), '.cache', 'miko-ai'), 'onnx')
+# Dedupe embeddings: EfficientNet-B0 features (1280-d, a second forward pass) or
+# the CLIP image features the tree check already computes (512-d, no extra pass)
+EMBEDDING_MODELS = ('efficientnet', 'clip')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'efficientnet').lower()
+
+
+def model_version() -> str:
+    """Identifier of the weights and runtime that produce embeddings and scores."""
+    clip = f"{CLIP_NAME}-{CLIP_PRETRAINED}"
+    models = clip if EMBEDDING_MODEL == 'clip' else f"{ENCODER_NAME}+{clip}"
+    return f"{models}/{INFER_BACKEND}"
+
+
+def embedding_version(embedding: str = EMBEDDING_MODEL) -> str:
+    """Identifier of the model behind stored embeddings, stamped on tree documents.
+
+    The runtime is left out: ONNX backends are parity-checked against torch,
+    so switching them does not call for re-embedding.
+    """
+    if embedding not in EMBEDDING_MODELS:
+        raise ValueError(f"unknown embedding model: {embedding!r} (expected one of {', '.join(EMBEDDING_MODELS)})")
+    return f"{CLIP_NAME}-{CLIP_PRETRAINED}" if embedding == 'clip' else ENCODER_NAME
+
+
+def _create_encoder(pretrained: bool = True) -> torch.nn.Module:
+    return timm.create_model(ENCODER_NAME, pretrained=pretrained, num_classes=0, cache_dir=MODEL_CACHE_DIR)
+
+
+def _create_clip(pretrained: bool = True) -> torch.nn.Module:
+    if pretrained:
+        return open_clip.create_model(CLIP_NAME, pretrained=CLIP_PRETRAINED, cache_dir=MODEL_CACHE_DIR)
+    # The architecture and preprocessing the pretrained tag sets, without its weights. Built
+    # for load_shared, under the meta device, which open_clip's final .to(device) must keep
+    cfg = open_clip.get_pretrained_cfg(CLIP_NAME, CLIP_PRETRAINED)
+    return open_clip.create_model(
+        CLIP_NAME, device='meta', force_quick_gelu=cfg.get('quick_gelu', False),
+        force_preprocess_cfg={k: cfg[k] for k in ('mean', 'std', 'interpolation', 'resize_mode') if k in cfg})
+
+
 class Models:
-    def __init__(self):
-        logger.info("Loading image encoder (EfficientNet-B0)…")
-        self.encoder = timm.create_model('efficientnet_b0', pretrained=True, num_classes=0)
-        self.encoder.eval()
-        self.encoder_cfg = timm.data.resolve_data_config(self.encoder.pretrained_cfg)
-        self.encoder_tf = timm.data.create_transform(**self.encoder_cfg)
-
-        # CLIP zero-shot classification for 'tree' vs negatives
+    def __init__(self, artifact_dir: Optional[str] = MODEL_ARTIFACT_DIR, backend: str = INFER_BACKEND,
+                 onnx_dir: str = ONNX_MODEL_DIR, embedding: str = EMBEDDING_MODEL):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown inference backend: {backend!r} (expected one of {', '.join(BACKENDS)})")
+        embedding_version(embedding)  # validates the name
+        # With CLIP embeddings the EfficientNet encoder is not loaded at all
+        self.embedding = embedding
+        self.encoder = None
+        self.encoder_cfg = None
+        self.encoder_tf = None
+        # Wall time of each loading phase in ms, reported at startup
+        self.timings: Dict[str, float] = {}
+        self.source = 'artifacts' if artifact_dir else 'shared' if SHARED_WEIGHTS_DIR else 'pretrained'
+        self.backend = 'torch'
+        self.clip_model = None
+        self.clip_tokenizer = None
+        # (positive, negative, features) exported alongside the artifacts
+        self._artifact_text: Optional[Tuple[List[str], List[str], torch.Tensor]] = None
+        if artifact_dir:
+            if SHARED_WEIGHTS_DIR:
+                logger.warning("SHARED_WEIGHTS_DIR is ignored with MODEL_ARTIFACT_DIR: TorchScript artifacts "
+                               "cannot be memory-mapped")
+            self._load_artifacts(artifact_dir)
+        else:
+            if embedding == 'efficientnet':
+                with self._timed('encoder'):
+                    logger.info("Loading image encoder (EfficientNet-B0)…")
+                    if SHARED_WEIGHTS_DIR:
+                        self.encoder = load_shared(ENCODER_NAME, lambda: _create_encoder(False), _create_encoder,
+                                                   SHARED_WEIGHTS_DIR)
+                    else:
+                        self.encoder = _create_encoder()
+                    self.encoder.eval()
+                    self.encoder_cfg = timm.data.resolve_data_config(self.encoder.pretrained_cfg)
+                    self.encoder_tf = timm.data.create_transform(**self.encoder_cfg)
+            # CLIP zero-shot classification for 'tree' vs negatives
+            with self._timed('clip'):
+                self._load_clip()
+                self.clip_visual = self.clip_model.visual
+                self.clip_input_size = tuple(self.clip_model.visual.image_size)
+        if backend != 'torch':
+            with self._timed('onnx'):
+                self._use_onnx(backend, onnx_dir)
+        # Prompt embeddings are computed once here, not per image
+        self.clip_positive: List[str] = []
+        self.clip_negative: List[str] = []
+        self.clip_text_features: Optional[torch.Tensor] = None
+        with self._timed('prompt_embeddings'):
+            self.set_prompts(*load_clip_prompts())
+        with self._timed('face_detector'):
+            self.face_detector: FaceDetector = make_face_detector(FACE_DETECTOR, FACE_MODEL_PATH, FACE_SCORE_THRESHOLD)
+        logger.info(f"Models ready from {self.source} ({self.backend}): "
+                    + ", ".join(f"{k} {v:.0f}ms" for k, v in self.timings.items()))
+
+    @contextmanager
+    def _timed(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = (time.perf_counter() - start) * 1000.0
+
+    def _load_clip(self) -> None:
         logger.info("Loading OpenCLIP (ViT-B-32) for zero-shot checks…")
-        self.clip_model, self.clip_preprocess, _ = open_clip.create_model_and_transforms('ViT-B-32', pretrained='openai')
+        if SHARED_WEIGHTS_DIR:
+            self.clip_model = load_shared(f'{CLIP_NAME}-{CLIP_PRETRAINED}', lambda: _create_clip(False),
+                                          _create_clip, SHARED_WEIGHTS_DIR)
+            pp = self.clip_model.visual.preprocess_cfg
+            self.clip_preprocess = open_clip.image_transform(
+                pp['size'], is_train=False, mean=pp['mean'], std=pp['std'],
+                resize_mode=pp.get('resize_mode'), interpolation=pp.get('interpolation'))
+        else:
+            # The second transform is the training one (random crops); inference uses the eval one
+            self.clip_model, _, self.clip_preprocess = open_clip.create_model_and_transforms(
+                CLIP_NAME, pretrained=CLIP_PRETRAINED, cache_dir=MODEL_CACHE_DIR)
         self.clip_model.eval()
-        self.clip_tokenizer = open_clip.get_tokenizer('ViT-B-32')
-        # Pre-tokenize prompts
-        self.clip_positive = self.clip_tokenizer([
-            "a photo of a tree",
-            "an image of a tree in nature",
-            "a single tree outdoors",
-            "a forest tree"
-        ])
-        self.clip_negative = self.clip_tokenizer([
-            "a human face",
-            "a selfie",
-            "an indoor room",
-            "a wall",
-            "a person portrait"
-        ])
-        logger.info("OpenCLIP ready.")
-
-    def encode_image(self, img: Image.Image) -> np.ndarray:
-        img = ImageOps.exif_transpose(img).convert('RGB')
-        tensor = self.encoder_tf(img).unsqueeze(0)
+        self.clip_tokenizer = open_clip.get_tokenizer(CLIP_NAME)
+
+    def _load_artifacts(self, artifact_dir: str) -> None:
+        with open(os.path.join(artifact_dir, ARTIFACT_MANIFEST), 'r', encoding='utf-8') as fh:
+            manifest = json.load(fh)
+        if self.embedding == 'efficientnet':
+            with self._timed('encoder'):
+                logger.info(f"Loading image encoder from {artifact_dir}…")
+                enc = manifest['encoder']
+                self.encoder = torch.jit.load(os.path.join(artifact_dir, enc['file']), map_location='cpu').eval()
+                self.encoder_cfg = dict(enc['data_config'], input_size=tuple(enc['data_config']['input_size']))
+                self.encoder_tf = timm.data.create_transform(**self.encoder_cfg)
+        with self._timed('clip'):
+            logger.info(f"Loading OpenCLIP image tower from {artifact_dir}…")
+            clip = manifest['clip']
+            self.clip_visual = torch.jit.load(os.path.join(artifact_dir, clip['file']), map_location='cpu').eval()
+            pp = clip['preprocess']
+            size = pp['image_size']
+            self.clip_input_size = (size, size) if isinstance(size, int) else tuple(size)
+            self.clip_preprocess = open_clip.image_transform(
+                pp['image_size'], is_train=False, mean=tuple(pp['mean']), std=tuple(pp['std']),
+                resize_mode=pp.get('resize_mode'), interpolation=pp.get('interpolation'))
+            text = torch.load(os.path.join(artifact_dir, clip['text_file']), map_location='cpu')
+            self._artifact_text = (list(text['positive']), list(text['negative']), text['features'])
+
+    def _use_onnx(self, backend: str, onnx_dir: str) -> None:
+        # Swap the image encoders for ONNX Runtime sessions exported from the torch modules
+        if not ORT_OK:
+            logger.error(f"INFER_BACKEND={backend} but onnxruntime is not installed; using torch")
+            return
+        int8 = backend == 'onnx-int8'
+        enc_path = os.path.join(onnx_dir, f'{ENCODER_NAME}.onnx')
+        clip_path = os.path.join(onnx_dir, f'{CLIP_NAME}-{CLIP_PRETRAINED}.visual.onnx')
+        need_encoder = self.encoder is not None  # not loaded with CLIP embeddings
+        have_graphs = os.path.exists(clip_path) and (os.path.exists(enc_path) or not need_encoder)
+        if self.source == 'artifacts' and not have_graphs:
+            # Frozen TorchScript graphs use fused kernels the ONNX exporter cannot translate
+            logger.error(f"INFER_BACKEND={backend} but {onnx_dir} has no ONNX graphs; "
+                         f"run `python -m app.export_models --onnx`. Using torch")
+            return
+        if need_encoder:
+            enc_path = ensure_graph(self.encoder, torch.zeros((1, *self.encoder_cfg['input_size'])), enc_path, int8)
+            self.encoder = OrtModule(enc_path)
+        clip_path = ensure_graph(self.clip_visual, torch.zeros((1, 3, *self.clip_input_size)), clip_path, int8)
+        self.clip_visual = OrtModule(clip_path)
+        self.backend = backend
+        logger.info(f"Image encoders running on ONNX Runtime ({backend}) from {onnx_dir}")
+
+    def set_prompts(self, positive: List[str], negative: List[str]) -> None:
+        """(Re)build the cached, L2-normalised text embeddings for the prompt set.
+
+        Rows [0, len(positive)) are positives, the rest negatives. A no-op when
+        the prompt set is unchanged.
+        """
+        positive, negative = list(positive), list(negative)
+        if not positive or not negative:
+            raise ValueError("CLIP prompts need at least one positive and one negative")
+        if self.clip_text_features is not None and positive == self.clip_positive and negative == self.clip_negative:
+            return
+        cached = self._artifact_text
+        if cached is not None and cached[0] == positive and cached[1] == negative:
+            feats = cached[2]
+        else:
+            if self.clip_model is None:
+                # Exported embeddings are for another prompt set; the text tower is needed after all
+                logger.warning("CLIP prompts differ from the exported artifacts; loading the full model")
+                self._load_clip()
+            with torch.no_grad():
+                tokens = self.clip_tokenizer(positive + negative)
+                feats = self.clip_model.encode_text(tokens)
+                feats /= feats.norm(dim=-1, keepdim=True)
+        self.clip_positive = positive
+        self.clip_negative = negative
+        # Swap features and positive count together so in-flight batches see a consistent pair
+        self.clip_text = (feats, len(positive))
+        self.clip_text_features = feats
+        logger.info(f"CLIP prompt embeddings cached ({len(positive)} positive, {len(negative)} negative)")
+
+    def encoder_tensor(self, img: ImageLike) -> torch.Tensor:
+        return as_bundle(img).encoder_tensor
+
+    def clip_tensor(self, img: ImageLike) -> torch.Tensor:
+        return as_bundle(img).clip_tensor
+
+    def encode_tensors(self, tensors: List[torch.Tensor]) -> np.ndarray:
+        # One forward pass over a stack of preprocessed images -> (N, D)
         with torch.no_grad():
-            vec = self.encoder(tensor)
-        return vec.cpu().numpy()
+            vecs = self.encoder(torch.stack(tensors))
+        return vecs.cpu().numpy()
 
-    def clip_tree_prob(self, img: Image.Image) -> float:
-        # Return a score ~[0,1] for tree likelihood vs negatives
+    def clip_forward(self, tensors: List[torch.Tensor]) -> Tuple[List[Tuple[float, float]], np.ndarray]:
+        # One forward pass over a stack of preprocessed images ->
+        # ([(pos_prob, neg_prob), ...], (N, D) L2-normalised image features)
+        text_features, n_pos = self.clip_text
         with torch.no_grad():
-            image = self.clip_preprocess(ImageOps.exif_transpose(img).convert('RGB')).unsqueeze(0)
-            pos = self.clip_positive
-            neg = self.clip_negative
-            # Compute logits against concatenated prompts
-            texts = torch.cat([pos, neg], dim=0)
-            image_features = self.clip_model.encode_image(image)
-            text_features = self.clip_model.encode_text(texts)
+            image_features = self.clip_visual(torch.stack(tensors))
             image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            logits = (image_features @ text_features.t()).squeeze(0)
-            # Softmax over prompts
-            probs = logits.softmax(dim=0)
-            pos_prob = float(probs[: len(pos)].sum().cpu())
-            return pos_prob
-
-    def clip_tree_stats(self, img: Image.Image) -> tuple[float, float]:
-        with torch.no_grad():
-            image = self.clip_preprocess(ImageOps.exif_transpose(img).convert('RGB')).unsqueeze(0)
-            pos = self.clip_positive
-            neg = self.clip_negative
-            texts = torch.cat([pos, neg], dim=0)
-            image_features = self.clip_model.encode_image(image)
-            text_features = self.clip_model.encode_text(texts)
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            logits = (image_features @ text_features.t()).squeeze(0)
-            probs = logits.softmax(dim=0)
-            pos_prob = float(probs[: len(pos)].sum().cpu())
-            neg_prob = float(probs[len(pos):].sum().cpu())
-            return pos_prob, neg_prob
-
-    def vegetation_ratio(self, img: Image.Image) -> float:
-        # Simple vegetation signal: ExG (excess green) > 0 on normalized channels
-        arr = np.asarray(ImageOps.exif_transpose(img).convert('RGB'), dtype=np.float32) / 255.0
-        r = arr[..., 0]
-        g = arr[..., 1]
-        b = arr[..., 2]
-        exg = 2*g - r - b
-        mask = exg > 0.05
-        return float(mask.mean())
+            probs = (image_features @ text_features.t()).softmax(dim=-1)
+            pos_probs = probs[:, :n_pos].sum(dim=-1).cpu().tolist()
+            neg_probs = probs[:, n_pos:].sum(dim=-1).cpu().tolist()
+            return list(zip(pos_probs, neg_probs)), image_features.cpu().numpy()
 
-    def face_area_fraction(self, img: Image.Image) -> float:
-        if not OPENCV_OK:
-            return 0.0
-        try:
-            gray = np.array(ImageOps.exif_transpose(img).convert('L'))
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-            if len(faces) == 0:
-                return 0.0
-            H, W = gray.shape[:2]
-            total = H * W
-            area = 0
-            for (x, y, fw, fh) in faces:
-                area = max(area, fw * fh)
-            return float(area / max(1, total))
-        except Exception:
-            return 0.0
-
-    def skin_ratio(self, img: Image.Image) -> float:
-        # Very coarse skin detection in YCrCb; helps detect selfies
-        bgr = np.array(ImageOps.exif_transpose(img).convert('RGB'))[..., ::-1]
-        ycrcb = cv2.cvtColor(bgr, cv2.COLOR_BGR2YCrCb) if OPENCV_OK else None
-        if ycrcb is None:
-            return 0.0
-        Y, Cr, Cb = ycrcb[..., 0], ycrcb[..., 1], ycrcb[..., 2]
-        mask = (Cr > 135) & (Cr < 180) & (Cb > 85) & (Cb < 135)
+    def clip_stats_tensors(self, tensors: List[torch.Tensor]) -> List[Tuple[float, float]]:
+        return self.clip_forward(tensors)[0]
+
+    def encode_image(self, img: ImageLike) -> np.ndarray:
+        return self.encode_tensors([self.encoder_tensor(img)])
+
+    def clip_tree_prob(self, img: ImageLike) -> float:
+        # Return a score ~[0,1] for tree likelihood vs negatives
+        return self.clip_tree_stats(img)[0]
+
+    def clip_tree_stats(self, img: ImageLike) -> tuple[float, float]:
+        return self.clip_stats_tensors([self.clip_tensor(img)])[0]
+
+    @timed('vegetation')
+    def vegetation_ratio(self, img: ImageLike) -> float:
+        # Simple vegetation signal: ExG (excess green) > 0 on normalized channels.
+        # 2g - r - b > 0.05 is evaluated in integer units (x255) to avoid float copies.
+        arr = as_bundle(img).working_array.astype(np.int16)
+        exg = 2*arr[..., 1] - arr[..., 0] - arr[..., 2]
+        mask = exg > 0.05 * 255.0
         return float(mask.mean())
 
+    def face_area_fraction(self, img: ImageLike) -> float:
+        return as_bundle(img).person.face_area_frac
+
+    def skin_ratio(self, img: ImageLike) -> float:
+        return as_bundle(img).person.skin_ratio
+
 
 MODELS: Optional[Models] = None
+_MODELS_LOCK = threading.Lock()
+
+# Micro-batching schedulers in front of the two forward passes (None = unbatched)
+CLIP_BATCHER: Optional[MicroBatcher] = None
+ENCODER_BATCHER: Optional[MicroBatcher] = None
 
 
 def ensure_models_loaded() -> Models:
     global MODELS
     if MODELS is None:
-        MODELS = Models()
+        with _MODELS_LOCK:
+            if MODELS is None:
+                MODELS = Models()
     return MODELS
 
 
-def read_image_from_bytes(data: bytes) -> Image.Image:
-    return Image.open(io.BytesIO(data))
+def configure_batching(max_batch_size: int, max_wait_ms: float) -> None:
+    """Route CLIP and encoder forward passes through micro-batchers.
+
+    Concurrent callers (e.g. requests running in the threadpool) are coalesced
+    into one batched forward pass per model; a batch closes as soon as it is
+    full or its oldest item has waited `max_wait_ms`, which bounds the added
+    latency. `max_batch_size <= 1` disables batching.
+    """
+    global CLIP_BATCHER, ENCODER_BATCHER
+    if max_batch_size <= 1:
+        CLIP_BATCHER = None
+        ENCODER_BATCHER = None
+        return
+    CLIP_BATCHER = MicroBatcher(
+        lambda tensors: list(zip(*ensure_models_loaded().clip_forward(tensors))),
+        max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name="clip-batcher"
+    )
+    ENCODER_BATCHER = MicroBatcher(
+        lambda tensors: ensure_models_loaded().encode_tensors(tensors),
+        max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name="encoder-batcher"
+    )
+
+
+def batching_stats() -> dict:
+    return {
+        "clip": CLIP_BATCHER.stats() if CLIP_BATCHER else None,
+        "encoder": ENCODER_BATCHER.stats() if ENCODER_BATCHER else None,
+    }
+
+
+@timed('clip')
+def clip_tree_stats(img: ImageLike) -> Tuple[float, float]:
+    if isinstance(img, ImageBundle) and img.clip_stats is not None:
+        return img.clip_stats
+    m = ensure_models_loaded()
+    # Preprocess in the caller's thread; only the forward pass is batched
+    tensor = m.clip_tensor(img)
+    if CLIP_BATCHER is None:
+        stats, features = m.clip_forward([tensor])
+        stats, features = stats[0], features[0]
+    else:
+        stats, features = CLIP_BATCHER(tensor)
+    if isinstance(img, ImageBundle):
+        img.clip_stats, img.clip_features = stats, features
+    return stats
+
+
+def read_image_from_bytes(data: bytes, min_side: Optional[int] = None,
+                          max_pixels: Optional[int] = None) -> Image.Image:
+    """Open an upload, decoding JPEGs at reduced resolution.
+
+    Only the header is parsed before the pixel-count check, so oversized
+    uploads are refused before any decode work. For JPEGs, PIL's draft mode
+    picks the largest DCT scale (1/2, 1/4, 1/8) that keeps the short side at
+    or above `min_side`, which skips most of the IDCT and allocation cost on
+    phone photos. The uploaded size is kept in `img.info['original_size']`.
+    """
+    min_side = DECODE_MIN_SIDE if min_side is None else min_side
+    max_pixels = MAX_DECODE_PIXELS if max_pixels is None else max_pixels
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except (OSError, SyntaxError, ValueError) as e:
+        # UnidentifiedImageError is an OSError
+        raise UnsupportedImage(f"image could not be decoded ({e})") from e
+    w, h = img.size
+    if max_pixels > 0 and w * h > max_pixels:
+        raise ImageTooLarge(f"image has {w * h} pixels; limit is {max_pixels}")
+    img.info['original_size'] = (w, h)
+    if img.format == 'JPEG' and min_side > 0 and min(w, h) > 2 * min_side:
+        scale = min_side / float(min(w, h))
+        img.draft(img.mode, (math.ceil(w * scale), math.ceil(h * scale)))
+    return img
 
 
-def compute_phash(img: Image.Image) -> str:
-    return str(imagehash.phash(img))  # 16-char hex string typically
+@timed('phash')
+def compute_phash(img: ImageLike) -> str:
+    return str(imagehash.phash(source_image(img)))  # 16-char hex string typically
 
 
 def hamming_distance_hex(a: str, b: str) -> int:
@@ -167,99 +600,130 @@ def hamming_distance_hex(a: str, b: str) -> int:
     return x.bit_count()
 
 
-def is_tree_like(img: Image.Image, thresholds: Thresholds) -> Tuple[bool, float, dict]:
-    m = ensure_models_loaded()
-    # Quick pre-checks: very small images or extremely low high-frequency energy (likely blank)
-    w, h = img.size
-    if w < 160 or h < 160:
-        logger.debug("reject: image too small for reliable detection")
-        return False, 0.0, {"reason": "too_small", "w": w, "h": h}
-    blur = blur_score_fft(img)
-    if blur < thresholds.min_blur_score:
-        logger.debug("reject: image extremely blurry")
-        return False, 0.0, {"reason": "blur_low", "blur": blur}
-
-    # Face/saliency rejection (basic): if face detected prominently, likely not a tree submission
-    try:
-        if OPENCV_OK:
-            face_frac = m.face_area_fraction(img)
-            if face_frac > 0.04:
-                logger.debug("reject: large face detected")
-                return False, 0.0, {"reason": "face_detected", "face_area_frac": face_frac}
-    except Exception:
-        pass
-
+def _clip_signals(img: ImageBundle) -> dict:
     # OpenCLIP tree probability and margin vs negatives
     try:
-        pos_prob, neg_prob = m.clip_tree_stats(img)
-        tree_prob = pos_prob
-        margin = pos_prob - neg_prob
+        pos_prob, neg_prob = clip_tree_stats(img)
     except Exception:
-        tree_prob = 0.0
-        margin = -1.0
-    logger.debug(f"clip tree prob ~ {tree_prob:.3f} | margin ~ {margin:.3f}")
-
-    # Vegetation ratio
-    veg = m.vegetation_ratio(img)
-    logger.debug(f"vegetation ratio ~ {veg:.3f}")
-
-    # EfficientNet feature heuristic (kept as a secondary signal)
-    # Combine signals: weighted score
-    score = float(0.7 * tree_prob + 0.2 * min(1.0, veg * 2.0) + 0.1 * max(0.0, margin))
-
-    # Additional selfie guard
-    skin = m.skin_ratio(img)
-    face_frac = m.face_area_fraction(img) if OPENCV_OK else 0.0
-
-    ok = (
-        (tree_prob >= thresholds.tree_confidence_min) and
-        (veg >= thresholds.min_veg_ratio) and
-        (margin >= thresholds.min_clip_margin) and
-        (skin < 0.15) and
-        (face_frac < 0.04)
-    )
-    info = {
-        "clip_tree_prob": tree_prob,
-        "clip_margin": margin,
-        "vegetation_ratio": veg,
-        "blur": blur,
-        "skin_ratio": skin,
-        "face_area_frac": face_frac,
-        "w": w,
-        "h": h
-    }
-    if not ok:
-        reasons = []
-        if tree_prob < thresholds.tree_confidence_min:
-            reasons.append("low_tree_prob")
-        if veg < thresholds.min_veg_ratio:
-            reasons.append("low_vegetation")
-        if margin < thresholds.min_clip_margin:
-            reasons.append("low_clip_margin")
-        if skin >= 0.15:
-            reasons.append("skin_detected")
-        if face_frac >= 0.04:
-            reasons.append("face_detected")
-        info["reasons"] = reasons
-
-    return ok, score, info
-
-
-def encode_feature_vector(img: Image.Image) -> np.ndarray:
+        return {"clip_tree_prob": 0.0, "clip_margin": -1.0}
+    logger.debug(f"clip tree prob ~ {pos_prob:.3f} | margin ~ {pos_prob - neg_prob:.3f}")
+    return {"clip_tree_prob": pos_prob, "clip_margin": pos_prob - neg_prob}
+
+
+def _person_stage(img: ImageBundle) -> dict:
+    # Face and skin signals come from one pass over a downscaled frame
+    person = img.person
+    return {"face_area_frac": person.face_area_frac, "skin_ratio": person.skin_ratio}
+
+
+# The tree check, cheapest stages first. Costs are rough ms on a working-size
+# image (1024 px long side, one core); the order is what matters.
+TREE_CHECK = Cascade([
+    Stage('size', 0.0, ('w', 'h'), lambda img: dict(zip(('w', 'h'), img.size)),
+          lambda s, t: ['too_small'] if s['w'] < 160 or s['h'] < 160 else []),
+    Stage('vegetation', 1.5, ('vegetation_ratio',), lambda img: {"vegetation_ratio": img.vegetation},
+          lambda s, t: ['low_vegetation'] if s['vegetation_ratio'] < t.min_veg_ratio else []),
+    Stage('blur', 3.0, ('blur',), lambda img: {"blur": blur_score_fft(img)},
+          lambda s, t: ['blur_low'] if s['blur'] < t.min_blur_score else []),
+    # Selfie guard: a prominent face or lots of skin
+    Stage('person', 5.0, ('face_area_frac', 'skin_ratio'), _person_stage,
+          lambda s, t: (['face_detected'] if s['face_area_frac'] >= 0.04 else [])
+          + (['skin_detected'] if s['skin_ratio'] >= 0.15 else [])),
+    Stage('clip', 150.0, ('clip_tree_prob', 'clip_margin'), _clip_signals,
+          lambda s, t: (['low_tree_prob'] if s['clip_tree_prob'] < t.tree_confidence_min else [])
+          + (['low_clip_margin'] if s['clip_margin'] < t.min_clip_margin else [])),
+])
+# Stages up to this cost form the screen that runs before the pHash duplicate
+# lookup; the neural ones run after it
+SCREEN_MAX_COST_MS = 50.0
+
+
+def tree_score(info: dict) -> float:
+    """Weighted tree score from the check's signals; 0 when CLIP or vegetation did not run."""
+    if 'clip_tree_prob' not in info or 'vegetation_ratio' not in info:
+        return 0.0
+    return float(0.7 * info['clip_tree_prob'] + 0.2 * min(1.0, info['vegetation_ratio'] * 2.0)
+                 + 0.1 * max(0.0, info['clip_margin']))
+
+
+def is_tree_like(img: ImageLike, thresholds: Thresholds, explain: bool = False,
+                 known: Optional[dict] = None) -> Tuple[bool, float, dict]:
+    """(passed, score, diagnostics) of the TREE_CHECK cascade.
+
+    Stops at the first failing stage; `explain` runs every stage and reports
+    all reasons with per-stage timings. `known` holds signals from an earlier
+    screen of the same image, which are not measured again.
+    """
+    reasons, info = TREE_CHECK.run(as_bundle(img), thresholds, explain, known)
+    return not reasons, tree_score(info), info
+
+
+def screen_tree_like(img: ImageLike, thresholds: Thresholds) -> Tuple[bool, dict]:
+    """The cheap stages of the tree check (no models): (passed so far, diagnostics)."""
+    reasons, info = TREE_CHECK.run(as_bundle(img), thresholds, max_cost_ms=SCREEN_MAX_COST_MS)
+    return not reasons, info
+
+
+@timed('encoder')
+def encode_feature_vector(img: ImageLike) -> np.ndarray:
+    if EMBEDDING_MODEL == 'clip':
+        return _clip_embeddings([img])
+    m = ensure_models_loaded()
+    tensor = m.encoder_tensor(img)
+    if ENCODER_BATCHER is None:
+        return m.encode_tensors([tensor])
+    return ENCODER_BATCHER(tensor).reshape(1, -1)
+
+
+@timed('clip')
+def clip_tree_stats_many(imgs: List[ImageLike]) -> List[Tuple[float, float]]:
+    # Callers that already hold a batch run one forward pass directly, not via the micro-batcher
+    if not imgs:
+        return []
+    m = ensure_models_loaded()
+    stats, features = m.clip_forward([m.clip_tensor(img) for img in imgs])
+    for img, s, f in zip(imgs, stats, features):
+        if isinstance(img, ImageBundle):
+            img.clip_stats, img.clip_features = s, f
+    return stats
+
+
+@timed('encoder')
+def encode_feature_vectors(imgs: List[ImageLike]) -> np.ndarray:
+    if not imgs:
+        return np.empty((0, 0), dtype=np.float32)
+    if EMBEDDING_MODEL == 'clip':
+        return _clip_embeddings(imgs)
     m = ensure_models_loaded()
-    return m.encode_image(img)
+    return m.encode_tensors([m.encoder_tensor(img) for img in imgs])
+
+
+def _clip_embeddings(imgs: List[ImageLike]) -> np.ndarray:
+    # (N, D) CLIP image features, reused from the tree check's pass; only
+    # images it has not seen get one (batched when there are several)
+    bundles = [as_bundle(img) for img in imgs]
+    todo = [b for b in bundles if b.clip_features is None]
+    if len(todo) == 1:
+        todo[0].clip_stats = None
+        clip_tree_stats(todo[0])
+    elif todo:
+        clip_tree_stats_many(todo)
+    return np.stack([b.clip_features for b in bundles])
 
 
 def max_cosine_similarity(query_vec: np.ndarray, vectors: List[np.ndarray]) -> float:
     if not vectors:
         return 0.0
-    mat = np.vstack(vectors)
-    sims = cosine_similarity(query_vec, mat)
-    return float(np.max(sims))
+    mat = np.vstack(vectors).astype(np.float32)
+    mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vec, dtype=np.float32).reshape(1, -1)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    return float(np.max(mat @ query[0]))
 
 
 # --- Forensics ---
-def extract_basic_exif(img: Image.Image) -> dict:
+def extract_basic_exif(img: ImageLike) -> dict:
+    img = source_image(img)
     info = {}
     try:
         exif = img.getexif()
@@ -271,31 +735,33 @@ def extract_basic_exif(img: Image.Image) -> dict:
     return info
 
 
-def error_level_analysis(img: Image.Image, quality: int = 85) -> float:
+@timed('ela')
+def error_level_analysis(img: ImageLike, quality: int = ELA_QUALITY) -> float:
+    # JPEG round trip of the full-resolution pixels (not the resampled views); see forensics
     try:
-        # Save to JPEG at known quality and compare difference magnitude
-        bio = io.BytesIO()
-        img.save(bio, 'JPEG', quality=quality)
-        bio.seek(0)
-        comp = Image.open(bio)
-        diff = ImageChops.difference(img.convert('RGB'), comp.convert('RGB'))
-        # Average pixel intensity as simple score
-        arr = np.asarray(diff).astype(np.float32)
-        return float(arr.mean() / 255.0)
+        pixels = img.ela_pixels if isinstance(img, ImageBundle) else ela_buffer(img)
+        return ela_score(pixels, quality)
     except Exception:
         return 0.0
 
 
-def blur_score_fft(img: Image.Image) -> float:
-    # Simple high-frequency energy ratio as blur proxy
-    arr = np.asarray(img.convert('L').resize((256, 256), Image.BICUBIC), dtype=np.float32)
-    f = np.fft.fft2(arr)
-    fshift = np.fft.fftshift(f)
-    magnitude = np.abs(fshift)
-    total = magnitude.sum()
-    center = magnitude[96:160, 96:160].sum()
-    high = total - center
-    return float((high / (total + 1e-6)))
+def blur_score_fft(img: ImageLike) -> float:
+    # Computed once per bundle; every caller shares the value
+    return img.blur if isinstance(img, ImageBundle) else _blur_many([blur_thumbnail(img)])[0]
+
+
+def blur_scores_many(imgs: List[ImageBundle]) -> List[float]:
+    """`blur_score_fft` of several bundles with one batched FFT; each bundle keeps its score."""
+    todo = [img for img in imgs if 'blur' not in vars(img)]
+    if todo:
+        for img, score in zip(todo, _blur_many([img.blur_thumb for img in todo])):
+            img.blur = score
+    return [img.blur for img in imgs]
+
+
+@timed('blur')
+def _blur_many(thumbs: List[np.ndarray]) -> List[float]:
+    return [float(v) for v in blur_scores(np.stack(thumbs))]
 
 
 def aggregate_multi_view(vectors: List[np.ndarray]) -> np.ndarray:
@@ -304,14 +770,48 @@ def aggregate_multi_view(vectors: List[np.ndarray]) -> np.ndarray:
     return mat.mean(axis=0, keepdims=True)
 
 
-def orb_match_ratio(img1: Image.Image, img2: Image.Image) -> float:
+@timed('person')
+def _person_signals(rgb: np.ndarray) -> PersonSignals:
+    # One pass for the selfie check on a bounded frame: a single YCrCb conversion
+    # gives the skin mask (Cr/Cb) and the luma plane the face detector needs.
+    if not OPENCV_OK:
+        return PersonSignals(0.0, 0.0)
+    h, w = rgb.shape[:2]
+    scale = FACE_DETECT_MAX_SIDE / float(max(h, w))
+    if scale < 1.0:
+        w, h = max(1, round(w * scale)), max(1, round(h * scale))
+        rgb = cv2.resize(rgb, (w, h), interpolation=cv2.INTER_AREA)
+    ycrcb = cv2.cvtColor(rgb, cv2.COLOR_RGB2YCrCb)
+    cr, cb = ycrcb[..., 1], ycrcb[..., 2]
+    # Very coarse skin detection; helps detect selfies
+    skin = float(((cr > 135) & (cr < 180) & (cb > 85) & (cb < 135)).mean())
+    try:
+        faces = ensure_models_loaded().face_detector.detect(rgb, np.ascontiguousarray(ycrcb[..., 0]))
+    except Exception as e:
+        logger.debug(f"face detection failed: {e}")
+        faces = []
+    area = max((fw * fh for _x, _y, fw, fh in faces), default=0)
+    return PersonSignals(float(area / max(1, w * h)), skin)
+
+
+@timed('orb')
+def _orb_detect(img: Image.Image) -> Tuple[list, Optional[np.ndarray]]:
+    if not OPENCV_OK:
+        return [], None
+    return cv2.ORB_create().detectAndCompute(np.array(img.convert('RGB')), None)
+
+
+def orb_features(img: ImageLike) -> Tuple[list, Optional[np.ndarray]]:
+    """ORB keypoints and descriptors of the decoded image; computed once per bundle."""
+    return img.orb_features if isinstance(img, ImageBundle) else _orb_detect(img)
+
+
+@timed('orb_match')
+def orb_match_ratio(img1: ImageLike, img2: ImageLike) -> float:
     if not OPENCV_OK:
         return 0.0
-    a = np.array(img1.convert('RGB'))
-    b = np.array(img2.convert('RGB'))
-    orb = cv2.ORB_create()
-    kp1, des1 = orb.detectAndCompute(a, None)
-    kp2, des2 = orb.detectAndCompute(b, None)
+    _kp1, des1 = orb_features(img1)
+    _kp2, des2 = orb_features(img2)
     if des1 is None or des2 is None:
         return 0.0
     bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
@@ -324,10 +824,10 @@ def orb_match_ratio(img1: Image.Image, img2: Image.Image) -> float:
     return float(len(good) / max(1, len(matches)))
 
 
-def exif_time_consistent(imgs: List[Image.Image], tolerance_minutes: int = 10) -> bool:
+def exif_time_consistent(imgs: List[ImageLike], tolerance_minutes: int = 10) -> bool:
     times = []
     for im in imgs:
-        exif = im.getexif()
+        exif = source_image(im).getexif()
         ts = None
         for k, v in (exif or {}).items():
             s = str(v)
@@ -342,3 +842,51 @@ def exif_time_consistent(imgs: List[Image.Image], tolerance_minutes: int = 10) -
     # Very rough consistency: all timestamps equal or within tolerance is non-trivial here without parsing.
     # We accept equality as the simple heuristic.
     return len(set(times)) <= 2
+
+
+# Synthetic passes per process before it is reported ready; the first forward
+# passes pay for lazy allocator, kernel and thread-pool setup
+MODEL_WARMUP_ROUNDS = int(os.getenv('MODEL_WARMUP_ROUNDS', '2'))
+_WARMUP_REPORT: Optional[dict] = None
+_WARMUP_LOCK = threading.Lock()
+
+
+def warm_up(rounds: Optional[int] = None) -> dict:
+    """Load the models and run every model-backed check on synthetic images.
+
+    Idempotent per process. Returns the load phase timings and warm-up time
+    (ms) so startup cost can be reported.
+    """
+    global _WARMUP_REPORT
+    if _WARMUP_REPORT is not None:
+        return _WARMUP_REPORT
+    with _WARMUP_LOCK:
+        if _WARMUP_REPORT is not None:
+            return _WARMUP_REPORT
+        rounds = MODEL_WARMUP_ROUNDS if rounds is None else rounds
+        start = time.perf_counter()
+        m = ensure_models_loaded()
+        loaded = time.perf_counter()
+        # Noise keeps every check on its full path (no early exits on blank input)
+        arr = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        for _ in range(max(0, rounds)):
+            img = ImageBundle(Image.fromarray(arr))
+            clip_tree_stats(img)
+            encode_feature_vector(img)
+            blur_score_fft(img)
+            img.person  # face detector and skin mask
+            m.vegetation_ratio(img)
+            compute_phash(img)
+        done = time.perf_counter()
+        _WARMUP_REPORT = {
+            "pid": os.getpid(),
+            "source": m.source,
+            "backend": m.backend,
+            "load_ms": (loaded - start) * 1000.0,
+            "phases_ms": dict(m.timings),
+            "warmup_ms": (done - loaded) * 1000.0,
+            "warmup_rounds": rounds,
+        }
+        logger.info(f"Models warm in {(done - start) * 1000.0:.0f}ms "
+                    f"(load {(loaded - start) * 1000.0:.0f}ms, {rounds} warm-up rounds {(done - loaded) * 1000.0:.0f}ms)")
+        return _WARMUP_REPORT
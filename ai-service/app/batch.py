@@ -0,0 +1,100 @@
+"""Planning for `/verify-batch`: item validation, geo-cell grouping and chunking.
+
+Items are grouped by a square grid cell of `cell_m` metres so every item in a
+cell can share one geofence query (centre of the cell, radius widened by the
+cell size) and filter it locally. Within the plan, items are ordered by cell
+and then by input position, and split into chunks for batched inference.
+"""
+from __future__ import annotations
+import math
+import os
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Any, List, Optional, Tuple
+
+M_PER_DEG_LAT = 111_320.0
+
+Cell = Tuple[int, int]
+
+
+@dataclass
+class BatchItem:
+    index: int          # position in the request
+    ref: Any            # client-supplied id, echoed back
+    lat: float
+    lon: float
+    image: Optional[int] = None  # index into the uploaded files
+    path: Optional[str] = None   # file under the manifest root
+    cell: Cell = (0, 0)
+
+
+def geo_cell(lat: float, lon: float, cell_m: float) -> Cell:
+    dlat = cell_m / M_PER_DEG_LAT
+    row = math.floor(lat / dlat)
+    # Column width uses the row's centre latitude so cells stay roughly square
+    lat_c = (row + 0.5) * dlat
+    dlon = cell_m / (M_PER_DEG_LAT * max(math.cos(math.radians(lat_c)), 1e-6))
+    return row, math.floor(lon / dlon)
+
+
+def cell_center(cell: Cell, cell_m: float) -> Tuple[float, float]:
+    row, col = cell
+    dlat = cell_m / M_PER_DEG_LAT
+    lat_c = (row + 0.5) * dlat
+    dlon = cell_m / (M_PER_DEG_LAT * max(math.cos(math.radians(lat_c)), 1e-6))
+    return lat_c, (col + 0.5) * dlon
+
+
+def cell_query_radius(cell_m: float, radius_m: float) -> float:
+    """Radius around a cell centre that covers `radius_m` around any point in the cell."""
+    return radius_m + cell_m * math.sqrt(2) / 2 + 1.0
+
+
+def parse_items(raw: Any, n_files: int, max_items: int) -> List[BatchItem]:
+    """Validate the `items` manifest; raises ValueError with a client-facing message."""
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("items must be a non-empty JSON list")
+    if len(raw) > max_items:
+        raise ValueError(f"at most {max_items} items per batch")
+    items = []
+    for i, it in enumerate(raw):
+        if not isinstance(it, dict):
+            raise ValueError(f"item {i}: expected an object")
+        try:
+            lat, lon = float(it['lat']), float(it['lon'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"item {i}: numeric lat and lon are required")
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+            raise ValueError(f"item {i}: lat/lon out of range")
+        path = it.get('path')
+        image = None
+        if path is None:
+            image = it.get('image', i)
+            if isinstance(image, bool) or not isinstance(image, int) or not 0 <= image < n_files:
+                raise ValueError(f"item {i}: image index {image!r} does not match an uploaded file")
+        elif not isinstance(path, str) or not path:
+            raise ValueError(f"item {i}: path must be a non-empty string")
+        items.append(BatchItem(index=i, ref=it.get('id'), lat=lat, lon=lon, image=image, path=path))
+    return items
+
+
+def resolve_path(root: str, path: str) -> str:
+    """Absolute path of `path` under `root`; refuses anything escaping it."""
+    base = os.path.realpath(root)
+    full = os.path.realpath(os.path.join(base, path))
+    if os.path.commonpath([base, full]) != base:
+        raise ValueError("path escapes the manifest root")
+    return full
+
+
+def plan_chunks(items: List[BatchItem], cell_m: float, chunk_size: int) -> List[List[BatchItem]]:
+    """Items ordered by geo cell, split into chunks that never span two cells."""
+    for it in items:
+        it.cell = geo_cell(it.lat, it.lon, cell_m)
+    ordered = sorted(items, key=lambda it: (it.cell, it.index))
+    chunks = []
+    for _cell, group in groupby(ordered, key=lambda it: it.cell):
+        group = list(group)
+        for i in range(0, len(group), max(1, chunk_size)):
+            chunks.append(group[i:i + chunk_size])
+    return chunks
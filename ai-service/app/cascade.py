@@ -0,0 +1,66 @@
+"""Declarative early-exit cascade of image checks.
+
+A check is a list of stages. Each stage has a rough cost, measures one or
+more signals and names the reasons its signals fail the thresholds. Stages
+run cheapest first and the first failing stage ends the run, so a rejected
+upload only pays for the stages up to the one rejecting it. With `explain`
+every stage runs and every failing reason is reported, along with per-stage
+timings, for diagnostics.
+
+Signals measured earlier (e.g. by a screening run on another worker) can be
+passed back in as `known`; stages whose signals are all known are not
+measured again.
+"""
+from __future__ import annotations
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+Signals = Dict[str, Any]
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    cost_ms: float  # rough cost on a working-size image; sets the order
+    signals: Tuple[str, ...]  # keys `measure` returns
+    measure: Callable[[Any], Signals]
+    rejects: Callable[[Signals, Any], List[str]]  # (signals, thresholds) -> failure reasons
+
+
+class Cascade:
+    def __init__(self, stages: Sequence[Stage]):
+        # Stable sort: declaration order breaks cost ties
+        self.stages: List[Stage] = sorted(stages, key=lambda s: s.cost_ms)
+
+    def run(self, subject: Any, thresholds: Any, explain: bool = False, known: Optional[Signals] = None,
+            max_cost_ms: Optional[float] = None) -> Tuple[List[str], Signals]:
+        """(failure reasons, diagnostics) of `subject`; no reasons means it passed.
+
+        Diagnostics hold every measured signal, `reasons`, the first one as
+        `reason` and the stages not run as `skipped`. `max_cost_ms` runs only
+        the stages costing at most that (a screen), leaving the rest skipped.
+        With `explain`, `stages` lists each stage run with its time and reasons.
+        """
+        info: Signals = dict(known or {})
+        reasons: List[str] = []
+        skipped: List[str] = []
+        timings = []
+        for st in self.stages:
+            if (reasons and not explain) or (max_cost_ms is not None and st.cost_ms > max_cost_ms):
+                skipped.append(st.name)
+                continue
+            start = time.perf_counter()
+            if not all(k in info for k in st.signals):
+                info.update(st.measure(subject))
+            failed = st.rejects(info, thresholds)
+            reasons.extend(r for r in failed if r not in reasons)
+            if explain:
+                timings.append({"stage": st.name, "cost_ms": st.cost_ms,
+                                "ms": round((time.perf_counter() - start) * 1000.0, 2), "reasons": failed})
+        info["reasons"] = reasons
+        info["reason"] = reasons[0] if reasons else None
+        info["skipped"] = skipped
+        if explain:
+            info["stages"] = timings
+        return reasons, info
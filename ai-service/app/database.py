@@ -1,12 +1,114 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from loguru import logger
 import os
 import math
+import struct
+import threading
+import time
+
+import numpy as np
+from bson import Binary, ObjectId
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
+from .metrics import timed
+from .vector_index import haversine_m
+
+# Compact embedding storage in `vector_bin`: BSON Binary holding an 8-byte header
+# (b'MV', format version u8, dtype code u8, dim u32 LE) followed by `dim` little-endian
+# floats of an L2-normalised vector. Legacy documents keep a `vector` list of doubles.
+VECTOR_FORMAT_VERSION = 1
+VECTOR_HEADER = struct.Struct('<2sBBI')
+VECTOR_DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+VECTOR_DTYPE_CODES = {'float32': 1, 'float16': 2}
+VECTOR_STORE_DTYPE = os.getenv('VECTOR_STORE_DTYPE', 'float16')
+VECTOR_FIELDS = {'vector_bin': 1, 'vector': 1, 'model_version': 1}
+# Embedding model of trees stored before documents were stamped with `model_version`
+UNSTAMPED_MODEL_VERSION = 'efficientnet_b0'
+# Trees the global indexes hold: rejected ones no longer count as registered
+INDEXED_FILTER = {'status': {'$ne': 'REJECTED'}}
+
+# Connection pool and timeouts: an unreachable or slow Mongo fails a query within
+# seconds instead of holding an I/O thread for the driver's 30 s defaults
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '16'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '2000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '2000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '5000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '1000'))
+# Consecutive failed queries after which the circuit opens and queries are
+# refused until a background probe reaches Mongo again, or the cooldown
+# passes and it goes half-open: queries are let through, the next failure
+# opens it again and the next success closes it (0: probe only)
+MONGO_BREAKER_FAILURES = int(os.getenv('MONGO_BREAKER_FAILURES', '3'))
+MONGO_BREAKER_COOLDOWN_SECONDS = float(os.getenv('MONGO_BREAKER_COOLDOWN_SECONDS', '30'))
+
+
+def encode_vector(vec: Any, dtype: Optional[str] = None) -> Binary:
+    """L2-normalise `vec` and pack it into the versioned binary format."""
+    code = VECTOR_DTYPE_CODES[dtype or VECTOR_STORE_DTYPE]
+    arr = np.asarray(vec, dtype=np.float32).reshape(-1)
+    arr = arr / max(float(np.linalg.norm(arr)), 1e-12)
+    header = VECTOR_HEADER.pack(b'MV', VECTOR_FORMAT_VERSION, code, arr.shape[0])
+    return Binary(header + arr.astype(VECTOR_DTYPES[code]).tobytes())
+
+
+def _vector_view(value: Any) -> Optional[np.ndarray]:
+    # Zero-copy view over a stored blob, or a float32 array for a legacy list
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        magic, version, code, dim = VECTOR_HEADER.unpack_from(value)
+        if magic != b'MV' or version != VECTOR_FORMAT_VERSION or code not in VECTOR_DTYPES:
+            return None
+        return np.frombuffer(value, dtype=VECTOR_DTYPES[code], count=dim, offset=VECTOR_HEADER.size)
+    if len(value) == 0:
+        return None
+    return np.asarray(value, dtype=np.float32)
+
+
+def decode_vectors(values: List[Any]) -> Tuple[np.ndarray, List[int]]:
+    """Decode stored vectors straight into one contiguous, L2-normalised float32 matrix.
+
+    Returns the matrix and the positions in `values` its rows came from; entries
+    that are missing, unreadable or of a different dimension than the first
+    decoded one are skipped.
+    """
+    views, rows = [], []
+    for i, value in enumerate(values):
+        view = _vector_view(value)
+        if view is None or (views and view.shape[0] != views[0].shape[0]):
+            continue
+        views.append(view)
+        rows.append(i)
+    if not views:
+        return np.empty((0, 0), dtype=np.float32), []
+    mat = np.empty((len(views), views[0].shape[0]), dtype=np.float32)
+    for r, view in enumerate(views):
+        mat[r] = view
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    mat /= np.maximum(norms, 1e-12)
+    return mat, rows
+
+
+def _stored_vector(d: dict, model_version: Optional[str] = None) -> Any:
+    # With `model_version`, vectors from another embedding model count as missing
+    if model_version is not None and (d.get('model_version') or UNSTAMPED_MODEL_VERSION) != model_version:
+        return None
+    return d.get('vector_bin') if d.get('vector_bin') is not None else d.get('vector')
+
+
+def _model_filter(model_version: Optional[str]) -> Dict[str, Any]:
+    # Query form of the check in _stored_vector
+    if model_version is None:
+        return {}
+    if model_version == UNSTAMPED_MODEL_VERSION:
+        return {'model_version': {'$in': [model_version, None]}}
+    return {'model_version': model_version}
 
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import PyMongoError
 
 @dataclass
 class TreeRecord:
@@ -14,43 +116,231 @@ class TreeRecord:
     lat: float
     lon: float
     phash: Optional[str]
-    vector: Optional[list]  # stored as list[float]
+    vector: Optional[np.ndarray]  # L2-normalised float32 (row view into a shared matrix)
+    updated_at: Optional[datetime] = None
+
+
+@dataclass
+class NearbyTrees:
+    """Result of a geofence query; vectors are decoded once into one matrix."""
+    records: List[TreeRecord] = field(default_factory=list)
+    vectors: Optional[np.ndarray] = None  # (M, D), rows match `vector_ids`
+    vector_ids: List[Any] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def within(self, lat: float, lon: float, radius_m: float) -> 'NearbyTrees':
+        """The subset within `radius_m` of (lat, lon), nearest first."""
+        if not self.records:
+            return NearbyTrees()
+        dists = haversine_m(lat, lon, np.asarray([r.lat for r in self.records]),
+                            np.asarray([r.lon for r in self.records]))
+        keep = [int(i) for i in np.argsort(dists, kind='stable') if dists[i] <= radius_m]
+        out = NearbyTrees(records=[self.records[i] for i in keep])
+        if self.vectors is not None:
+            # Matrix rows follow the records that have a vector, in order
+            with_vec = [i for i, rec in enumerate(self.records) if rec.vector is not None]
+            row_of = {i: r for r, i in enumerate(with_vec)}
+            kept = [i for i in keep if i in row_of]
+            out.vectors = self.vectors[[row_of[i] for i in kept]]
+            out.vector_ids = [self.records[i].id for i in kept]
+        return out
+
+
+class RepoUnavailable(Exception):
+    """Mongo could not answer a query; callers must not read this as "no trees"."""
+
+
+class ChangeStreamUnsupported(RepoUnavailable):
+    """The deployment has no change streams (a standalone server, not a replica set)."""
+
+
+def _to_record(d: dict, model_version: Optional[str] = None) -> Optional[TreeRecord]:
+    # A single document, e.g. from a change stream; the vector is decoded and normalised
+    coord = d.get('location', {}).get('coordinates', [None, None])
+    if coord[0] is None:
+        return None
+    mat, rows = decode_vectors([_stored_vector(d, model_version)])
+    return TreeRecord(id=d.get('_id'), lat=float(coord[1]), lon=float(coord[0]), phash=d.get('phash'),
+                      vector=mat[0] if rows else None, updated_at=d.get('updatedAt'))
+
+
+class CircuitBreaker:
+    """Counts consecutive Mongo failures; open after `threshold` of them until a success.
+
+    Open for `cooldown_s` after the last failure, then half-open: queries go
+    through again and the first failure re-opens it at once.
+    """
+
+    def __init__(self, threshold: int = MONGO_BREAKER_FAILURES, cooldown_s: float = MONGO_BREAKER_COOLDOWN_SECONDS):
+        self.threshold = max(1, threshold)
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.errors = 0  # total, for metrics
+        self.trips = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.cooldown_s > 0 and time.time() >= self._retry_at else "open"
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Mongo reachable again after {time.time() - self.opened_at:.1f}s; circuit closed")
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self, error: Exception, trip: bool = False) -> None:
+        """Count a failure; `trip` opens the circuit at once (e.g. a failed health probe)."""
+        with self._lock:
+            self.failures += 1
+            self.errors += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if self.opened_at is None and (trip or self.failures >= self.threshold):
+                self.opened_at = time.time()
+                self.trips += 1
+                logger.error(f"Mongo unavailable ({self.last_error}); circuit open, dedupe degraded until it recovers")
+            elif self.opened_at is not None and self.state == "half_open":
+                logger.warning(f"Mongo still unavailable ({self.last_error}); circuit open again")
+            if self.opened_at is not None:
+                self._retry_at = time.time() + self.cooldown_s
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "errors": self.errors,
+            "trips": self.trips,
+            "open_seconds": round(time.time() - self.opened_at, 1) if self.opened_at is not None else None,
+            "last_error": self.last_error
+        }
 
 
 class MongoRepo:
-    def __init__(self):
+    def __init__(self, model_version: Optional[str] = None):
         self.uri = os.getenv('MONGO_URI')
+        # Embedding model whose vectors queries return; trees embedded by any
+        # other are treated as having no vector (None: every vector)
+        self.model_version = model_version
         self.db_name = os.getenv('MONGO_DB', 'miko')
         self.coll_name = os.getenv('MONGO_COLLECTION', 'trees')
+        self.submissions_name = os.getenv('MONGO_SUBMISSIONS_COLLECTION', 'treesubmissions')
         self.client: Optional[MongoClient] = None
         self.db = None
         self.coll = None
+        self.submissions = None
+        self.breaker = CircuitBreaker()
+        self.indexes_ready = False
 
     def connect(self):
+        """Create the client. It connects in the background, so this never blocks on Mongo;
+        `probe()` checks reachability and creates the indexes."""
         if not self.uri:
             logger.warning("MONGO_URI not set; running in degraded mode (no dedupe)")
             return
         try:
-            self.client = MongoClient(self.uri)
+            self.client = MongoClient(
+                self.uri,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS
+            )
             self.db = self.client[self.db_name]
             self.coll = self.db[self.coll_name]
-            # Ensure geospatial index exists
-            self.coll.create_index([('location', '2dsphere')])
-            # Optional: index for phash
-            self.coll.create_index([('phash', ASCENDING)])
-            logger.info("Connected to Mongo and ensured indices")
+            self.submissions = self.db[self.submissions_name]
         except PyMongoError as e:
-            logger.error(f"Mongo connection failed: {e}")
+            # Malformed URI or options; retrying will not help
+            logger.error(f"Mongo client setup failed: {e}")
             self.client = None
             self.db = None
             self.coll = None
+            self.submissions = None
 
-    def is_connected(self) -> bool:
+    def close(self) -> None:
+        if self.client is not None:
+            self.client.close()
+
+    def is_configured(self) -> bool:
         return self.coll is not None
 
-    def find_nearby(self, lat: float, lon: float, radius_m: float) -> List[TreeRecord]:
-        if not self.is_connected():
-            return []
+    def is_connected(self) -> bool:
+        """Configured and not known to be down (circuit closed)."""
+        return self.coll is not None and not self.breaker.is_open
+
+    def probe(self) -> bool:
+        """Ping Mongo, closing or opening the circuit, and create the indexes once reachable."""
+        if self.coll is None:
+            return False
+        try:
+            self.client.admin.command('ping')
+        except PyMongoError as e:
+            self.breaker.record_failure(e, trip=True)
+            return False
+        self.breaker.record_success()
+        if not self.indexes_ready:
+            self.ensure_indexes()
+        return True
+
+    def ensure_indexes(self) -> None:
+        try:
+            # Geospatial index for the geofence query
+            self.coll.create_index([('location', '2dsphere')])
+            # Optional: index for phash
+            self.coll.create_index([('phash', ASCENDING)])
+            # Trees registered by this service, unique per upload
+            self.coll.create_index([('content_hash', ASCENDING)], unique=True, sparse=True)
+            # Registrations of submissions find their tree by it
+            self.coll.create_index([('submissionId', ASCENDING)], sparse=True)
+        except PyMongoError as e:
+            logger.error(f"Mongo index creation failed (will retry): {e}")
+            return
+        self.indexes_ready = True
+        logger.info("Connected to Mongo and ensured indices")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.is_configured(),
+            "connected": self.is_connected(),
+            "indexes_ready": self.indexes_ready,
+            "circuit": self.breaker.stats()
+        }
+
+    def _check_available(self) -> None:
+        if self.coll is None:
+            raise RepoUnavailable("MONGO_URI not set")
+        if self.breaker.is_open:
+            raise RepoUnavailable(f"circuit open: {self.breaker.last_error}")
+
+    def _failed(self, what: str, error: PyMongoError) -> RepoUnavailable:
+        self.breaker.record_failure(error)
+        logger.error(f"Mongo {what} failed: {error}")
+        return RepoUnavailable(f"{what} failed: {error}")
+
+    @timed('find_nearby')
+    def find_nearby(self, lat: float, lon: float, radius_m: float, with_vectors: bool = True,
+                    limit: int = 100) -> NearbyTrees:
+        """Trees within `radius_m`, nearest first; raises RepoUnavailable when Mongo cannot answer."""
+        self._check_available()
+        projection = {'_id': 1, 'location': 1, 'phash': 1}
+        if with_vectors:
+            projection.update(VECTOR_FIELDS)
         try:
             docs = list(self.coll.find({
                 'location': {
@@ -59,18 +349,228 @@ class MongoRepo:
                         '$maxDistance': radius_m
                     }
                 }
-            }, projection={'_id': 1, 'location': 1, 'phash': 1, 'vector': 1}).limit(100))
-            out: List[TreeRecord] = []
+            }, projection=projection).limit(limit))
+            out = NearbyTrees()
             for d in docs:
                 coord = d.get('location', {}).get('coordinates', [None, None])
-                out.append(TreeRecord(
+                out.records.append(TreeRecord(
                     id=d.get('_id'),
                     lat=float(coord[1]),
                     lon=float(coord[0]),
                     phash=d.get('phash'),
-                    vector=d.get('vector')
+                    vector=None
                 ))
+            if with_vectors:
+                mat, rows = decode_vectors([_stored_vector(d, self.model_version) for d in docs])
+                out.vectors = mat
+                out.vector_ids = [out.records[i].id for i in rows]
+                for r, i in enumerate(rows):
+                    out.records[i].vector = mat[r]
+            self.breaker.record_success()
             return out
         except PyMongoError as e:
-            logger.error(f"Mongo query failed: {e}")
-            return []
+            raise self._failed("geofence query", e) from e
+
+    @timed('find_vectors')
+    def find_vectors(self, ids: List[Any]) -> Dict[Any, np.ndarray]:
+        """Fetch stored vectors for specific tree ids (missing or vector-less ids are omitted)."""
+        if not ids:
+            return {}
+        self._check_available()
+        try:
+            docs = list(self.coll.find({'_id': {'$in': list(ids)}}, projection={'_id': 1, **VECTOR_FIELDS}))
+        except PyMongoError as e:
+            raise self._failed("vector lookup", e) from e
+        self.breaker.record_success()
+        mat, rows = decode_vectors([_stored_vector(d, self.model_version) for d in docs])
+        return {docs[i]['_id']: mat[r] for r, i in enumerate(rows)}
+
+    def find_registered(self, content_hashes: List[str]) -> Dict[str, Any]:
+        """Ids of trees already registered for the given upload content hashes."""
+        if not content_hashes:
+            return {}
+        self._check_available()
+        try:
+            docs = list(self.coll.find({'content_hash': {'$in': list(content_hashes)}},
+                                       projection={'_id': 1, 'content_hash': 1}))
+        except PyMongoError as e:
+            raise self._failed("content hash lookup", e) from e
+        self.breaker.record_success()
+        return {d['content_hash']: d['_id'] for d in docs}
+
+    @timed('register_flush')
+    def register_trees(self, trees: List[Tuple[str, TreeRecord, Optional[str], bool]]
+                       ) -> Tuple[Dict[str, Any], List[str], List[str]]:
+        """Stamp (content hash, record, embedding model, is a submission) onto existing trees in one unordered bulk write.
+
+        The trees are the backend's: only `content_hash` and, with a vector,
+        `vector_bin` and `model_version` are set (plus `updatedAt`, so index
+        syncs see them); nothing is created or removed, so a retried flush
+        sets the same fields again. A record is matched by `_id`, or for a
+        submission by the `submissionId` of the tree created at approval.
+        Returns ({content hash: stored id} for hashes already registered under
+        another id, content hashes whose tree does not exist, content hashes
+        of submissions still under review, which have no tree yet); none of
+        them is written.
+        """
+        if not trees:
+            return {}, [], []
+        self._check_available()
+        now = datetime.now(timezone.utc)
+        ops = []
+        for content_hash, rec, model_version, submission in trees:
+            fields: Dict[str, Any] = {'content_hash': content_hash, 'updatedAt': now}
+            if rec.vector is not None:
+                fields['vector_bin'] = encode_vector(rec.vector)
+                fields['model_version'] = model_version
+            ops.append(UpdateOne({'submissionId' if submission else '_id': rec.id}, {'$set': fields}))
+        duplicates: List[str] = []
+        try:
+            matched = self.coll.bulk_write(ops, ordered=False).matched_count
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if any(err.get('code') != 11000 for err in errors):
+                raise self._failed("tree registration", e) from e
+            # Duplicate key: the content hash is stored under another id
+            duplicates = [trees[err['index']][0] for err in errors]
+            matched = e.details.get('nMatched', 0)
+        except PyMongoError as e:
+            raise self._failed("tree registration", e) from e
+        self.breaker.record_success()
+        missing: List[str] = []
+        unreviewed: List[str] = []
+        if matched + len(duplicates) < len(trees):
+            dup = set(duplicates)
+            todo = [(content_hash, rec.id, submission) for content_hash, rec, _, submission in trees
+                    if content_hash not in dup]
+            tree_ids = [i for _, i, submission in todo if not submission]
+            submission_ids = [i for _, i, submission in todo if submission]
+            found, waiting = set(), set()
+            try:
+                if tree_ids:
+                    found |= {d['_id'] for d in self.coll.find({'_id': {'$in': tree_ids}}, projection={'_id': 1})}
+                if submission_ids:
+                    found |= {d['submissionId'] for d in self.coll.find({'submissionId': {'$in': submission_ids}},
+                                                                        projection={'submissionId': 1})}
+                    # An approved one gets its tree in a moment
+                    waiting = {d['_id'] for d in self.submissions.find(
+                        {'_id': {'$in': [i for i in submission_ids if i not in found]},
+                         'status': {'$in': ['PENDING', 'APPROVED']}}, projection={'_id': 1})}
+            except PyMongoError as e:
+                raise self._failed("tree registration", e) from e
+            unreviewed = [content_hash for content_hash, i, _ in todo if i in waiting]
+            missing = [content_hash for content_hash, i, _ in todo if i not in found and i not in waiting]
+        return self.find_registered(duplicates), missing, unreviewed
+
+    def watch_changes(self, max_await_ms: int = 1000) -> Iterator[Tuple[Optional[str], Any, Optional[TreeRecord]]]:
+        """Follow the collection's change stream as (operation, tree id, record) tuples.
+
+        `operation` is insert, update, replace or delete; the record (with its
+        decoded vector, if any) is None for deletes and for trees deleted since.
+        While nothing changes, (None, None, None) is yielded every `max_await_ms`
+        so the caller can stop. The first tuple comes once the stream is open:
+        every later change is seen. Raises RepoUnavailable when the stream
+        breaks and ChangeStreamUnsupported on a standalone server.
+        """
+        self._check_available()
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        try:
+            with self.coll.watch(pipeline, full_document='updateLookup', max_await_time_ms=max_await_ms) as stream:
+                yield None, None, None
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is None:
+                        yield None, None, None
+                        continue
+                    doc = change.get('fullDocument')
+                    yield (change['operationType'], change['documentKey']['_id'],
+                           _to_record(doc, self.model_version) if doc else None)
+        except OperationFailure as e:
+            if e.code == 40573:  # "$changeStream stage is only supported on replica sets"
+                raise ChangeStreamUnsupported(str(e)) from e
+            raise RepoUnavailable(f"change stream failed: {e}") from e
+        except PyMongoError as e:
+            raise RepoUnavailable(f"change stream failed: {e}") from e
+
+    def iter_embeddings(self, since_id: Optional[str] = None, since_ts: Optional[datetime] = None,
+                        batch_size: int = 1000) -> Iterator[TreeRecord]:
+        """Stream trees that have a vector (from `model_version`, when set), optionally only those newer than a watermark."""
+        return self._iter_trees('vector', since_id, since_ts, batch_size)
+
+    def iter_phashes(self, since_id: Optional[str] = None, since_ts: Optional[datetime] = None,
+                     batch_size: int = 5000) -> Iterator[TreeRecord]:
+        """Stream trees that have a pHash, optionally only those newer than a watermark."""
+        return self._iter_trees('phash', since_id, since_ts, batch_size)
+
+    def tree_ids(self, field: str, among: Optional[Iterable[Any]] = None, batch_size: int = 5000) -> Set[str]:
+        """Ids, as strings, of the trees the 'phash' or 'vector' scan streams: all of them, or those in `among`."""
+        self._check_available()
+        has_field = self._indexed_filter(field)
+        try:
+            if among is None:
+                cursor = self.coll.find(has_field, projection={'_id': 1}).batch_size(batch_size)
+                out = {str(d['_id']) for d in cursor}
+            else:
+                ids = [ObjectId(i) if ObjectId.is_valid(i) else i for i in map(str, among)]
+                out = set()
+                for start in range(0, len(ids), batch_size):
+                    query = {'$and': [has_field, {'_id': {'$in': ids[start:start + batch_size]}}]}
+                    out.update(str(d['_id']) for d in self.coll.find(query, projection={'_id': 1}))
+        except PyMongoError as e:
+            raise self._failed(f"{field} id scan", e) from e
+        self.breaker.record_success()
+        return out
+
+    def _indexed_filter(self, field: str) -> Dict[str, Any]:
+        if field == 'vector':
+            return {'$or': [{'vector_bin': {'$ne': None}}, {'vector': {'$ne': None}}],
+                    **_model_filter(self.model_version), **INDEXED_FILTER}
+        return {field: {'$ne': None}, **INDEXED_FILTER}
+
+    def _iter_trees(self, field: str, since_id: Optional[str], since_ts: Optional[datetime],
+                    batch_size: int) -> Iterator[TreeRecord]:
+        # A document is included when its `_id` is past `since_id` or its `updatedAt`
+        # is past `since_ts`, which covers both inserts and re-computed artifacts.
+        # Errors propagate (as RepoUnavailable) so callers can retry instead of
+        # treating them as "no data".
+        self._check_available()
+        has_field = self._indexed_filter(field)
+        if field == 'vector':
+            projection = {'_id': 1, 'location': 1, 'updatedAt': 1, **VECTOR_FIELDS}
+        else:
+            projection = {'_id': 1, 'location': 1, 'updatedAt': 1, field: 1}
+        query: Dict[str, Any] = has_field
+        newer = []
+        if since_id and ObjectId.is_valid(since_id):
+            newer.append({'_id': {'$gt': ObjectId(since_id)}})
+        if since_ts is not None:
+            newer.append({'updatedAt': {'$gt': since_ts}})
+        if newer:
+            query = {'$and': [has_field, {'$or': newer}]}
+        try:
+            yield from self._records(self.coll.find(query, projection=projection).batch_size(batch_size), field)
+        except PyMongoError as e:
+            raise self._failed(f"{field} scan", e) from e
+        self.breaker.record_success()
+
+    @staticmethod
+    def _records(cursor, field: str) -> Iterator[TreeRecord]:
+        for d in cursor:
+            coord = d.get('location', {}).get('coordinates', [None, None])
+            if coord[0] is None:
+                continue
+            vector = None
+            if field == 'vector':
+                vector = _vector_view(_stored_vector(d))
+                if vector is None:
+                    continue
+            elif not d.get(field):
+                continue
+            yield TreeRecord(
+                id=d.get('_id'),
+                lat=float(coord[1]),
+                lon=float(coord[0]),
+                phash=d.get('phash'),
+                vector=vector,
+                updated_at=d.get('updatedAt')
+            )
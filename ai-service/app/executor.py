@@ -0,0 +1,155 @@
+from __future__ import annotations
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Optional
+
+from loguru import logger
+
+from . import metrics
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (its affinity mask, e.g. a container's cpuset), not the host's count."""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request is shed because too many are already waiting."""
+
+
+def _init_process_worker(torch_threads: int) -> None:
+    # Runs once per worker process: split cores between workers and load + warm models.
+    # Each worker serves one task at a time, so cross-request batching is off here.
+    import torch
+    from . import ai_checks
+    torch.set_num_threads(max(1, torch_threads))
+    ai_checks.configure_batching(1, 0)
+    ai_checks.warm_up()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class ExecutionBackend:
+    """Runs blocking work off the event loop.
+
+    CPU-bound verification goes to `cpu_pool` - threads by default (torch and
+    OpenCV release the GIL) or processes, each holding its own preloaded models.
+    Blocking I/O (pymongo) goes to a separate small thread pool so it never
+    waits behind inference.
+
+    Admission: at most `pool_size + queue_depth` CPU tasks are handed to the pool
+    at once; further callers wait on the event loop, and once more than
+    `shed_threshold` are waiting new requests fail fast with `Overloaded`.
+    """
+
+    def __init__(self, mode: str = 'thread', pool_size: Optional[int] = None, queue_depth: Optional[int] = None,
+                 shed_threshold: int = 32, io_workers: int = 8):
+        self.mode = mode
+        self.pool_size = pool_size or available_cpus()
+        self.queue_depth = self.pool_size * 2 if queue_depth is None else queue_depth
+        self.shed_threshold = shed_threshold
+        self.io_workers = io_workers
+        self.cpu_pool: Optional[Executor] = None
+        self.io_pool: Optional[ThreadPoolExecutor] = None
+        self._admission: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.shed = 0
+
+    def start(self) -> None:
+        if self.cpu_pool is not None:
+            return
+        if self.mode == 'process':
+            torch_threads = max(1, available_cpus() // self.pool_size)
+            self.cpu_pool = ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_process_worker,
+                initargs=(torch_threads,),
+            )
+            # Start every worker now so model loading happens before traffic arrives
+            for _ in range(self.pool_size):
+                self.cpu_pool.submit(_ping)
+        elif self.mode == 'thread':
+            self.cpu_pool = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='verify')
+        else:
+            raise ValueError(f"unknown execution mode: {self.mode!r} (expected 'thread' or 'process')")
+        self.io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix='db')
+        logger.info(f"Execution backend: {self.mode} pool x{self.pool_size}, queue depth {self.queue_depth}, "
+                    f"shed above {self.shed_threshold} waiting")
+
+    def shutdown(self) -> None:
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown(wait=True, cancel_futures=True)
+            self.cpu_pool = None
+        if self.io_pool is not None:
+            self.io_pool.shutdown(wait=True)
+            self.io_pool = None
+
+    async def run_cpu(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run `fn(*args)` on the CPU pool; `fn` and args must pickle in process mode."""
+        self.start()
+        if self._admission is None:
+            self._admission = asyncio.Semaphore(self.pool_size + self.queue_depth)
+        if self._admission.locked() and self.waiting >= self.shed_threshold:
+            self.shed += 1
+            raise Overloaded(f"{self.waiting} requests already waiting for a worker")
+        self.waiting += 1
+        try:
+            await self._admission.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            submitted = time.perf_counter()
+            result, timings, busy = await loop.run_in_executor(self.cpu_pool, partial(metrics.collect, fn, *args))
+            # Time between submission and the worker running fn: pool queueing and pickling
+            timings['worker_queue'] = max(0.0, time.perf_counter() - submitted - busy)
+            metrics.record(timings)
+            return result
+        finally:
+            self.in_flight -= 1
+            self._admission.release()
+
+    async def warm_up(self, fn: Callable[[], dict]) -> List[dict]:
+        """Run `fn()` on the CPU pool before traffic and collect its reports.
+
+        Threads share one set of models, so one call suffices; in process mode
+        it is submitted once per worker (each also warms itself on start) and
+        the distinct per-process reports are returned. Bypasses admission.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        calls = self.pool_size if self.mode == 'process' else 1
+        # Collected but not recorded: warm-up timings would skew the stage histograms
+        runs = await asyncio.gather(*(loop.run_in_executor(self.cpu_pool, partial(metrics.collect, fn))
+                                      for _ in range(calls)))
+        return list({r.get('pid'): r for r, _, _ in runs}.values())
+
+    async def run_io(self, fn: Callable[..., Any], *args: Any) -> Any:
+        self.start()
+        loop = asyncio.get_running_loop()
+        result, timings, _ = await loop.run_in_executor(self.io_pool, partial(metrics.collect, fn, *args))
+        metrics.record(timings)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "pool_size": self.pool_size,
+            "queue_depth": self.queue_depth,
+            "shed_threshold": self.shed_threshold,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "shed_total": self.shed,
+        }
@@ -0,0 +1,94 @@
+"""Export the verification models as TorchScript artifacts for offline, fast boots.
+
+Run from ai-service/ (downloads weights once, honouring MODEL_CACHE_DIR):
+
+    python -m app.export_models artifacts/
+
+then start the service with MODEL_ARTIFACT_DIR=artifacts/. The directory holds
+the traced EfficientNet-B0 encoder, the traced CLIP image tower, the prompt
+embeddings for the current prompt set and a manifest with preprocessing
+settings. If the service later runs with different prompts it falls back to
+loading the full CLIP model for its text tower.
+
+With --onnx the fp32 and int8 ONNX graphs used by INFER_BACKEND=onnx /
+onnx-int8 are written to `<out_dir>/onnx` as well, so they are not exported
+at boot.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+
+import torch
+from dotenv import load_dotenv
+from loguru import logger
+
+
+def export(out_dir: str, onnx: bool = False) -> dict:
+    # Imported after load_dotenv so cache and prompt settings from .env apply
+    from . import ai_checks
+
+    os.makedirs(out_dir, exist_ok=True)
+    m = ai_checks.Models(artifact_dir=None, embedding='efficientnet')  # both models, whatever EMBEDDING_MODEL says
+    manifest = {"created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), "torch": torch.__version__}
+
+    with torch.no_grad():
+        example = torch.zeros((1, *m.encoder_cfg['input_size']))
+        encoder = torch.jit.freeze(torch.jit.trace(m.encoder, example, check_trace=False))
+        encoder.save(os.path.join(out_dir, 'encoder.ts'))
+    manifest['encoder'] = {
+        "name": ai_checks.ENCODER_NAME,
+        "file": 'encoder.ts',
+        "data_config": {k: list(v) if isinstance(v, tuple) else v for k, v in m.encoder_cfg.items()},
+    }
+
+    pp = m.clip_model.visual.preprocess_cfg
+    with torch.no_grad():
+        size = pp['size'] if isinstance(pp['size'], int) else tuple(pp['size'])
+        example = torch.zeros((1, 3, *((size, size) if isinstance(size, int) else size)))
+        visual = torch.jit.freeze(torch.jit.trace(m.clip_model.visual, example, check_trace=False))
+        visual.save(os.path.join(out_dir, 'clip_visual.ts'))
+    torch.save({"positive": m.clip_positive, "negative": m.clip_negative, "features": m.clip_text_features},
+               os.path.join(out_dir, 'clip_text.pt'))
+    manifest['clip'] = {
+        "name": ai_checks.CLIP_NAME,
+        "pretrained": ai_checks.CLIP_PRETRAINED,
+        "file": 'clip_visual.ts',
+        "text_file": 'clip_text.pt',
+        "preprocess": {
+            "image_size": size,
+            "mean": list(pp['mean']),
+            "std": list(pp['std']),
+            "interpolation": pp.get('interpolation'),
+            "resize_mode": pp.get('resize_mode'),
+        },
+    }
+    if onnx:
+        # ensure_graph writes `<name>.onnx` and, with int8, `<name>.int8.onnx` next to it
+        from .onnx_backend import ensure_graph
+        onnx_dir = os.path.join(out_dir, 'onnx')
+        ensure_graph(m.encoder, torch.zeros((1, *m.encoder_cfg['input_size'])),
+                     os.path.join(onnx_dir, f'{ai_checks.ENCODER_NAME}.onnx'), int8=True)
+        ensure_graph(m.clip_visual, torch.zeros((1, 3, *m.clip_input_size)),
+                     os.path.join(onnx_dir, f'{ai_checks.CLIP_NAME}-{ai_checks.CLIP_PRETRAINED}.visual.onnx'), int8=True)
+        manifest['onnx'] = sorted(os.listdir(onnx_dir))
+    with open(os.path.join(out_dir, ai_checks.ARTIFACT_MANIFEST), 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export TorchScript model artifacts for MODEL_ARTIFACT_DIR")
+    parser.add_argument('out_dir')
+    parser.add_argument('--onnx', action='store_true', help='also write fp32 and int8 ONNX graphs')
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+    started = time.monotonic()
+    export(args.out_dir, onnx=args.onnx)
+    logger.info(f"Exported model artifacts to {args.out_dir} ({time.monotonic() - started:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Forensic image signals on bounded buffers: FFT blur score and error level analysis.
+
+- Blur: share of spectral magnitude outside the central 64x64 low-frequency
+  box of a 256x256 grayscale thumbnail. The thumbnail comes from the shared
+  working copy (long side <= WORKING_MAX_SIDE) and the spectrum from a real
+  FFT (`rfft2`) with precomputed weights that count each kept bin once per
+  full-spectrum bin it stands for (its conjugate mirror), so the score equals
+  the full `fft2` + `fftshift` computation up to float rounding. Several
+  thumbnails are scored with one batched FFT.
+- ELA: mean absolute difference, over pixels and channels and scaled to 0-1,
+  between an image and its JPEG re-encode at `quality`. Resampling destroys
+  the 8x8 block grid ELA measures, and so does a reduced-resolution (DCT
+  scaled) JPEG decode, so it runs on a full-resolution decode of the upload
+  (`ImageBundle.ela_pixels`), cropped (block-aligned, centred) to at most
+  ELA_MAX_SIDE per side. With OpenCV the round trip and the difference stay
+  in uint8 and release the GIL. That full decode comes on top of the
+  reduced one the other checks use, once per view; one shared full decode
+  was measured slower (`ela_decode` in the benchmark: 267 ms against 366 ms
+  per 4000x3000 view), as downscaling it to the working view costs more
+  than the reduced decode saves.
+
+Agreement with the previous implementation (full decode, full-size thumbnail
+source, complex `fft2`, PIL round trip on the whole image), measured by
+`python -m benchmarks.forensics`: blur within BLUR_TOLERANCE and ELA within
+ELA_TOLERANCE, absolute.
+"""
+from __future__ import annotations
+import io
+import os
+
+import numpy as np
+from PIL import Image, ImageChops
+
+try:
+    import cv2
+    OPENCV_OK = True
+except Exception:
+    OPENCV_OK = False
+
+# Part of the analysis cache key: bump when scores change
+FORENSICS_VERSION = 3
+ELA_MAX_SIDE = int(os.getenv('ELA_MAX_SIDE', '1024'))
+ELA_QUALITY = 85
+BLUR_SIZE = 256
+BLUR_LOW_HALF = 32  # low-frequency box: frequencies in [-32, 32) on both axes
+BLUR_TOLERANCE = 0.005
+ELA_TOLERANCE = 0.0005
+
+
+def _blur_weights(size: int = BLUR_SIZE, half: int = BLUR_LOW_HALF) -> np.ndarray:
+    # (rfft bins, 2): how many full-spectrum bins of (all, low box) each kept bin stands for.
+    # Columns past size // 2 are dropped by rfft2; bin (u, v) there mirrors (-u, -v).
+    freq = np.fft.fftfreq(size, 1.0 / size).astype(np.int64)
+    iu, iv = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+    mirror = iv > size // 2
+    rows = np.where(mirror, (size - iu) % size, iu)
+    cols = np.where(mirror, size - iv, iv)
+    low = (freq[iu] >= -half) & (freq[iu] < half) & (freq[iv] >= -half) & (freq[iv] < half)
+    weights = np.zeros((size, size // 2 + 1, 2), dtype=np.float64)
+    np.add.at(weights[..., 0], (rows, cols), 1.0)
+    np.add.at(weights[..., 1], (rows[low], cols[low]), 1.0)
+    return weights.reshape(-1, 2)
+
+
+_BLUR_WEIGHTS = _blur_weights()
+
+
+def blur_thumbnail(img: Image.Image) -> np.ndarray:
+    """The (256, 256) float32 grayscale thumbnail the blur score is computed on."""
+    gray = img if img.mode == 'L' else img.convert('L')
+    return np.asarray(gray.resize((BLUR_SIZE, BLUR_SIZE), Image.BICUBIC), dtype=np.float32)
+
+
+def blur_scores(thumbs: np.ndarray) -> np.ndarray:
+    """Blur scores (high-frequency energy share; low means blurry) of an (N, 256, 256) stack."""
+    mag = np.abs(np.fft.rfft2(thumbs, axes=(-2, -1)))
+    sums = mag.reshape(mag.shape[0], -1) @ _BLUR_WEIGHTS  # (N, 2): total, low box
+    return (sums[:, 0] - sums[:, 1]) / (sums[:, 0] + 1e-6)
+
+
+def blur_score(img: Image.Image) -> float:
+    return float(blur_scores(blur_thumbnail(img)[None])[0])
+
+
+def ela_buffer(img: Image.Image, max_side: int = ELA_MAX_SIDE) -> np.ndarray:
+    """Pixels ELA runs on: RGB or grayscale of a full-resolution decode, centre-cropped on the 16-pixel MCU grid."""
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    arr = np.asarray(img)
+    h, w = arr.shape[:2]
+    if max_side > 0 and (h > max_side or w > max_side):
+        ch, cw = min(h, max_side), min(w, max_side)
+        y0, x0 = (h - ch) // 2 // 16 * 16, (w - cw) // 2 // 16 * 16
+        arr = arr[y0:y0 + ch, x0:x0 + cw]
+    return arr
+
+
+def ela_score(arr: np.ndarray, quality: int = ELA_QUALITY) -> float:
+    """Error level of an `ela_buffer`: mean |pixel - JPEG(pixel)| / 255."""
+    if arr.size == 0:
+        return 0.0
+    if OPENCV_OK:
+        # OpenCV encodes BGR; the colour conversion also makes the crop contiguous
+        src = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR) if arr.ndim == 3 else np.ascontiguousarray(arr)
+        ok, buf = cv2.imencode('.jpg', src, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            return 0.0
+        diff = cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+        cv2.absdiff(src, diff, dst=diff)
+        return float(sum(cv2.sumElems(diff)) / (diff.size * 255.0))
+    img = Image.fromarray(arr)
+    bio = io.BytesIO()
+    img.save(bio, 'JPEG', quality=quality)
+    bio.seek(0)
+    diff = np.asarray(ImageChops.difference(img, Image.open(bio)))
+    return float(diff.mean(dtype=np.float64) / 255.0)
+
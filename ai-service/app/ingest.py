@@ -0,0 +1,116 @@
+"""Bounded ingestion of uploaded images.
+
+Starlette spools each multipart file part to a SpooledTemporaryFile as the
+body arrives (in memory up to 1 MB, on disk beyond). `BodyLimit` caps that
+spooling: a request declaring or streaming more than its limit gets a 413
+without the rest being received. `read_upload` then takes one spooled part:
+it checks the size against UPLOAD_MAX_MB and the first bytes against the
+image signatures the decoder supports, both before reading the part. It
+reads the part into the single bytes object the pipeline decodes from and
+hashes it once, for the result cache key. The client's content type is not
+trusted.
+"""
+from __future__ import annotations
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+MB = 1024 * 1024
+
+# (offset, magic) -> format, for what the decoder is expected to see from phones and cameras
+SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'JPEG'),
+    (0, b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (8, b'WEBP', 'WEBP'),  # after b'RIFF' and the chunk size
+    (0, b'GIF87a', 'GIF'),
+    (0, b'GIF89a', 'GIF'),
+    (0, b'BM', 'BMP'),
+    (0, b'II*\x00', 'TIFF'),
+    (0, b'MM\x00*', 'TIFF'),
+)
+SNIFF_BYTES = 12
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Upload:
+    data: bytes
+    sha256: str  # hex digest of `data`
+    format: str  # as sniffed from the content
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Image format from the first SNIFF_BYTES of a file, or None when it is not one we decode."""
+    if head[:4] == b'RIFF' and head[8:12] != b'WEBP':
+        return None
+    for offset, magic, fmt in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return fmt
+    return None
+
+
+def read_upload(fh: BinaryIO, max_bytes: int, size: Optional[int] = None, name: str = 'upload') -> Upload:
+    """Size-check, sniff, read and hash one upload from a file object (blocking; run it off the event loop).
+
+    `size`, when known (Starlette counts spooled parts), rejects an oversized
+    file before any of it is read. Raises UploadTooLarge or UnsupportedImage.
+    """
+    if max_bytes > 0 and size is not None and size > max_bytes:
+        raise UploadTooLarge(f"{name} is {size} bytes; limit is {max_bytes}")
+    fh.seek(0)
+    fmt = sniff_format(fh.read(SNIFF_BYTES))
+    if fmt is None:
+        raise UnsupportedImage(f"{name} is not a JPEG, PNG, WebP, GIF, BMP or TIFF image")
+    fh.seek(0)
+    # One allocation, the payload itself; one byte over the limit is enough to know it is too large
+    data = fh.read(max_bytes + 1) if max_bytes > 0 else fh.read()
+    if max_bytes > 0 and len(data) > max_bytes:
+        raise UploadTooLarge(f"{name} is over the {max_bytes}-byte limit")
+    return Upload(data=data, sha256=hashlib.sha256(data).hexdigest(), format=fmt)
+
+
+def read_upload_file(path: str, max_bytes: int) -> Upload:
+    with open(path, 'rb') as fh:
+        return read_upload(fh, max_bytes, os.fstat(fh.fileno()).st_size, os.path.basename(path))
+
+
+class BodyLimit:
+    """ASGI middleware: 413 for request bodies over `max_bytes`, or over the
+    per-path limit in `limits`. Checked against Content-Length before the
+    body is read, and counted while it streams in for chunked requests."""
+
+    def __init__(self, app, max_bytes: int, limits: Optional[Dict[str, int]] = None):
+        self.app, self.max_bytes, self.limits = app, max_bytes, limits or {}
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get('path'), self.max_bytes) if scope['type'] == 'http' else 0
+        if limit <= 0:
+            return await self.app(scope, receive, send)
+        detail = f"Request body is limited to {limit / MB:g} MB"
+        declared = dict(scope.get('headers', [])).get(b'content-length')
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    # Raised inside the body parser, so the route never runs
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
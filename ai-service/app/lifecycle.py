@@ -0,0 +1,62 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+
+class StartupTracker:
+    """Wall-clock timings of startup phases and the moment the service became ready.
+
+    Phases may overlap (model warm-up runs alongside the first index sync);
+    a failed phase is recorded in `errors` and re-raised.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.in_progress: List[str] = []
+        self.errors: Dict[str, str] = {}
+        self.workers: List[dict] = []
+        self.ready_after_ms: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after_ms is not None
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000.0
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        self.in_progress.append(name)
+        try:
+            yield
+        except Exception as e:
+            self.errors[name] = str(e) or type(e).__name__
+            raise
+        finally:
+            self.in_progress.remove(name)
+            ms = (time.perf_counter() - start) * 1000.0
+            self.phases[name] = ms
+            logger.info(f"Startup phase {name}: {ms:.0f}ms")
+
+    def mark_ready(self) -> None:
+        if self.ready_after_ms is None:
+            self.ready_after_ms = self.elapsed_ms()
+            logger.info(f"Service ready {self.ready_after_ms:.0f}ms after start")
+
+    def report(self) -> dict:
+        return {
+            "started_at": self.started_at.isoformat(),
+            "ready": self.ready,
+            "ready_after_ms": self.ready_after_ms,
+            "phases_ms": dict(self.phases),
+            "in_progress": list(self.in_progress),
+            "errors": dict(self.errors),
+            "workers": list(self.workers),
+        }
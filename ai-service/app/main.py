@@ -1,22 +1,45 @@
 from __future__ import annotations
+import asyncio
+import concurrent.futures
+import hashlib
+import json
 import os
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import tempfile
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional, Tuple, Union
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+import numpy as np
+from bson import ObjectId
+
+# Load .env before importing modules that read their settings at import time
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+from fastapi import FastAPI, Request, Response, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from loguru import logger
 
 from .ai_checks import (
-    Thresholds, read_image_from_bytes, compute_phash, hamming_distance_hex,
-    is_tree_like, encode_feature_vector, max_cosine_similarity,
-    extract_basic_exif, error_level_analysis, blur_score_fft, aggregate_multi_view, orb_match_ratio
+    Thresholds, ImageTooLarge,
+    aggregate_multi_view, configure_batching, batching_stats, warm_up, embedding_version
 )
-from .database import MongoRepo
-
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
-app = FastAPI(title="Miko AI Verification Service")
+from . import metrics
+from .batch import BatchItem, cell_center, cell_query_radius, parse_items, plan_chunks, resolve_path
+from .database import MongoRepo, NearbyTrees, RepoUnavailable, TreeRecord
+from .executor import ExecutionBackend, Overloaded
+from .ingest import MB, BodyLimit, Upload, UnsupportedImage, UploadTooLarge, read_upload, read_upload_file
+from .lifecycle import StartupTracker
+from .metrics import stage
+from .pipeline import (
+    ImageAnalysis, ViewsAnalysis, analyze_image, analyze_images, analyze_views, analysis_version,
+)
+from .result_cache import ResultCache, content_key
+from .tile_cache import TileCache
+from .phash_index import PHashIndex, pack_hashes, hamming_many, phash_to_int
+from .vector_index import VectorIndex, haversine_m, normalize_rows
+from .write_behind import Registration, WriteBehindBuffer
 
 # Config
 RADIUS_METERS = float(os.getenv('RADIUS_METERS', '20'))
@@ -26,6 +49,61 @@ TREE_CONFIDENCE_MIN = float(os.getenv('TREE_CONFIDENCE_MIN', '0.7'))
 MIN_BLUR_SCORE = float(os.getenv('MIN_BLUR_SCORE', '0.08'))
 MIN_VEG_RATIO = float(os.getenv('MIN_VEG_RATIO', '0.12'))
 CLUSTER_MAX_IN_RADIUS = int(os.getenv('CLUSTER_MAX_IN_RADIUS', '5'))
+# Micro-batching of model forward passes across concurrent requests (1 disables)
+INFER_BATCH_MAX_SIZE = int(os.getenv('INFER_BATCH_MAX_SIZE', '8'))
+INFER_BATCH_MAX_WAIT_MS = float(os.getenv('INFER_BATCH_MAX_WAIT_MS', '5'))
+# Execution backend for CPU-bound verification ('thread' or 'process') and load shedding
+EXEC_MODE = os.getenv('EXEC_MODE', 'thread')
+EXEC_POOL_SIZE = int(os.getenv('EXEC_POOL_SIZE', '0')) or None  # default: CPU count
+EXEC_QUEUE_DEPTH = int(os.getenv('EXEC_QUEUE_DEPTH', '-1'))  # default: 2 x pool size
+EXEC_SHED_THRESHOLD = int(os.getenv('EXEC_SHED_THRESHOLD', '32'))
+DB_IO_WORKERS = int(os.getenv('DB_IO_WORKERS', '8'))
+# Background Mongo health probe: reconnects (closes the circuit) and creates indexes
+MONGO_PROBE_SECONDS = float(os.getenv('MONGO_PROBE_SECONDS', '5'))
+# In-memory vector index (Mongo remains the source of truth)
+VECTOR_INDEX_ENABLED = os.getenv('VECTOR_INDEX_ENABLED', '1') == '1'
+VECTOR_INDEX_SNAPSHOT = os.getenv('VECTOR_INDEX_SNAPSHOT', '')  # path prefix; empty disables snapshots
+VECTOR_INDEX_SYNC_SECONDS = float(os.getenv('VECTOR_INDEX_SYNC_SECONDS', '30'))
+# Full pass dropping trees deleted or rejected since they were indexed (sync only adds)
+INDEX_RECONCILE_SECONDS = float(os.getenv('INDEX_RECONCILE_SECONDS', '600'))
+VECTOR_GLOBAL_DEDUPE = os.getenv('VECTOR_GLOBAL_DEDUPE', '0') == '1'
+VECTOR_GLOBAL_MIN_COSINE = float(os.getenv('VECTOR_GLOBAL_MIN_COSINE', str(VECTOR_MIN_COSINE)))
+# Geofence lookups cached per grid tile, kept current by the collection's change stream
+TILE_CACHE_MAX_TREES = int(os.getenv('TILE_CACHE_MAX_TREES', '200000'))  # 0 disables
+TILE_CACHE_CELL_METERS = float(os.getenv('TILE_CACHE_CELL_METERS', '250'))
+TILE_CACHE_TILE_LIMIT = int(os.getenv('TILE_CACHE_TILE_LIMIT', '2000'))
+TILE_CACHE_TTL_SECONDS = float(os.getenv('TILE_CACHE_TTL_SECONDS', '300'))
+TILE_CACHE_UNWATCHED = os.getenv('TILE_CACHE_UNWATCHED', '0') == '1'
+# Collection-wide pHash index (synced alongside the vector index)
+PHASH_INDEX_ENABLED = os.getenv('PHASH_INDEX_ENABLED', '1') == '1'
+PHASH_GLOBAL_DEDUPE = os.getenv('PHASH_GLOBAL_DEDUPE', '0') == '1'
+# Load and warm models at startup; /ready answers 503 until done. With
+# MODEL_WARMUP_WAIT the server only starts accepting connections once warm.
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '1') == '1'
+MODEL_WARMUP_WAIT = os.getenv('MODEL_WARMUP_WAIT', '0') == '1'
+# Results of the location-independent analysis, keyed by upload bytes + settings
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '2048'))  # entries; 0 disables
+RESULT_CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', str(6 * 3600)))
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', '')  # optional disk tier
+RESULT_CACHE_DISK_MAX_MB = int(os.getenv('RESULT_CACHE_DISK_MAX_MB', '512'))
+# /verify-batch: limits, inference chunking and geo-cell grouping of Mongo queries
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
+BATCH_MAX_UPLOAD_MB = int(os.getenv('BATCH_MAX_UPLOAD_MB', '256'))
+# Uploads: per file, and per request body on the other routes (multipart framing included); 0 disables
+UPLOAD_MAX_MB = float(os.getenv('UPLOAD_MAX_MB', '25'))
+REQUEST_MAX_MB = float(os.getenv('REQUEST_MAX_MB', '64'))
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', str(max(1, INFER_BATCH_MAX_SIZE))))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '0')) or None  # chunks in flight; default: pool size
+BATCH_GEO_CELL_METERS = float(os.getenv('BATCH_GEO_CELL_METERS', '250'))
+BATCH_CELL_QUERY_LIMIT = int(os.getenv('BATCH_CELL_QUERY_LIMIT', '2000'))
+BATCH_FILE_ROOT = os.getenv('BATCH_FILE_ROOT', '')  # enables manifest items naming files under it
+
+REGISTER_FLUSH_SECONDS = float(os.getenv('REGISTER_FLUSH_SECONDS', '1'))
+REGISTER_FLUSH_SIZE = int(os.getenv('REGISTER_FLUSH_SIZE', '256'))
+REGISTER_JOURNAL = os.getenv('REGISTER_JOURNAL', '')  # JSON-lines file; empty keeps registrations in memory only
+REGISTER_DRAIN_SECONDS = float(os.getenv('REGISTER_DRAIN_SECONDS', '10'))
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'  # per-stage Server-Timing response header
 
 THRESHOLDS = Thresholds(
     phash_max_hamming=PHASH_MAX_HAMMING,
@@ -35,17 +113,459 @@ THRESHOLDS = Thresholds(
     min_veg_ratio=MIN_VEG_RATIO
 )
 
-repo = MongoRepo()
+configure_batching(INFER_BATCH_MAX_SIZE, INFER_BATCH_MAX_WAIT_MS)
+
+backend = ExecutionBackend(
+    mode=EXEC_MODE,
+    pool_size=EXEC_POOL_SIZE,
+    queue_depth=None if EXEC_QUEUE_DEPTH < 0 else EXEC_QUEUE_DEPTH,
+    shed_threshold=EXEC_SHED_THRESHOLD,
+    io_workers=DB_IO_WORKERS
+)
+
+startup = StartupTracker()
+
+EMBEDDING_VERSION = embedding_version()
+# Dedupe only compares embeddings from the model in use; trees embedded by
+# another (e.g. mid-migration) are matched by pHash alone until re-embedded
+repo = MongoRepo(model_version=EMBEDDING_VERSION)
+# Only builds the client; reachability and indexes are checked by _db_probe_loop
 repo.connect()
 
+vector_index = VectorIndex(model_version=EMBEDDING_VERSION)
+phash_index = PHashIndex()
+tile_cache = TileCache(
+    cell_m=TILE_CACHE_CELL_METERS,
+    max_trees=TILE_CACHE_MAX_TREES,
+    ttl_seconds=TILE_CACHE_TTL_SECONDS,
+    tile_limit=TILE_CACHE_TILE_LIMIT,
+    allow_unwatched=TILE_CACHE_UNWATCHED
+)
+# Trees registered through /register-tree and not yet written to Mongo
+registrations = WriteBehindBuffer(flush_size=REGISTER_FLUSH_SIZE, journal_path=REGISTER_JOURNAL or None)
+_flush_now = asyncio.Event()
+
+ANALYSIS_VERSION = analysis_version(THRESHOLDS)
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_SIZE,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    disk_dir=RESULT_CACHE_DIR or None,
+    disk_max_bytes=RESULT_CACHE_DISK_MAX_MB * 1024 * 1024
+)
+# Analyses currently running, so concurrent identical uploads (client retries) share one
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+async def _warm_models():
+    try:
+        with startup.phase('models'):
+            startup.workers = await backend.warm_up(warm_up)
+    except Exception as e:
+        logger.error(f"Model warm-up failed; service stays unready: {e}")
+        return
+    startup.mark_ready()
+
+
+async def _sync_indexes(reconcile: bool = False):
+    if VECTOR_INDEX_ENABLED:
+        try:
+            changed = await backend.run_io(vector_index.sync, repo)
+            if reconcile:
+                changed += await backend.run_io(vector_index.reconcile, repo, registrations.pending_ids())
+            if changed and VECTOR_INDEX_SNAPSHOT:
+                await backend.run_io(vector_index.save, VECTOR_INDEX_SNAPSHOT)
+        except Exception as e:
+            logger.error(f"Vector index sync failed: {e}")
+    if PHASH_INDEX_ENABLED:
+        try:
+            await backend.run_io(phash_index.sync, repo)
+            if reconcile:
+                await backend.run_io(phash_index.reconcile, repo, registrations.pending_ids())
+        except Exception as e:
+            logger.error(f"pHash index sync failed: {e}")
+
+
+async def _db_probe_loop():
+    # Once at startup, then while Mongo is down or its indexes are missing, so
+    # the circuit closes again without a request having to find out
+    with startup.phase('mongo_connect'):
+        await backend.run_io(repo.probe)
+    while True:
+        await asyncio.sleep(MONGO_PROBE_SECONDS)
+        if not repo.is_connected() or not repo.indexes_ready:
+            try:
+                await backend.run_io(repo.probe)
+            except Exception as e:
+                logger.error(f"Mongo probe failed: {e}")
+
+
+async def _index_sync_loop():
+    loaded = False
+    if VECTOR_INDEX_ENABLED and VECTOR_INDEX_SNAPSHOT:
+        try:
+            with startup.phase('vector_index_snapshot'):
+                loaded = await backend.run_io(vector_index.load, VECTOR_INDEX_SNAPSHOT)
+        except Exception as e:
+            logger.error(f"Vector index snapshot load failed; rebuilding from Mongo: {e}")
+    with startup.phase('index_initial_sync'):
+        # A snapshot may hold trees deleted while it was on disk
+        await _sync_indexes(reconcile=loaded)
+    reconciled = time.monotonic()
+    while True:
+        await asyncio.sleep(VECTOR_INDEX_SYNC_SECONDS)
+        due = time.monotonic() - reconciled >= INDEX_RECONCILE_SECONDS
+        await _sync_indexes(reconcile=due)
+        if due:
+            reconciled = time.monotonic()
+
+
+def _apply_registration(rec: TreeRecord) -> None:
+    # Visible to dedupe at once, before the tree is written to Mongo
+    if PHASH_INDEX_ENABLED and rec.phash:
+        phash_index.add(rec.id, rec.phash)
+    if VECTOR_INDEX_ENABLED and rec.vector is not None:
+        vector_index.add([rec.id], rec.vector.reshape(1, -1), np.asarray([rec.lat]), np.asarray([rec.lon]))
+    tile_cache.upsert(rec)
+
+
+def _unapply_registration(rec: TreeRecord) -> None:
+    phash_index.remove([rec.id])
+    vector_index.remove([rec.id])
+    tile_cache.remove(rec.id)
+
+
+async def _flush_registrations() -> None:
+    while len(registrations) and repo.is_connected():
+        try:
+            flushed, stored, missing = await backend.run_io(registrations.flush, repo)
+        except RepoUnavailable as e:
+            logger.warning(f"Registration flush failed; {len(registrations)} trees stay pending: {e}")
+            return
+        if not flushed:
+            return
+        lost = set(missing)
+        for reg in flushed:
+            stored_id = stored.get(reg.content_hash)
+            if reg.content_hash in lost:
+                _unapply_registration(reg.record)
+                what = f"submission {reg.record.id} was rejected" if reg.submission \
+                    else f"tree {reg.record.id} does not exist"
+                logger.warning(f"Registration of upload {reg.content_hash} dropped: {what}")
+            elif stored_id is None and not reg.submission:
+                # A tile loaded from Mongo before the write lacks the artifacts. A submission's tree
+                # has its own id and comes in with the next index sync or tile load
+                tile_cache.upsert(reg.record)
+            else:
+                logger.warning(f"Upload {reg.content_hash} was already registered as {stored_id}; "
+                               f"its artifacts were not written to {reg.record.id}")
+
+
+async def _register_flush_loop():
+    # Every REGISTER_FLUSH_SECONDS, or as soon as REGISTER_FLUSH_SIZE trees are pending
+    while True:
+        try:
+            await asyncio.wait_for(_flush_now.wait(), REGISTER_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _flush_now.clear()
+        try:
+            await _flush_registrations()
+        except Exception as e:
+            logger.error(f"Registration flush failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    with startup.phase('backend_start'):
+        backend.start()
+    warm_task = None
+    if MODEL_WARMUP:
+        warm_task = asyncio.create_task(_warm_models())
+        if MODEL_WARMUP_WAIT:
+            await warm_task
+    else:
+        # Models load lazily on the first request
+        startup.mark_ready()
+    probe_task = index_task = flush_task = None
+    if repo.is_configured():
+        with startup.phase('register_journal'):
+            for reg in registrations.replay():
+                _apply_registration(reg.record)
+        probe_task = asyncio.create_task(_db_probe_loop())
+        flush_task = asyncio.create_task(_register_flush_loop())
+        if VECTOR_INDEX_ENABLED or PHASH_INDEX_ENABLED:
+            index_task = asyncio.create_task(_index_sync_loop())
+        if tile_cache.enabled:
+            # Blocks on the change stream, so it gets its own thread rather than an I/O worker
+            threading.Thread(target=tile_cache.watch, args=(repo,), name='tile-cache-watch', daemon=True).start()
+    try:
+        yield
+    finally:
+        for task in (warm_task, probe_task, index_task, flush_task):
+            if task is not None:
+                task.cancel()
+        if len(registrations):
+            registrations.drain(repo, REGISTER_DRAIN_SECONDS)
+        tile_cache.stop()
+        if VECTOR_INDEX_SNAPSHOT and vector_index.ready:
+            vector_index.save(VECTOR_INDEX_SNAPSHOT)
+        backend.shutdown()
+        repo.close()
+
+
+REQUEST_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    'verify_request_seconds', 'HTTP request latency by route', ('endpoint',)))
+OUTCOMES = metrics.REGISTRY.register(metrics.Counter(
+    'verify_outcomes_total', 'Verification results by endpoint, status and reason', ('endpoint', 'status', 'reason')))
+DEGRADED = metrics.REGISTRY.register(metrics.Counter(
+    'verify_degraded_total', 'Verification results given without a database (no dedupe)', ('endpoint',)))
+DB_UNAVAILABLE_REASON = "Database unavailable; only tree presence validated"
+PHASH_LOCAL_REASON = "Duplicate by perceptual hash"
+PHASH_GLOBAL_REASON = "Duplicate by perceptual hash (photo already submitted at another location)"
+
+for _name, _help, _fn, _kind in (
+    ('verify_executor_in_flight', 'CPU tasks running on the execution backend', lambda: backend.in_flight, 'gauge'),
+    ('verify_executor_waiting', 'CPU tasks waiting for a worker slot', lambda: backend.waiting, 'gauge'),
+    ('verify_executor_shed_total', 'Requests shed as overloaded', lambda: backend.shed, 'counter'),
+    ('verify_result_cache_hits_total', 'Analysis cache hits (memory and disk)',
+     lambda: result_cache.hits + result_cache.disk_hits, 'counter'),
+    ('verify_result_cache_misses_total', 'Analysis cache misses', lambda: result_cache.misses, 'counter'),
+    ('verify_vector_index_size', 'Trees in the in-memory vector index', lambda: len(vector_index), 'gauge'),
+    ('verify_phash_index_size', 'Trees in the in-memory pHash index', lambda: len(phash_index), 'gauge'),
+    ('verify_tile_cache_hits_total', 'Geofence tile lookups served from memory', lambda: tile_cache.hits, 'counter'),
+    ('verify_tile_cache_misses_total', 'Geofence tiles loaded from Mongo', lambda: tile_cache.misses, 'counter'),
+    ('verify_tile_cache_bypassed_total', 'Geofence queries sent straight to Mongo (cache inactive or dense tile)',
+     lambda: tile_cache.bypassed, 'counter'),
+    ('verify_tile_cache_trees', 'Trees held in cached geofence tiles', lambda: tile_cache.stats()["trees"], 'gauge'),
+    ('verify_register_pending', 'Registered trees not yet written to Mongo', lambda: len(registrations), 'gauge'),
+    ('verify_register_waiting', 'Registered submissions awaiting review', lambda: registrations.waiting, 'gauge'),
+    ('verify_register_flushed_total', 'Registered trees written to Mongo', lambda: registrations.flushed, 'counter'),
+    ('verify_db_connected', '1 when MongoDB is reachable', lambda: repo.is_connected(), 'gauge'),
+    ('verify_db_errors_total', 'Failed MongoDB queries and probes', lambda: repo.stats()["circuit"]["errors"], 'counter'),
+    ('verify_db_circuit_trips_total', 'Times the MongoDB circuit breaker opened',
+     lambda: repo.stats()["circuit"]["trips"], 'counter'),
+    ('verify_ready', '1 once models are loaded and warmed', lambda: startup.ready, 'gauge'),
+):
+    metrics.REGISTRY.register(metrics.Callback(_name, _help, _fn, _kind))
+
+app = FastAPI(title="Miko AI Verification Service", lifespan=lifespan)
+app.add_middleware(BodyLimit, max_bytes=int(REQUEST_MAX_MB * MB),
+                   limits={"/verify-batch": (BATCH_MAX_UPLOAD_MB + 1) * MB})  # + the items field
+app.add_middleware(metrics.RequestMetrics, histogram=REQUEST_SECONDS, server_timing=SERVER_TIMING)
+
+
+def _endpoint(request: Request) -> str:
+    return getattr(request.scope.get('route'), 'path', 'other')
+
+
+def _count_outcome(endpoint: str, body: Dict[str, Any]) -> None:
+    OUTCOMES.inc(endpoint=endpoint, status=body.get("status"), reason=body.get("reason"))
+    if body.get("degraded"):
+        DEGRADED.inc(endpoint=endpoint)
+
+
+@app.exception_handler(Overloaded)
+async def _overloaded(request: Request, exc: Overloaded):
+    body = {
+        "status": "UNAVAILABLE",
+        "reason": "Verification service is overloaded; please retry",
+        "detail": str(exc)
+    }
+    _count_outcome(_endpoint(request), body)
+    return JSONResponse(status_code=503, headers={"Retry-After": "1"}, content=body)
+
 
+@app.exception_handler(ImageTooLarge)
+@app.exception_handler(UploadTooLarge)
+async def _too_large(_request: Request, exc: ValueError):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+@app.exception_handler(UnsupportedImage)
+async def _not_an_image(_request: Request, exc: UnsupportedImage):
+    return JSONResponse(status_code=400, content={"detail": f"Invalid file type; {exc}"})
+
+
+async def _read_upload(up: UploadFile) -> Upload:
+    """One uploaded file, size-checked, sniffed and hashed before any decode work."""
+    with stage('upload_read'):
+        return await backend.run_io(read_upload, up.file, int(UPLOAD_MAX_MB * MB), up.size, up.filename or 'upload')
+
+
+def _analysis_key(kind: str, digests: List[str]) -> str:
+    return content_key(ANALYSIS_VERSION, kind, digests)
+
+
+async def _analyze_and_store(key: str, fn: Callable, payload: Union[bytes, List[bytes]], *args) -> Any:
+    result = await backend.run_cpu(fn, payload, THRESHOLDS, *args)
+    # An early duplicate depends on the indexes and the location, not only on the bytes
+    if getattr(result, 'duplicate', None) is None:
+        await backend.run_io(result_cache.put, key, result)
+    return result
+
+
+async def _cached_analysis(fn: Callable, payload: Union[bytes, List[bytes]], digests: List[str],
+                           *args) -> Tuple[Any, str]:
+    """(result of `fn(payload, THRESHOLDS, *args)` on a CPU worker, cache status).
+
+    `digests` are the SHA-256 of each upload in `payload`, from ingestion.
+    Identical bytes under the same ANALYSIS_VERSION reuse an earlier result
+    (HIT) or join an identical analysis still running (COALESCED). `args`
+    are not part of the key, so they must not change the result, except by
+    an early duplicate, which is not stored.
+    """
+    if not result_cache.enabled:
+        return await backend.run_cpu(fn, payload, THRESHOLDS, *args), "BYPASS"
+    key = _analysis_key(fn.__name__, digests)
+    task = _inflight.get(key)
+    status = "COALESCED"
+    if task is None:
+        with stage('cache_lookup'):
+            hit = await backend.run_io(result_cache.get, key)
+        if hit is not None:
+            return hit, "HIT"
+        task = _inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(_analyze_and_store(key, fn, payload, *args))
+            _inflight[key] = task
+
+            def _forget(t: asyncio.Task) -> None:
+                _inflight.pop(key, None)
+                # Retrieved so a failure nobody awaited is not logged as never retrieved
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(_forget)
+            status = "MISS"
+    # Shielded: a client disconnecting must not cancel work others are waiting on
+    return await asyncio.shield(task), status
+
+
+def _local_phash_duplicate(phash: str, nearby: NearbyTrees) -> Optional[Tuple[str, int]]:
+    """(tree id, distance) of the first of `nearby` whose pHash is within the threshold."""
+    with_ph = [rec for rec in nearby if rec.phash]
+    if not with_ph:
+        return None
+    with stage('phash_dedupe'):
+        dists = hamming_many(phash_to_int(phash), pack_hashes(rec.phash for rec in with_ph))
+        hits = np.nonzero(dists <= THRESHOLDS.phash_max_hamming)[0]
+    return (str(with_ph[hits[0]].id), int(dists[hits[0]])) if hits.size else None
+
+
+def _phash_rejection(dup: Tuple[str, int], reason: str, degraded: bool = False) -> Dict[str, Any]:
+    return {
+        "status": "REJECTED",
+        "reason": reason,
+        "duplicate_of": dup[0],
+        "metrics": {"phash_hamming": dup[1]},
+        "degraded": degraded
+    }
+
+
+def _global_phash_duplicate(phash: str) -> Optional[Tuple[str, int]]:
+    """(tree id, distance) of the closest indexed pHash within the threshold, anywhere."""
+    if not (PHASH_GLOBAL_DEDUPE and phash_index.ready):
+        return None
+    with stage('phash_dedupe'):
+        hits = phash_index.query(phash, THRESHOLDS.phash_max_hamming, limit=1)
+    return hits[0] if hits else None
+
+
+def _with_registered(nearby: NearbyTrees, latitude: float, longitude: float, radius_m: float) -> NearbyTrees:
+    """`nearby` plus trees registered within `radius_m` that are not yet written to Mongo."""
+    seen = {rec.id for rec in nearby}
+    extra = [rec for rec in registrations.nearby(latitude, longitude, radius_m) if rec.id not in seen]
+    if not extra:
+        return nearby
+    out = NearbyTrees(records=nearby.records + extra, vectors=nearby.vectors, vector_ids=nearby.vector_ids)
+    with_vec = [rec for rec in extra if rec.vector is not None]
+    if nearby.vectors is not None and with_vec:
+        added = np.stack([rec.vector for rec in with_vec])
+        out.vectors = np.vstack([nearby.vectors, added]) if nearby.vectors.size else added
+        out.vector_ids = nearby.vector_ids + [rec.id for rec in with_vec]
+    return out
+
+
+async def _find_nearby(latitude: float, longitude: float) -> NearbyTrees:
+    # Once the index is warm it supplies vectors, so Mongo only returns ids and hashes
+    nearby = await backend.run_io(tile_cache.find_nearby, repo, latitude, longitude, RADIUS_METERS,
+                                  not vector_index.ready)
+    return _with_registered(nearby, latitude, longitude, RADIUS_METERS)
+
+
+async def _top_similarity(query_vec: np.ndarray, nearby: NearbyTrees) -> Optional[Tuple[Any, float]]:
+    """Best cosine match among `nearby` trees, or None when none has a vector."""
+    with stage('cosine'):
+        if vector_index.ready:
+            ids, mat, missing = vector_index.get([rec.id for rec in nearby])
+            if missing:
+                # Written after the last index sync; fetch just those from Mongo
+                fetched = await backend.run_io(repo.find_vectors, missing)
+                if fetched:
+                    fetched_mat = np.stack(list(fetched.values()))
+                    mat = np.vstack([mat, fetched_mat]) if ids else fetched_mat
+                    ids = ids + list(fetched.keys())
+        else:
+            # Already decoded into one normalised matrix by the repo
+            ids, mat = nearby.vector_ids, nearby.vectors
+        if not ids:
+            return None
+        sims = mat @ normalize_rows(query_vec)[0]
+        top_idx = int(np.argmax(sims))
+        return ids[top_idx], float(sims[top_idx])
+
+
+async def _global_duplicate(query_vec: np.ndarray, latitude: float, longitude: float,
+                            nearby: NearbyTrees) -> Optional[dict]:
+    """FLAGGED response when a near-identical tree exists outside the geofence."""
+    if not (VECTOR_GLOBAL_DEDUPE and vector_index.ready):
+        return None
+    with stage('global_dedupe'):
+        hits = await backend.run_io(vector_index.search, query_vec, 5, latitude, longitude)
+    in_fence = {str(rec.id) for rec in nearby}
+    for tree_id, sim, dist in hits:
+        if sim < VECTOR_GLOBAL_MIN_COSINE:
+            break
+        if tree_id in in_fence:
+            continue
+        return {
+            "status": "FLAGGED",
+            "reason": "Near-duplicate of an existing tree outside the geofence; manual review required",
+            "duplicate_of": tree_id,
+            "metrics": {"cosine": sim, "distance_m": dist},
+            "degraded": False
+        }
+    return None
+
+
+# Liveness/readiness/config stay on the event loop so they answer even while workers are busy
 @app.get("/health")
-def health():
+async def health():
     return {"ok": True, "degraded": not repo.is_connected()}
 
 
+@app.get("/ready")
+async def ready():
+    # Readiness: models loaded and warmed on every worker. Indexes fill in later;
+    # until then dedupe falls back to Mongo.
+    body = {
+        "ready": startup.ready,
+        "in_progress": list(startup.in_progress),
+        "errors": dict(startup.errors),
+        "vector_index": vector_index.ready,
+        "phash_index": phash_index.ready,
+        "db_connected": repo.is_connected()
+    }
+    return body if startup.ready else JSONResponse(status_code=503, content=body)
+
+
+@app.get("/startup")
+async def startup_report():
+    return startup.report()
+
+
 @app.get("/config")
-def config():
+async def config():
     # Do not expose MONGO_URI
     return {
         "radius_meters": RADIUS_METERS,
@@ -53,25 +573,36 @@ def config():
         "vector_min_cosine": VECTOR_MIN_COSINE,
         "tree_confidence_min": TREE_CONFIDENCE_MIN,
         "cluster_max_in_radius": CLUSTER_MAX_IN_RADIUS,
-        "db_connected": repo.is_connected()
+        "batching": batching_stats(),
+        "execution": backend.stats(),
+        "vector_index": vector_index.stats(),
+        "phash_index": phash_index.stats(),
+        "tile_cache": tile_cache.stats(),
+        "registrations": registrations.stats(),
+        "vector_global_dedupe": VECTOR_GLOBAL_DEDUPE,
+        "embedding_version": EMBEDDING_VERSION,
+        "result_cache": {**result_cache.stats(), "analysis_version": ANALYSIS_VERSION},
+        "db_connected": repo.is_connected(),
+        "db": repo.stats()
     }
 
 
-@app.post("/verify-tree")
-async def verify_tree(
-    image: UploadFile = File(...),
-    latitude: float = Form(...),
-    longitude: float = Form(...)
-):
-    if image.content_type is None or not image.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Invalid file type; must be an image.")
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 
-    data = await image.read()
-    img = read_image_from_bytes(data)
+async def _decide_single(analysis: ImageAnalysis, latitude: float, longitude: float,
+                         nearby: Optional[NearbyTrees] = None,
+                         content_hash: Optional[str] = None) -> Tuple[int, Dict[str, Any]]:
+    """(HTTP status, body) for one analysed image at a location: steps 2-3 of /verify-tree.
 
-    # Step 1: Tree present check
-    tree_ok, tree_score, tree_info = is_tree_like(img, THRESHOLDS)
-    if not tree_ok:
+    `content_hash` (the upload's SHA-256) is returned with the artifacts, as the
+    key /register-tree is idempotent on.
+    """
+    tree_score, tree_info = analysis.tree_score, analysis.tree_info
+    if not analysis.tree_ok:
         reason = "Tree not detected"
         # Map internal reasons to user-friendly ones
         if tree_info.get("reason") == "too_small":
@@ -85,18 +616,17 @@ async def verify_tree(
                 reason = "No tree detected with sufficient confidence"
             elif "low_vegetation" in tree_info["reasons"]:
                 reason = "Not enough vegetation signal"
-        return JSONResponse(status_code=422, content={
+        return 422, {
             "status": "REJECTED",
             "reason": reason,
             "details": {
                 "tree_score": tree_score,
                 **tree_info
             }
-        })
+        }
 
-    # Compute new image features
-    new_ph = compute_phash(img)
-    new_vec = encode_feature_vector(img)  # shape (1, D)
+    new_ph = analysis.phash
+    new_vec = analysis.vector  # shape (1, D)
 
     result: Dict[str, Any] = {
         "status": "PASSED",
@@ -107,17 +637,37 @@ async def verify_tree(
         "degraded": not repo.is_connected(),
         "artifacts": {
             "phash": new_ph,
-            "vector": new_vec.reshape(-1).tolist()
+            "vector": new_vec.reshape(-1).tolist(),
+            "model_version": EMBEDDING_VERSION,
+            "content_hash": content_hash
         }
     }
 
     # If no DB, we can't dedupe; return degraded pass
     if not repo.is_connected():
-        result["reason"] = "No DB connection; only tree presence validated"
-        return result
+        result["reason"] = "No DB connection; only tree presence validated" if not repo.is_configured() \
+            else DB_UNAVAILABLE_REASON
+        return 200, result
+    try:
+        found = await _dedupe_single(new_ph, new_vec, latitude, longitude, nearby, result["metrics"])
+    except RepoUnavailable as e:
+        # Not "no duplicates": say dedupe was skipped
+        logger.warning(f"Dedupe skipped: {e}")
+        result["degraded"] = True
+        result["reason"] = DB_UNAVAILABLE_REASON
+        return 200, result
+    if found is not None:
+        return 200, found
+    result["reason"] = "All checks passed"
+    return 200, result
 
-    # Step 2: Geofence query
-    nearby = repo.find_nearby(latitude, longitude, RADIUS_METERS)
+
+async def _dedupe_single(new_ph: str, new_vec: np.ndarray, latitude: float, longitude: float,
+                         nearby: Optional[NearbyTrees], metrics_out: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Steps 2-3 of /verify-tree: the FLAGGED/REJECTED body, or None when no duplicate was found."""
+    # Step 2: Geofence query (batch callers pass one shared per geo cell)
+    if nearby is None:
+        nearby = await _find_nearby(latitude, longitude)
     if len(nearby) > CLUSTER_MAX_IN_RADIUS:
         return {
             "status": "FLAGGED",
@@ -126,56 +676,142 @@ async def verify_tree(
             "degraded": False
         }
 
-    # Step 3a: pHash quick reject
-    for rec in nearby:
-        if rec.phash:
-            dist = hamming_distance_hex(new_ph, rec.phash)
-            if dist <= THRESHOLDS.phash_max_hamming:
-                return {
-                    "status": "REJECTED",
-                    "reason": "Duplicate by perceptual hash",
-                    "duplicate_of": str(rec.id),
-                    "metrics": {"phash_hamming": dist},
-                    "degraded": False
-                }
+    # Step 3a: pHash quick reject, first within the geofence, then across the collection
+    dup = _local_phash_duplicate(new_ph, nearby)
+    if dup is not None:
+        return _phash_rejection(dup, PHASH_LOCAL_REASON)
+    dup = _global_phash_duplicate(new_ph)
+    if dup is not None:
+        return _phash_rejection(dup, PHASH_GLOBAL_REASON)
 
     # Step 3b: Deep similarity
-    existing_vecs = [
-        (rec.id, np_vec) for rec in nearby for np_vec in ([None] if rec.vector is None else [rec.vector])
-    ]
-    # Convert to (id, np.ndarray) list
-    vecs = []
-    ids = []
-    for _id, v in existing_vecs:
-        if v is not None:
-            ids.append(_id)
-            vecs.append(v)
-    # Compute cosine similarity
-    if vecs:
-        import numpy as np
-        mat = [np.array(v, dtype=np.float32).reshape(1, -1) for v in vecs]
-        # Stack and compare
-        mat = np.vstack(mat)
-        from sklearn.metrics.pairwise import cosine_similarity
-        sims = cosine_similarity(new_vec, mat)[0]
-        top_idx = int(np.argmax(sims))
-        top_sim = float(sims[top_idx])
+    top = await _top_similarity(new_vec, nearby)
+    if top is not None:
+        top_id, top_sim = top
         if top_sim >= THRESHOLDS.vector_min_cosine:
             return {
                 "status": "REJECTED",
                 "reason": "Duplicate by deep visual similarity",
-                "duplicate_of": str(ids[top_idx]),
+                "duplicate_of": str(top_id),
                 "metrics": {"cosine": top_sim},
                 "degraded": False
             }
-        result["metrics"]["max_cosine"] = top_sim
+        metrics_out["max_cosine"] = top_sim
 
-    result["reason"] = "All checks passed"
-    return result
+    # Step 3c: Near-duplicates outside the geofence (e.g. GPS off by tens of metres)
+    return await _global_duplicate(new_vec, latitude, longitude, nearby)
+
+
+def _early_phash_lookup(nearby: Optional[asyncio.Task]) -> Optional[Callable[[str], Optional[Tuple[str, int]]]]:
+    """The `duplicate_of` lookup a worker thread runs after the cheap stages, or None with nothing to look in.
+
+    It checks the geofence trees of `nearby` when that query has already
+    answered (the worker does not wait on I/O), unless they form a dense
+    cluster, which the dedupe step flags instead, then the global pHash
+    index. Same order and threshold as the dedupe step.
+    """
+    global_ready = PHASH_GLOBAL_DEDUPE and phash_index.ready
+    if nearby is None and not global_ready:
+        return None
+    answered: concurrent.futures.Future = concurrent.futures.Future()  # hands the trees to the worker thread
+    if nearby is not None:
+        def _answered(t: asyncio.Task) -> None:
+            answered.set_result(None if t.cancelled() or t.exception() is not None else t.result())
+
+        nearby.add_done_callback(_answered)
+
+    def duplicate_of(phash: str) -> Optional[Tuple[str, int]]:
+        trees = answered.result() if answered.done() else None
+        if trees is not None and len(trees) <= CLUSTER_MAX_IN_RADIUS:
+            dup = _local_phash_duplicate(phash, trees)
+            if dup is not None:
+                return dup
+        return _global_phash_duplicate(phash) if global_ready else None
+
+    return duplicate_of
+
+
+def _finished_trees(nearby: Optional[asyncio.Task]) -> Optional[NearbyTrees]:
+    if nearby is None or not nearby.done() or nearby.cancelled() or nearby.exception() is not None:
+        return None
+    return nearby.result()
+
+
+async def _analyze_single(upload: Upload, explain: bool,
+                          nearby: Optional[asyncio.Task] = None) -> Tuple[Union[ImageAnalysis, Dict[str, Any]], str]:
+    """(analysis, cache status) of one upload, or (REJECTED body, cache status) for an early pHash duplicate.
+
+    The tree check exits at its first failing stage. In thread mode the
+    worker looks the pHash up right after the cheap stages (one decode, one
+    admission; see `_early_phash_lookup`), among the trees of `nearby`, the
+    geofence query started alongside, and with PHASH_GLOBAL_DEDUPE in the
+    global index, so a resubmitted photo is rejected before CLIP and the
+    encoder run. Worker processes cannot reach either and leave it to the
+    dedupe step. `explain` runs every stage, uncached, for diagnostics.
+    """
+    data, digests = upload.data, [upload.sha256]
+    if explain:
+        return await backend.run_cpu(analyze_image, data, THRESHOLDS, True), "BYPASS"
+    duplicate_of = _early_phash_lookup(nearby) if backend.mode == 'thread' else None
+    analysis, cache_status = await _cached_analysis(analyze_image, data, digests, False, duplicate_of)
+    if analysis.duplicate is None:
+        return analysis, cache_status
+    trees = _finished_trees(nearby)
+    degraded = not repo.is_connected()
+    if trees is not None and any(str(rec.id) == analysis.duplicate[0] for rec in trees):
+        return _phash_rejection(analysis.duplicate, PHASH_LOCAL_REASON, degraded), cache_status
+    if PHASH_GLOBAL_DEDUPE:
+        return _phash_rejection(analysis.duplicate, PHASH_GLOBAL_REASON, degraded), cache_status
+    # Joined an identical upload's analysis whose early match was in its own geofence, not this one
+    return await backend.run_cpu(analyze_image, data, THRESHOLDS), "MISS"
+
+
+async def _geofence_result(nearby: Optional[asyncio.Task]) -> Optional[NearbyTrees]:
+    # None lets the dedupe step query (and report) again
+    if nearby is None:
+        return None
+    try:
+        return await nearby
+    except RepoUnavailable:
+        return None
+
+
+@app.post("/verify-tree")
+async def verify_tree(
+    response: Response,
+    image: UploadFile = File(...),
+    latitude: float = Form(...),
+    longitude: float = Form(...),
+    explain: bool = Form(False)
+):
+    upload = await _read_upload(image)
+
+    # Step 2's geofence query runs alongside the analysis, which can use its trees for an early pHash reject
+    nearby = asyncio.ensure_future(_find_nearby(latitude, longitude)) \
+        if repo.is_connected() and not explain else None
+    try:
+        # Step 1: Tree present check and new image features, on a worker (or cached)
+        analysis, cache_status = await _analyze_single(upload, explain, nearby)
+        response.headers["X-Cache"] = cache_status
+        if isinstance(analysis, dict):
+            status_code, body = 200, analysis
+        else:
+            trees = await _geofence_result(nearby) if analysis.tree_ok else None
+            status_code, body = await _decide_single(analysis, latitude, longitude, trees, content_hash=upload.sha256)
+            if explain and status_code == 200:
+                body["explain"] = analysis.tree_info  # rejections carry it in details
+    finally:
+        if nearby is not None and not nearby.cancel() and not nearby.cancelled():
+            nearby.exception()  # retrieved, whether or not anyone awaited it
+    _count_outcome("/verify-tree", body)
+    if status_code != 200:
+        return JSONResponse(status_code=status_code, headers={"X-Cache": cache_status}, content=body)
+    return body
 
 
 @app.post("/verify-tree-multi")
 async def verify_tree_multi(
+    response: Response,
     images: list[UploadFile] = File(...),
     latitude: float = Form(...),
     longitude: float = Form(...)
@@ -183,70 +819,63 @@ async def verify_tree_multi(
     if not images or len(images) < 2:
         raise HTTPException(status_code=400, detail="At least 2 images required")
 
-    imgs = []
-    phashes = []
-    vecs = []
-    tree_scores = []
-    forensic = []
-    for up in images:
-        if up.content_type is None or not up.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="All files must be images")
-        data = await up.read()
-        img = read_image_from_bytes(data)
-        ok, score, info = is_tree_like(img, THRESHOLDS)
-        if not ok:
-            reason = "A view lacks a detectable tree"
-            if info.get("reason") == "blur_low":
-                reason = "A view is too blurry"
-            elif info.get("reason") == "too_small":
-                reason = "A view is too small"
-            elif info.get("reason") == "face_detected":
-                reason = "A view contains a face; please capture only the tree"
-            elif isinstance(info.get("reasons"), list):
-                if "low_tree_prob" in info["reasons"]:
-                    reason = "A view lacks a tree with sufficient confidence"
-                elif "low_vegetation" in info["reasons"]:
-                    reason = "A view lacks vegetation signal"
-            return JSONResponse(status_code=422, content={
-                "status": "REJECTED",
-                "reason": reason,
-                "details": {"min_tree_score": score, **info}
-            })
-        imgs.append(img)
-        tree_scores.append(score)
-        phashes.append(compute_phash(img))
-        vecs.append(encode_feature_vector(img))
-        forensic.append({
-            "ela": error_level_analysis(img),
-            "blur": blur_score_fft(img)
-        })
+    uploads = [await _read_upload(up) for up in images]
+    views, cache_status = await _cached_analysis(analyze_views, [u.data for u in uploads], [u.sha256 for u in uploads])
+    response.headers["X-Cache"] = cache_status
+    status_code, body = await _decide_multi(views, latitude, longitude, _views_hash([u.sha256 for u in uploads]))
+    _count_outcome("/verify-tree-multi", body)
+    if status_code != 200:
+        return JSONResponse(status_code=status_code, headers={"X-Cache": cache_status}, content=body)
+    return body
+
+
+def _views_hash(digests: List[str]) -> str:
+    # Content hash of a multi-view submission: its views, in order
+    return hashlib.sha256('\0'.join(digests).encode('ascii')).hexdigest()
+
+
+async def _decide_multi(views: ViewsAnalysis, latitude: float, longitude: float,
+                        content_hash: Optional[str] = None) -> Tuple[int, Dict[str, Any]]:
+    """(HTTP status, body) for analysed views of one tree at a location."""
+    if views.failed_view is not None:
+        score, info = views.failed_view
+        reason = "A view lacks a detectable tree"
+        if info.get("reason") == "blur_low":
+            reason = "A view is too blurry"
+        elif info.get("reason") == "too_small":
+            reason = "A view is too small"
+        elif info.get("reason") == "face_detected":
+            reason = "A view contains a face; please capture only the tree"
+        elif isinstance(info.get("reasons"), list):
+            if "low_tree_prob" in info["reasons"]:
+                reason = "A view lacks a tree with sufficient confidence"
+            elif "low_vegetation" in info["reasons"]:
+                reason = "A view lacks vegetation signal"
+        return 422, {
+            "status": "REJECTED",
+            "reason": reason,
+            "details": {"min_tree_score": score, **info}
+        }
+    phashes, vecs, tree_scores, forensic = views.phashes, views.vectors, views.tree_scores, views.forensic
 
     # Intra-set duplicate check: ensure views are not trivial copies
-    for i in range(len(phashes)):
-        for j in range(i+1, len(phashes)):
-            if hamming_distance_hex(phashes[i], phashes[j]) <= THRESHOLDS.phash_max_hamming:
-                return {
-                    "status": "REJECTED",
-                    "reason": "Provided views are too similar (pHash)",
-                    "metrics": {"pair": [i,j]}
-                }
+    if views.similar_pair is not None:
+        i, j = views.similar_pair
+        return 200, {
+            "status": "REJECTED",
+            "reason": "Provided views are too similar (pHash)",
+            "metrics": {"pair": [i,j]}
+        }
 
     # Additional intra-set feature matching: ensure views are from same instance
-    if len(imgs) >= 2:
-        try:
-            ratios = []
-            for i in range(len(imgs)-1):
-                ratios.append(orb_match_ratio(imgs[i], imgs[i+1]))
-            avg_ratio = sum(ratios)/len(ratios) if ratios else 0.0
-            if ratios and avg_ratio < 0.05:
-                return {
-                    "status": "REJECTED",
-                    "reason": "Views appear to be unrelated objects (low feature match)",
-                    "metrics": {"avg_orb_match": avg_ratio}
-                }
-        except NameError:
-            # OpenCV not installed; skip strict enforcement, just report metric
-            avg_ratio = -1.0
+    ratios = views.orb_ratios
+    avg_ratio = sum(ratios)/len(ratios) if ratios else 0.0
+    if ratios and avg_ratio < 0.05:
+        return 200, {
+            "status": "REJECTED",
+            "reason": "Views appear to be unrelated objects (low feature match)",
+            "metrics": {"avg_orb_match": avg_ratio}
+        }
 
     # EXIF time sanity
     # If EXIF times wildly inconsistent (not strictly parsed here), you might flag for review.
@@ -258,39 +887,20 @@ async def verify_tree_multi(
     # Geofence and dedupe against existing
     degraded = not repo.is_connected()
     if not degraded:
-        nearby = repo.find_nearby(latitude, longitude, RADIUS_METERS)
-        if len(nearby) > CLUSTER_MAX_IN_RADIUS:
-            return {
-                "status": "FLAGGED",
-                "reason": "Dense cluster of existing trees in radius; manual review required",
-                "metrics": {"cluster_count": len(nearby)},
-                "degraded": False
-            }
-        # Compare aggregate vector to existing vectors
-        ids, mat = [], []
-        import numpy as np
-        for rec in nearby:
-            if rec.vector:
-                ids.append(rec.id)
-                mat.append(np.array(rec.vector, dtype=np.float32).reshape(1,-1))
-        if mat:
-            mat = np.vstack(mat)
-            from sklearn.metrics.pairwise import cosine_similarity
-            sims = cosine_similarity(agg_vec, mat)[0]
-            top_idx = int(np.argmax(sims))
-            top_sim = float(sims[top_idx])
-            if top_sim >= THRESHOLDS.vector_min_cosine:
-                return {
-                    "status": "REJECTED",
-                    "reason": "Duplicate tree detected across views",
-                    "duplicate_of": str(ids[top_idx]),
-                    "metrics": {"cosine": top_sim},
-                    "degraded": False
-                }
+        try:
+            found = await _dedupe_multi(phashes, agg_vec, latitude, longitude)
+        except RepoUnavailable as e:
+            logger.warning(f"Dedupe skipped: {e}")
+            found, degraded = None, True
+        if found is not None:
+            return 200, found
+    reason = "All multi-view checks passed"
+    if degraded and repo.is_configured():
+        reason = "Multi-view checks passed; database unavailable, dedupe skipped"
 
-    return {
+    return 200, {
         "status": "PASSED",
-        "reason": "All multi-view checks passed",
+        "reason": reason,
         "metrics": {
             "min_tree_score": float(min(tree_scores)),
             "avg_ela": float(sum(d["ela"] for d in forensic)/len(forensic)),
@@ -298,7 +908,324 @@ async def verify_tree_multi(
         },
         "artifacts": {
             "phashes": phashes,
-            "vector": agg_vec.reshape(-1).tolist()
+            "vector": agg_vec.reshape(-1).tolist(),
+            "model_version": EMBEDDING_VERSION,
+            "content_hash": content_hash
         },
         "degraded": degraded
     }
+
+
+async def _dedupe_multi(phashes: List[str], agg_vec: np.ndarray, latitude: float,
+                        longitude: float) -> Optional[Dict[str, Any]]:
+    """Dedupe of a multi-view submission: the FLAGGED/REJECTED body, or None."""
+    # Any view that is a re-upload of an already registered photo, anywhere
+    for idx, ph in enumerate(phashes):
+        dup = _global_phash_duplicate(ph)
+        if dup is not None:
+            return {
+                "status": "REJECTED",
+                "reason": "A view duplicates an already submitted photo (pHash)",
+                "duplicate_of": dup[0],
+                "metrics": {"view": idx, "phash_hamming": dup[1]},
+                "degraded": False
+            }
+    nearby = await _find_nearby(latitude, longitude)
+    if len(nearby) > CLUSTER_MAX_IN_RADIUS:
+        return {
+            "status": "FLAGGED",
+            "reason": "Dense cluster of existing trees in radius; manual review required",
+            "metrics": {"cluster_count": len(nearby)},
+            "degraded": False
+        }
+    # Compare aggregate vector to existing vectors
+    top = await _top_similarity(agg_vec, nearby)
+    if top is not None:
+        top_id, top_sim = top
+        if top_sim >= THRESHOLDS.vector_min_cosine:
+            return {
+                "status": "REJECTED",
+                "reason": "Duplicate tree detected across views",
+                "duplicate_of": str(top_id),
+                "metrics": {"cosine": top_sim},
+                "degraded": False
+            }
+    return await _global_duplicate(agg_vec, latitude, longitude, nearby)
+
+
+async def _analyze_chunk(chunk: List[BatchItem], uploads: List[Union[Upload, ValueError]]
+                         ) -> Tuple[List[ImageAnalysis], List[Optional[str]]]:
+    """Analysis and upload SHA-256 per item: cached results first, then one batched worker call for the rest.
+
+    `uploads` holds the ingestion error in place of an upload that was refused.
+    """
+    out: List[Optional[ImageAnalysis]] = [None] * len(chunk)
+    digests: List[Optional[str]] = [None] * len(chunk)
+    todo, payloads, keys = [], [], []
+    for i, item in enumerate(chunk):
+        try:
+            if item.path is None:
+                upload = uploads[item.image]
+                if isinstance(upload, ValueError):
+                    raise upload
+            else:
+                upload = await backend.run_io(read_upload_file, resolve_path(BATCH_FILE_ROOT, item.path),
+                                              int(UPLOAD_MAX_MB * MB))
+        except (OSError, ValueError) as e:
+            reason = "too_large" if isinstance(e, UploadTooLarge) else "unreadable"
+            out[i] = ImageAnalysis(tree_ok=False, tree_score=0.0, tree_info={"reason": reason}, error=str(e))
+            continue
+        data, digests[i] = upload.data, upload.sha256
+        key = _analysis_key(analyze_image.__name__, [upload.sha256])
+        with stage('cache_lookup'):
+            hit = await backend.run_io(result_cache.get, key) if result_cache.enabled else None
+        if hit is not None:
+            out[i] = hit
+        else:
+            todo.append(i)
+            payloads.append(data)
+            keys.append(key)
+    if payloads:
+        try:
+            results = await backend.run_cpu(analyze_images, payloads, THRESHOLDS)
+        except Overloaded as e:
+            results = [ImageAnalysis(tree_ok=False, tree_score=0.0, tree_info={"reason": "overloaded"}, error=str(e))
+                       for _ in payloads]
+        for i, key, res in zip(todo, keys, results):
+            out[i] = res
+            if res.error is None:
+                await backend.run_io(result_cache.put, key, res)
+    return out, digests
+
+
+class _BatchDedupe:
+    """Items already accepted in this batch, so repeats within it are caught too.
+
+    Follows the /verify-tree scopes: pHash is collection-wide with
+    PHASH_GLOBAL_DEDUPE, embeddings with VECTOR_GLOBAL_DEDUPE; otherwise only
+    items within RADIUS_METERS count.
+    """
+
+    def __init__(self):
+        self.phashes = PHashIndex()
+        self.vectors = VectorIndex(use_hnsw=False)
+        self.coords: Dict[str, Tuple[float, float]] = {}
+
+    def check(self, item: BatchItem, analysis: ImageAnalysis) -> Optional[Dict[str, Any]]:
+        # Any hit rejects when dedupe is global; otherwise every hit is needed to filter by distance
+        limit = 1 if PHASH_GLOBAL_DEDUPE else max(1, len(self.coords))
+        hits = self.phashes.query(analysis.phash, THRESHOLDS.phash_max_hamming, limit=limit)
+        if not PHASH_GLOBAL_DEDUPE:
+            hits = [(i, d) for i, d in hits
+                    if haversine_m(item.lat, item.lon, *self.coords[i]) <= RADIUS_METERS]
+        if hits:
+            return {
+                "status": "REJECTED",
+                "reason": "Duplicate of another item in this batch (pHash)",
+                "duplicate_of_index": int(hits[0][0]),
+                "metrics": {"phash_hamming": hits[0][1]}
+            }
+        near = self.vectors.search(analysis.vector, k=1, lat=item.lat, lon=item.lon,
+                                   radius_m=None if VECTOR_GLOBAL_DEDUPE else RADIUS_METERS)
+        if near and near[0][1] >= THRESHOLDS.vector_min_cosine:
+            return {
+                "status": "REJECTED",
+                "reason": "Duplicate of another item in this batch (deep similarity)",
+                "duplicate_of_index": int(near[0][0]),
+                "metrics": {"cosine": near[0][1]}
+            }
+        self.coords[str(item.index)] = (item.lat, item.lon)
+        self.phashes.add(item.index, analysis.phash)
+        self.vectors.add([item.index], analysis.vector, [item.lat], [item.lon])
+        return None
+
+
+async def _run_batch(chunks: List[List[BatchItem]], uploads: List[Union[Upload, ValueError]], n_items: int):
+    started = time.perf_counter()
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY or backend.pool_size)
+
+    async def analyze(chunk):
+        async with limit:
+            return await _analyze_chunk(chunk, uploads)
+
+    # Chunks are analysed concurrently but decided in plan order, so dedupe is deterministic
+    tasks = [asyncio.ensure_future(analyze(chunk)) for chunk in chunks]
+    dedupe = _BatchDedupe()
+    statuses: Counter = Counter()
+    cell, cell_trees = None, NearbyTrees()
+    try:
+        for chunk, task in zip(chunks, tasks):
+            analyses, digests = await task
+            for item, analysis, digest in zip(chunk, analyses, digests):
+                if analysis.error is not None:
+                    status_code, body = 422, {
+                        "status": "ERROR",
+                        "reason": {"too_large": "Image too large", "overloaded": "Service overloaded; retry the item"}
+                        .get(analysis.tree_info.get("reason"), "Unreadable image"),
+                        "detail": analysis.error
+                    }
+                elif not analysis.tree_ok:
+                    status_code, body = await _decide_single(analysis, item.lat, item.lon, NearbyTrees())
+                else:
+                    with stage('batch_dedupe'):
+                        dup = dedupe.check(item, analysis)
+                    if dup is not None:
+                        status_code, body = 200, {**dup, "degraded": not repo.is_connected()}
+                    else:
+                        nearby = None
+                        if repo.is_connected():
+                            # One geofence query per geo cell, filtered per item
+                            if item.cell != cell:
+                                c_lat, c_lon = cell_center(item.cell, BATCH_GEO_CELL_METERS)
+                                try:
+                                    c_radius = cell_query_radius(BATCH_GEO_CELL_METERS, RADIUS_METERS)
+                                    cell_trees = _with_registered(await backend.run_io(
+                                        tile_cache.find_nearby, repo, c_lat, c_lon, c_radius,
+                                        not vector_index.ready, BATCH_CELL_QUERY_LIMIT), c_lat, c_lon, c_radius)
+                                    cell = item.cell
+                                except RepoUnavailable:
+                                    # The item's own query below retries or reports it degraded
+                                    cell = None
+                            if item.cell == cell:
+                                nearby = cell_trees.within(item.lat, item.lon, RADIUS_METERS)
+                        status_code, body = await _decide_single(analysis, item.lat, item.lon, nearby, digest)
+                statuses[body.get("status")] += 1
+                _count_outcome("/verify-batch", body)
+                yield json.dumps({"index": item.index, "id": item.ref, "status_code": status_code, **body}) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+    elapsed = time.perf_counter() - started
+    yield json.dumps({"summary": {
+        "items": n_items,
+        "elapsed_ms": round(elapsed * 1000.0, 1),
+        "images_per_s": round(n_items / elapsed, 2) if elapsed > 0 else None,
+        "statuses": dict(statuses)
+    }}) + "\n"
+
+
+@app.post("/verify-batch")
+async def verify_batch(
+    items: str = Form(...),
+    images: Optional[list[UploadFile]] = File(None)
+):
+    """Verify many (image, latitude, longitude) items, streaming one NDJSON line per item.
+
+    `items` is a JSON list of {"lat", "lon", "id"?, "image"?, "path"?}: `image`
+    indexes the uploaded files (default: the item's position) and `path` names
+    a file under BATCH_FILE_ROOT instead. Lines carry the item's `index` and
+    `id` plus the /verify-tree response body; a final `summary` line follows.
+    """
+    images = images or []
+    try:
+        planned = parse_items(json.loads(items), len(images), BATCH_MAX_ITEMS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not BATCH_FILE_ROOT and any(it.path is not None for it in planned):
+        raise HTTPException(status_code=400, detail="File paths are disabled on this server (BATCH_FILE_ROOT)")
+
+    # Upload streams are closed once this handler returns, so read them before streaming
+    uploads, total = [], 0
+    for up in images:
+        total += up.size or 0
+        if total > BATCH_MAX_UPLOAD_MB * MB:
+            raise HTTPException(status_code=413, detail=f"Batch uploads are limited to {BATCH_MAX_UPLOAD_MB} MB; "
+                                                        "use file paths for larger imports")
+        try:
+            uploads.append(await _read_upload(up))
+        except (UnsupportedImage, UploadTooLarge) as e:
+            # Reported on the items using this file, like unreadable paths
+            uploads.append(e)
+
+    chunks = plan_chunks(planned, BATCH_GEO_CELL_METERS, BATCH_CHUNK_SIZE)
+    return StreamingResponse(_run_batch(chunks, uploads, len(planned)), media_type="application/x-ndjson")
+
+
+def _parse_registration(content_hash: str, latitude: float, longitude: float, phash: Optional[str],
+                        vector: Optional[str], model_version: Optional[str], tree_id: Optional[str],
+                        submission_id: Optional[str]) -> Registration:
+    if len(content_hash) != 64 or any(c not in '0123456789abcdef' for c in content_hash):
+        raise ValueError("content_hash must be a hex SHA-256, as returned in artifacts")
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        raise ValueError("latitude/longitude out of range")
+    if phash is not None and phash_to_int(phash) is None:
+        raise ValueError("phash must be a 64-bit hex hash")
+    vec = None
+    if vector is not None:
+        if (model_version or EMBEDDING_VERSION) != EMBEDDING_VERSION:
+            raise ValueError(f"vector is from {model_version}; this service embeds with {EMBEDDING_VERSION}")
+        try:
+            arr = np.asarray(json.loads(vector), dtype=np.float32)
+        except TypeError:
+            arr = None
+        if arr is None or arr.ndim != 1 or not arr.size or not np.isfinite(arr).all():
+            raise ValueError("vector must be a JSON list of numbers")
+        vec = normalize_rows(arr)[0]
+        if vector_index.dim is not None and vec.shape[0] != vector_index.dim:
+            raise ValueError(f"vector has {vec.shape[0]} dimensions; expected {vector_index.dim}")
+    if phash is None and vec is None:
+        raise ValueError("phash or vector required")
+    if (tree_id is None) == (submission_id is None):
+        raise ValueError("exactly one of tree_id and submission_id required")
+    if tree_id is not None and not ObjectId.is_valid(tree_id):
+        raise ValueError("tree_id must be the ObjectId of a stored tree")
+    if submission_id is not None and not ObjectId.is_valid(submission_id):
+        raise ValueError("submission_id must be the ObjectId of a stored submission")
+    return Registration(content_hash=content_hash, model_version=EMBEDDING_VERSION if vec is not None else None,
+                        record=TreeRecord(id=ObjectId(tree_id or submission_id), lat=latitude, lon=longitude,
+                                          phash=phash, vector=vec),
+                        submission=submission_id is not None)
+
+
+@app.post("/register-tree")
+async def register_tree(
+    content_hash: str = Form(...),
+    latitude: float = Form(...),
+    longitude: float = Form(...),
+    phash: Optional[str] = Form(None),
+    vector: Optional[str] = Form(None),
+    model_version: Optional[str] = Form(None),
+    tree_id: Optional[str] = Form(None),
+    submission_id: Optional[str] = Form(None)
+):
+    """Register an accepted tree so later submissions are deduplicated against it at once.
+
+    Fields are the `artifacts` of a PASSED verification (`vector` as a JSON
+    list), its location and the id of the backend's stored tree or, before
+    review, of its submission. The tree is visible to dedupe when this
+    returns (202) and its artifacts are written onto that document shortly
+    after (for a submission, onto the tree created from it at approval); a
+    repeated `content_hash` returns the first registration's id as `tree_id`
+    (200).
+    """
+    if not repo.is_configured():
+        raise HTTPException(status_code=503, detail="No database configured; registrations could not be persisted")
+    content_hash = content_hash.lower()
+    existing = registrations.lookup(content_hash)
+    if existing is None and repo.is_connected():
+        try:
+            existing = (await backend.run_io(repo.find_registered, [content_hash])).get(content_hash)
+        except RepoUnavailable as e:
+            # The unique index still catches a repeat when the tree is written
+            logger.warning(f"Registration lookup skipped: {e}")
+        if existing is not None:
+            registrations.remember(content_hash, existing)
+    if existing is not None:
+        return {"status": "EXISTS", "tree_id": str(existing)}
+    try:
+        reg = _parse_registration(content_hash, latitude, longitude, phash, vector, model_version, tree_id,
+                                  submission_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        first_id, created = await backend.run_io(registrations.register, reg)
+    except OSError as e:
+        logger.error(f"Registration journal write failed: {e}")
+        raise HTTPException(status_code=503, detail="Registration could not be journaled; retry")
+    if not created:
+        return {"status": "EXISTS", "tree_id": str(first_id)}
+    _apply_registration(reg.record)
+    if registrations.full:
+        _flush_now.set()
+    return JSONResponse(status_code=202, content={"status": "REGISTERED", "tree_id": str(first_id),
+                                                  "pending": len(registrations)})
@@ -0,0 +1,244 @@
+"""Stage timings and metrics in the Prometheus text format.
+
+`stage(name)` (or the `timed(name)` decorator) times one step of a
+verification, excluding any stages nested in it. Inside a request scope the
+duration is observed in the `verify_stage_seconds` histogram right away and
+also kept per request for the `Server-Timing` header. On execution-backend
+workers, which may be separate processes, `collect` keeps the durations with
+the call's result and the serving process observes them with `record`, so all
+histograms live where `/metrics` is served. Outside any scope (warm-up,
+background threads) the duration is only observed.
+"""
+from __future__ import annotations
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += count
+                    le = _labels(self.labelnames, key, f'le="{_number(bound)}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total[0])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Callback:
+    """A gauge or counter whose value is read from `fn` at scrape time."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float], kind: str = 'gauge'):
+        self.name, self.help, self.fn, self.kind = name, help, fn, kind
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.fn())
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {_number(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'verify_stage_seconds', 'Time spent in each verification stage', ('stage',)))
+
+
+class _Scope:
+    def __init__(self, observe: bool):
+        self.observe = observe
+        self.timings: Dict[str, float] = {}  # stage -> seconds, summed over repeats
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+_SCOPE: ContextVar[Optional[_Scope]] = ContextVar('metrics_scope', default=None)
+
+
+def _add(name: str, seconds: float) -> None:
+    scope = _SCOPE.get()
+    if scope is None or scope.observe:
+        STAGE_SECONDS.observe(seconds, stage=name)
+    if scope is not None:
+        scope.add(name, seconds)
+
+
+# Time spent in stages nested inside the innermost running one, on this thread
+_CHILDREN: ContextVar[Optional[List[float]]] = ContextVar('metrics_children', default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a step. Nested stages (e.g. a lazy decode inside a model check) are
+    subtracted from the enclosing one, so each stage reports its own time."""
+    children = [0.0]
+    token = _CHILDREN.set(children)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _CHILDREN.reset(token)
+        parent = _CHILDREN.get()
+        if parent is not None:
+            parent[0] += elapsed
+        _add(name, max(0.0, elapsed - children[0]))
+
+
+def timed(name: str):
+    """Decorator form of `stage`."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+@contextmanager
+def request_scope() -> Iterator[Dict[str, float]]:
+    """Observe stages as they finish and collect them for this request."""
+    scope = _Scope(observe=True)
+    token = _SCOPE.set(scope)
+    try:
+        yield scope.timings
+    finally:
+        _SCOPE.reset(token)
+
+
+def collect(fn: Callable[..., Any], *args: Any) -> Tuple[Any, Dict[str, float], float]:
+    """`fn(*args)`, its stage timings (left for the caller to `record`) and its wall time."""
+    scope = _Scope(observe=False)
+    token = _SCOPE.set(scope)
+    start = time.perf_counter()
+    try:
+        return fn(*args), scope.timings, time.perf_counter() - start
+    finally:
+        _SCOPE.reset(token)
+
+
+def record(timings: Dict[str, float]) -> None:
+    """Observe timings collected on a worker, adding them to the current request."""
+    for name, seconds in timings.items():
+        _add(name, seconds)
+    parent = _CHILDREN.get()
+    if parent is not None:
+        parent[0] += sum(timings.values())
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ', '.join(f"{name};dur={seconds * 1000.0:.1f}" for name, seconds in timings.items())
+
+
+class RequestMetrics:
+    """ASGI middleware: one request scope per HTTP request, latency by route
+    template in `histogram` and, with `server_timing`, a `Server-Timing`
+    header listing the stages that ran before the response started."""
+
+    def __init__(self, app, histogram: Histogram, server_timing: bool = False):
+        self.app, self.histogram, self.server_timing = app, histogram, server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        with request_scope() as timings:
+            async def send_with_timing(message):
+                if message['type'] == 'http.response.start' and self.server_timing:
+                    value = server_timing({**timings, 'total': time.perf_counter() - start})
+                    message = {**message, 'headers': [*message.get('headers', []),
+                                                      (b'server-timing', value.encode('latin-1'))]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                # The router records the matched route in the scope; unmatched paths share one label
+                route = scope.get('route')
+                self.histogram.observe(time.perf_counter() - start, endpoint=getattr(route, 'path', 'other'))
@@ -0,0 +1,76 @@
+"""Convert stored `vector` lists of doubles to the compact `vector_bin` format.
+
+Run from ai-service/ with the usual MONGO_* environment:
+
+    python -m app.migrate_vectors [--dtype float16] [--batch-size 500] [--keep-list] [--dry-run]
+
+Documents are paged by `_id`, so the command can be interrupted and rerun;
+already converted documents are skipped.
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+from loguru import logger
+from pymongo import UpdateOne
+
+from .database import MongoRepo, VECTOR_DTYPE_CODES, VECTOR_STORE_DTYPE, encode_vector
+
+
+def migrate(repo: MongoRepo, dtype: str, batch_size: int = 500, keep_list: bool = False,
+            dry_run: bool = False) -> dict:
+    query = {'vector': {'$type': 'array', '$ne': []}}
+    if keep_list:
+        # Lists are left in place, so skip what was converted on an earlier run
+        query['vector_bin'] = {'$exists': False}
+    counts = {'converted': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_id = None
+    started = time.monotonic()
+    while True:
+        page = dict(query)
+        if last_id is not None:
+            page['_id'] = {'$gt': last_id}
+        docs = list(repo.coll.find(page, projection={'_id': 1, 'vector': 1}).sort('_id', 1).limit(batch_size))
+        if not docs:
+            break
+        ops = []
+        for d in docs:
+            blob = encode_vector(d['vector'], dtype)
+            update = {'$set': {'vector_bin': blob}}
+            if not keep_list:
+                update['$unset'] = {'vector': ''}
+            ops.append(UpdateOne({'_id': d['_id']}, update))
+            # BSON double array: per element 1 type byte + index key + 8 bytes
+            counts['bytes_before'] += sum(10 + len(str(i)) for i in range(len(d['vector'])))
+            counts['bytes_after'] += len(blob)
+        if not dry_run:
+            repo.coll.bulk_write(ops, ordered=False)
+        counts['converted'] += len(ops)
+        last_id = docs[-1]['_id']
+        logger.info(f"converted {counts['converted']} documents ({time.monotonic() - started:.1f}s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert stored tree vectors to compact binary")
+    parser.add_argument('--dtype', choices=sorted(VECTOR_DTYPE_CODES), default=VECTOR_STORE_DTYPE)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--keep-list', action='store_true', help='keep the legacy `vector` list alongside')
+    parser.add_argument('--dry-run', action='store_true', help='report sizes without writing')
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+    repo = MongoRepo()
+    repo.connect()
+    if not repo.probe():
+        raise SystemExit("MONGO_URI not set or Mongo unreachable")
+    counts = migrate(repo, args.dtype, args.batch_size, args.keep_list, args.dry_run)
+    ratio = counts['bytes_before'] / counts['bytes_after'] if counts['bytes_after'] else 0.0
+    logger.info(f"done: {counts['converted']} documents, vector bytes {counts['bytes_before']} -> "
+                f"{counts['bytes_after']} ({ratio:.1f}x smaller){' [dry run]' if args.dry_run else ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""ONNX Runtime execution for the image encoders.
+
+`Models` keeps its torch modules as the reference and, when INFER_BACKEND
+selects ONNX, swaps the encoder and CLIP image tower for `OrtModule`s: drop-in
+callables taking and returning torch tensors, so batching and post-processing
+are shared between backends. Graphs are exported from the loaded torch modules
+once and cached on disk; the int8 variant is produced from them by dynamic
+quantisation (int8 weights, activations quantised on the fly, no calibration
+data needed).
+"""
+from __future__ import annotations
+import os
+from typing import Optional
+
+import numpy as np
+import torch
+from loguru import logger
+
+try:
+    import onnxruntime as ort
+    ORT_OK = True
+except Exception:
+    ORT_OK = False
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+ONNX_OPSET = 17
+
+
+def export_onnx(module: torch.nn.Module, example: torch.Tensor, path: str) -> str:
+    """Export `module` with a dynamic batch dimension, written atomically."""
+    tmp = f"{path}.tmp"
+    # Not under no_grad: that sends nn.MultiheadAttention down a fused fast path ONNX cannot express
+    torch.onnx.export(
+        module, example, tmp,
+        input_names=['pixels'], output_names=['features'],
+        dynamic_axes={'pixels': {0: 'batch'}, 'features': {0: 'batch'}},
+        opset_version=ONNX_OPSET, dynamo=False,
+    )
+    os.replace(tmp, path)
+    return path
+
+
+def quantize_int8(src: str, dst: str) -> str:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    tmp = f"{dst}.tmp"
+    # Convolutions stay fp32: ConvInteger is slower than fp32 Conv on most CPUs
+    quantize_dynamic(src, tmp, weight_type=QuantType.QInt8, op_types_to_quantize=['MatMul', 'Gemm'])
+    os.replace(tmp, dst)
+    return dst
+
+
+def ensure_graph(module: torch.nn.Module, example: torch.Tensor, path: str, int8: bool) -> str:
+    """Path of the (quantised) graph for `module`, exporting it on first use."""
+    if not os.path.exists(path):
+        logger.info(f"Exporting ONNX graph to {path}…")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        export_onnx(module, example, path)
+    if not int8:
+        return path
+    qpath = path[:-len('.onnx')] + '.int8.onnx'
+    if not os.path.exists(qpath):
+        logger.info(f"Quantising {path} to int8…")
+        quantize_int8(path, qpath)
+    return qpath
+
+
+class OrtModule:
+    """An ONNX Runtime session behaving like an eval-mode torch module."""
+
+    def __init__(self, path: str, threads: Optional[int] = None):
+        if not ORT_OK:
+            raise RuntimeError("onnxruntime is not installed")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Follow torch's thread budget so process-mode workers split cores the same way
+        opts.intra_op_num_threads = threads or torch.get_num_threads()
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=['CPUExecutionProvider'])
+        self._input = self.session.get_inputs()[0].name
+
+    def __call__(self, pixels: torch.Tensor) -> torch.Tensor:
+        out = self.session.run(None, {self._input: np.ascontiguousarray(pixels.numpy(), dtype=np.float32)})[0]
+        return torch.from_numpy(out)
+
+    def eval(self) -> 'OrtModule':
+        return self
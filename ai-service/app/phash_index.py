@@ -0,0 +1,208 @@
+"""Packed 64-bit pHash index for Hamming-radius lookups.
+
+Hashes are held as a contiguous uint64 array and compared with a vectorised
+XOR + popcount. Radius queries over the whole collection use multi-index
+hashing: the 64 bits are split into 4 16-bit chunks, and any hash within
+distance k must match the query on at least one chunk to within k // 4 bits,
+so only the rows found by probing those chunk values are verified.
+
+`sync` pulls new and re-hashed trees by watermark; trees deleted or rejected
+since are dropped by `reconcile`, a full pass over the ids.
+"""
+from __future__ import annotations
+import threading
+from datetime import datetime
+from itertools import combinations
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Above this per-chunk radius probing costs more than scanning everything
+MAX_PROBE_RADIUS = 2
+
+
+def phash_to_int(h: str) -> Optional[int]:
+    try:
+        v = int(h, 16)
+    except (TypeError, ValueError):
+        return None
+    return v if 0 <= v < (1 << 64) else None
+
+
+def pack_hashes(hashes: Iterable[str]) -> np.ndarray:
+    """Hex pHashes -> uint64 array (unparseable hashes become 0)."""
+    return np.fromiter(((phash_to_int(h) or 0) for h in hashes), dtype=np.uint64)
+
+
+def hamming_many(query: int, codes: np.ndarray) -> np.ndarray:
+    """Hamming distance from one packed hash to each of `codes`."""
+    return np.bitwise_count(codes ^ np.uint64(query)).astype(np.int64)
+
+
+def pairwise_hamming(codes: np.ndarray) -> np.ndarray:
+    return np.bitwise_count(codes[:, None] ^ codes[None, :]).astype(np.int64)
+
+
+def first_similar_pair(hashes: Sequence[str], max_dist: int) -> Optional[Tuple[int, int]]:
+    """First (i, j), i < j in row-major order, whose hashes are within `max_dist`."""
+    if len(hashes) < 2:
+        return None
+    dists = pairwise_hamming(pack_hashes(hashes))
+    i_idx, j_idx = np.triu_indices(len(hashes), k=1)
+    hits = np.nonzero(dists[i_idx, j_idx] <= max_dist)[0]
+    if hits.size == 0:
+        return None
+    return int(i_idx[hits[0]]), int(j_idx[hits[0]])
+
+
+def _neighbours(value: int, radius: int) -> List[int]:
+    """All CHUNK_BITS-bit values within `radius` bit flips of `value`."""
+    out = [value]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            v = value
+            for b in bits:
+                v ^= 1 << b
+            out.append(v)
+    return out
+
+
+class PHashIndex:
+    def __init__(self):
+        self._codes = np.zeros(1024, dtype=np.uint64)
+        self._ids: List[str] = []
+        self._row: Dict[str, int] = {}
+        self._tables: List[Dict[int, List[int]]] = [dict() for _ in range(CHUNKS)]
+        self._lock = threading.RLock()
+        self.last_id: Optional[str] = None
+        self.last_ts: Optional[datetime] = None
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @staticmethod
+    def _chunks(code: int) -> List[int]:
+        return [(code >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+    def add(self, tree_id: Any, phash: str) -> None:
+        code = phash_to_int(phash)
+        if code is None:
+            return
+        key = str(tree_id)
+        with self._lock:
+            row = self._row.get(key)
+            if row is not None:
+                old = int(self._codes[row])
+                if old == code:
+                    return
+                for table, chunk in zip(self._tables, self._chunks(old)):
+                    table[chunk].remove(row)
+            else:
+                row = len(self._ids)
+                if row >= self._codes.shape[0]:
+                    grown = np.zeros(self._codes.shape[0] * 2, dtype=np.uint64)
+                    grown[:row] = self._codes[:row]
+                    self._codes = grown
+                self._ids.append(key)
+                self._row[key] = row
+            self._codes[row] = code
+            for table, chunk in zip(self._tables, self._chunks(code)):
+                table.setdefault(chunk, []).append(row)
+
+    def remove(self, ids: Iterable[Any]) -> int:
+        """Drop the given tree ids; the last row moves into each freed one. Returns how many were held."""
+        removed = 0
+        with self._lock:
+            for _id in ids:
+                row = self._row.pop(str(_id), None)
+                if row is None:
+                    continue
+                for table, chunk in zip(self._tables, self._chunks(int(self._codes[row]))):
+                    table[chunk].remove(row)
+                last = len(self._ids) - 1
+                if row != last:
+                    code = int(self._codes[last])
+                    for table, chunk in zip(self._tables, self._chunks(code)):
+                        rows = table[chunk]
+                        rows[rows.index(last)] = row
+                    self._codes[row] = code
+                    self._ids[row] = self._ids[last]
+                    self._row[self._ids[row]] = row
+                self._ids.pop()
+                removed += 1
+        return removed
+
+    def query(self, phash: str, max_dist: int, limit: int = 10) -> List[Tuple[str, int]]:
+        """(id, distance) of indexed hashes within `max_dist`, nearest first."""
+        code = phash_to_int(phash)
+        if code is None:
+            return []
+        with self._lock:
+            n = len(self._ids)
+            if n == 0:
+                return []
+            radius = max_dist // CHUNKS
+            if radius > MAX_PROBE_RADIUS:
+                rows = np.arange(n)
+            else:
+                cand = set()
+                for table, chunk in zip(self._tables, self._chunks(code)):
+                    for probe in _neighbours(chunk, radius):
+                        hit = table.get(probe)
+                        if hit:
+                            cand.update(hit)
+                if not cand:
+                    return []
+                rows = np.fromiter(cand, dtype=np.int64, count=len(cand))
+            dists = hamming_many(code, self._codes[rows])
+            keep = np.nonzero(dists <= max_dist)[0]
+            order = keep[np.argsort(dists[keep], kind='stable')][:limit]
+            return [(self._ids[rows[i]], int(dists[i])) for i in order]
+
+    def sync(self, repo) -> int:
+        """Pull trees added or re-hashed since the last watermark from `repo`."""
+        if not repo.is_connected():
+            return 0
+        total = 0
+        last_id, last_ts = self.last_id, self.last_ts
+        for rec in repo.iter_phashes(since_id=self.last_id, since_ts=self.last_ts):
+            self.add(rec.id, rec.phash)
+            total += 1
+            sid = str(rec.id)
+            if last_id is None or sid > last_id:
+                last_id = sid
+            if rec.updated_at is not None and (last_ts is None or rec.updated_at > last_ts):
+                last_ts = rec.updated_at
+        self.last_id, self.last_ts = last_id, last_ts
+        self.ready = True
+        if total:
+            logger.info(f"pHash index synced {total} hashes ({len(self)} total)")
+        return total
+
+    def reconcile(self, repo, keep: Iterable[Any] = ()) -> int:
+        """Drop trees no longer in `repo` (deleted, rejected or without a pHash), except those in `keep`.
+
+        `keep` holds trees applied before they reach Mongo (pending
+        registrations), taken before the call. Trees missing from the full scan
+        are looked up once more, so none written while it ran is dropped.
+        """
+        if not repo.is_connected():
+            return 0
+        keep = {str(k) for k in keep}
+        with self._lock:
+            held = set(self._row)
+        gone = held - repo.tree_ids('phash') - keep
+        if gone:
+            gone -= repo.tree_ids('phash', among=gone)
+        removed = self.remove(gone)
+        if removed:
+            logger.info(f"pHash index dropped {removed} deleted or rejected trees ({len(self)} total)")
+        return removed
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, "count": len(self), "last_id": self.last_id}
@@ -0,0 +1,243 @@
+"""CPU-bound verification steps, packaged to run on an execution backend worker.
+
+Functions here take raw upload bytes and return plain, picklable results so
+they can run in a thread or in a separate worker process. Location-dependent
+steps (geofence, dedupe against Mongo) stay in `main`.
+"""
+from __future__ import annotations
+import hashlib
+import contextvars
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from operator import attrgetter
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .ai_checks import (
+    Thresholds, ImageBundle, read_image_from_bytes, compute_phash, screen_tree_like,
+    is_tree_like, encode_feature_vector, error_level_analysis, blur_score_fft, blur_scores_many, orb_features,
+    orb_match_ratio,
+    model_version, load_clip_prompts, DECODE_MIN_SIDE, WORKING_MAX_SIDE,
+    FACE_DETECTOR, FACE_MODEL_PATH, FACE_SCORE_THRESHOLD, FACE_DETECT_MAX_SIDE,
+    ImageTooLarge, clip_tree_stats_many, encode_feature_vectors
+)
+from .forensics import ELA_MAX_SIDE, FORENSICS_VERSION
+from .phash_index import first_similar_pair
+
+# Threads for the independent per-view checks of a multi-view submission
+# (OpenCV, PIL and numpy release the GIL), shared by the requests of a worker
+VIEW_CHECK_THREADS = int(os.getenv('VIEW_CHECK_THREADS', '4'))
+_VIEW_POOL: Optional[ThreadPoolExecutor] = None
+_VIEW_POOL_LOCK = threading.Lock()
+
+
+@dataclass
+class ImageAnalysis:
+    tree_ok: bool
+    tree_score: float
+    tree_info: dict
+    phash: Optional[str] = None
+    vector: Optional[np.ndarray] = None  # shape (1, D)
+    # Set (by analyze_images only) when the upload could not be decoded
+    error: Optional[str] = None
+    # (tree id, distance) from analyze_image's `duplicate_of`: the model stages did not run
+    duplicate: Optional[Tuple[str, int]] = None
+
+
+@dataclass
+class ViewsAnalysis:
+    # First view failing the tree check, as (score, info); the set is rejected
+    failed_view: Optional[Tuple[float, dict]] = None
+    # First pair of views that are near-copies by pHash
+    similar_pair: Optional[Tuple[int, int]] = None
+    orb_ratios: List[float] = field(default_factory=list)
+    tree_scores: List[float] = field(default_factory=list)
+    phashes: List[str] = field(default_factory=list)
+    vectors: List[np.ndarray] = field(default_factory=list)
+    forensic: List[dict] = field(default_factory=list)
+
+
+@dataclass
+class Embedding:
+    """Stored artifacts recomputed for one image by `embed_images`."""
+    phash: Optional[str] = None
+    vector: Optional[np.ndarray] = None  # shape (D,)
+    error: Optional[str] = None
+
+
+def analysis_version(thresholds: Thresholds) -> str:
+    """Digest of every setting the results below depend on, for caching them."""
+    positive, negative = load_clip_prompts()
+    settings = {
+        "model": model_version(),
+        "prompts": [positive, negative],
+        "thresholds": asdict(thresholds),
+        "decode_min_side": DECODE_MIN_SIDE,
+        "working_max_side": WORKING_MAX_SIDE,
+        "face_detector": [FACE_DETECTOR, os.path.basename(FACE_MODEL_PATH), FACE_SCORE_THRESHOLD, FACE_DETECT_MAX_SIDE],
+        "forensics": [FORENSICS_VERSION, ELA_MAX_SIDE],
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def analyze_image(data: bytes, thresholds: Thresholds, explain: bool = False,
+                  duplicate_of: Optional[Callable[[str], Optional[Tuple[str, int]]]] = None) -> ImageAnalysis:
+    """Tree check, pHash and embedding of one upload; the tree check exits at the first failing stage.
+
+    With `duplicate_of` (pHash -> (tree id, distance) of a known duplicate, or
+    None) the cheap stages and the pHash run first and a duplicate is returned
+    as `duplicate` before CLIP and the encoder run. It must be callable on the
+    worker, so in practice only in thread mode. `explain` runs every stage of
+    the tree check for diagnostics.
+    """
+    # Decode once; every check below shares the bundle's derived views
+    img = ImageBundle(read_image_from_bytes(data))
+    known, phash = None, None
+    if duplicate_of is not None and not explain:
+        ok, known = screen_tree_like(img, thresholds)
+        if not ok:
+            return ImageAnalysis(tree_ok=False, tree_score=0.0, tree_info=known)
+        phash = compute_phash(img)
+        dup = duplicate_of(phash)
+        if dup is not None:
+            return ImageAnalysis(tree_ok=True, tree_score=0.0, tree_info=known, phash=phash, duplicate=dup)
+    ok, score, info = is_tree_like(img, thresholds, explain, known)
+    if not ok:
+        return ImageAnalysis(tree_ok=False, tree_score=score, tree_info=info)
+    return ImageAnalysis(
+        tree_ok=True,
+        tree_score=score,
+        tree_info=info,
+        phash=phash or compute_phash(img),
+        vector=encode_feature_vector(img),
+    )
+
+
+def analyze_images(datas: List[bytes], thresholds: Thresholds) -> List[ImageAnalysis]:
+    """`analyze_image` over several uploads with one forward pass per model.
+
+    The cheap stages of the tree check run first; CLIP then runs once over the
+    images passing them and the encoder once over those passing the tree
+    check (with EMBEDDING_MODEL=clip the CLIP features are the embeddings and
+    there is no second pass). An unreadable or oversized upload gets
+    an analysis with `error` set instead of failing the others.
+    """
+    out: List[Optional[ImageAnalysis]] = [None] * len(datas)
+    bundles = {}
+    for i, data in enumerate(datas):
+        try:
+            img = ImageBundle(read_image_from_bytes(data))
+            img.rgb  # force the decode so corrupt data fails here
+            bundles[i] = img
+        except ImageTooLarge as e:
+            out[i] = ImageAnalysis(tree_ok=False, tree_score=0.0, tree_info={"reason": "too_large"}, error=str(e))
+        except Exception as e:
+            out[i] = ImageAnalysis(tree_ok=False, tree_score=0.0, tree_info={"reason": "unreadable"}, error=str(e))
+    blur_scores_many(list(bundles.values()))
+    idx = []
+    for i, img in bundles.items():
+        ok, info = screen_tree_like(img, thresholds)
+        if ok:
+            idx.append(i)
+        else:
+            out[i] = ImageAnalysis(tree_ok=False, tree_score=0.0, tree_info=info)
+    clip_tree_stats_many([bundles[i] for i in idx])  # kept on each bundle for the tree check
+    passed = []
+    for i in idx:
+        ok, score, info = is_tree_like(bundles[i], thresholds)
+        out[i] = ImageAnalysis(tree_ok=ok, tree_score=score, tree_info=info)
+        if ok:
+            out[i].phash = compute_phash(bundles[i])
+            passed.append(i)
+    vecs = encode_feature_vectors([bundles[i] for i in passed])
+    for row, i in enumerate(passed):
+        out[i].vector = vecs[row:row + 1]
+    return out
+
+
+def embed_images(datas: List[bytes]) -> List[Embedding]:
+    """pHash and embedding for each image with one encoder pass, skipping the tree check."""
+    out = [Embedding() for _ in datas]
+    bundles = {}
+    for i, data in enumerate(datas):
+        try:
+            img = ImageBundle(read_image_from_bytes(data))
+            img.rgb  # force the decode so corrupt data fails here
+            bundles[i] = img
+        except Exception as e:
+            out[i].error = str(e) or type(e).__name__
+    idx = list(bundles)
+    vecs = encode_feature_vectors([bundles[i] for i in idx])
+    for row, i in enumerate(idx):
+        out[i].phash = compute_phash(bundles[i])
+        out[i].vector = vecs[row]
+    return out
+
+
+def _view_pool() -> ThreadPoolExecutor:
+    global _VIEW_POOL
+    if _VIEW_POOL is None:
+        with _VIEW_POOL_LOCK:
+            if _VIEW_POOL is None:
+                _VIEW_POOL = ThreadPoolExecutor(max_workers=VIEW_CHECK_THREADS, thread_name_prefix='view')
+    return _VIEW_POOL
+
+
+def _submit(fn: Callable[..., Any], *args: Any) -> Future:
+    # Each task runs in a copy of the caller's context so its stage timings reach the caller's scope
+    return _view_pool().submit(contextvars.copy_context().run, fn, *args)
+
+
+def _map(fn: Callable[..., Any], *iterables: Iterable) -> List[Any]:
+    return [f.result() for f in [_submit(fn, *args) for args in zip(*iterables)]]
+
+
+def analyze_views(datas: List[bytes], thresholds: Thresholds) -> ViewsAnalysis:
+    """Multi-view analysis, cheapest rejections first across every view.
+
+    The tree check's cheap stages (size, colour, blur, faces), then intra-set
+    pHash, are checked on every view before any model runs; the rest of the
+    tree check batches CLIP over all views, and the encoder pass runs
+    while ELA and ORB features are computed on the view pool. Blur and ORB
+    features are computed once per view and reused.
+    """
+    out = ViewsAnalysis()
+    # With the bytes, so ELA can decode at full resolution
+    imgs = [ImageBundle(read_image_from_bytes(data), data) for data in datas]
+
+    # Blur thumbnails (and the working views under them) in parallel, then one batched FFT
+    _map(attrgetter('blur_thumb'), imgs)
+    blur_scores_many(imgs)
+    for ok, info in _map(screen_tree_like, imgs, [thresholds] * len(imgs)):
+        if not ok:
+            out.failed_view = (0.0, info)
+            return out
+
+    # Intra-set duplicate check: ensure views are not trivial copies
+    out.phashes = _map(compute_phash, imgs)
+    out.similar_pair = first_similar_pair(out.phashes, thresholds.phash_max_hamming)
+    if out.similar_pair is not None:
+        return out
+
+    clip_tree_stats_many(imgs)
+    for ok, score, info in _map(is_tree_like, imgs, [thresholds] * len(imgs)):
+        if not ok:
+            out.failed_view = (score, info)
+            return out
+        out.tree_scores.append(score)
+
+    ela = [_submit(error_level_analysis, img) for img in imgs]
+    orb = [_submit(orb_features, img) for img in imgs]
+    vecs = encode_feature_vectors(imgs)
+    out.vectors = [vecs[i:i + 1] for i in range(len(imgs))]
+    out.forensic = [{"ela": f.result(), "blur": blur_score_fft(img)} for f, img in zip(ela, imgs)]
+
+    # Additional intra-set feature matching: ensure views are from same instance
+    for f in orb:
+        f.result()
+    out.orb_ratios = _map(orb_match_ratio, imgs[:-1], imgs[1:])
+    return out
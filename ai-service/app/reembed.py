@@ -0,0 +1,244 @@
+"""Recompute stored `phash` and embeddings from the original photos.
+
+Run from ai-service/ with the usual MONGO_* environment (and INFER_BACKEND,
+EXEC_MODE etc. as for the service):
+
+    python -m app.reembed --uploads ../uploads [--workers 4] [--batch-size 32]
+                          [--checkpoint reembed.json] [--force] [--limit N] [--dry-run]
+
+Each tree's photo is found in the backend's `uploads/` store, via the
+document's `imageUrl` or the `image` of its `metadataUri` JSON; trees whose
+photo is not stored locally are counted and left as they are. Updated
+documents get `model_version` (see `ai_checks.embedding_version`) and a new
+`updatedAt`, so running services pick the new vectors up on their next index
+sync.
+
+Documents are paged by `_id` and only those without the current
+`model_version` are selected (all of them with --force), so the job is safe to
+interrupt and rerun. Pages flow through a bounded pipeline: file reads and
+bulk writes on I/O threads, decode and batched inference on the execution
+backend's workers, with at most two batches per worker in flight. With
+--checkpoint, the last `_id` before which every batch has been written is
+saved after each batch and the next run resumes from it.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from loguru import logger
+from pymongo import UpdateOne
+
+from .ai_checks import embedding_version
+from .batch import resolve_path
+from .database import MongoRepo, VECTOR_DTYPE_CODES, VECTOR_STORE_DTYPE, encode_vector
+from .executor import ExecutionBackend
+from .pipeline import embed_images
+
+SOURCE_FIELDS = {'_id': 1, 'imageUrl': 1, 'metadataUri': 1}
+
+
+def _uploads_file(url: str, uploads_dir: str) -> Optional[str]:
+    # The backend serves stored files as <base>/uploads/<images|meta>/<name>
+    path = unquote(urlparse(url).path)
+    marker = '/uploads/'
+    at = path.find(marker)
+    if at < 0:
+        return None
+    try:
+        full = resolve_path(uploads_dir, path[at + len(marker):])
+    except ValueError:
+        return None
+    return full if os.path.isfile(full) else None
+
+
+def image_path(doc: dict, uploads_dir: str) -> Optional[str]:
+    """Local file of a tree's photo in the uploads store, if there is one."""
+    url = doc.get('imageUrl')
+    if not url and doc.get('metadataUri'):
+        meta_path = _uploads_file(doc['metadataUri'], uploads_dir)
+        if meta_path:
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as fh:
+                    url = json.load(fh).get('image')
+            except (OSError, ValueError, AttributeError):
+                url = None
+    if not isinstance(url, str) or not url:
+        return None
+    return _uploads_file(url, uploads_dir)
+
+
+def _read_images(docs: List[dict], uploads_dir: str) -> Tuple[List[Tuple[Any, bytes]], int]:
+    found, missing = [], 0
+    for d in docs:
+        path = image_path(d, uploads_dir)
+        if path is None:
+            missing += 1
+            continue
+        try:
+            with open(path, 'rb') as fh:
+                found.append((d['_id'], fh.read()))
+        except OSError as e:
+            logger.warning(f"tree {d['_id']}: cannot read {path}: {e}")
+            missing += 1
+    return found, missing
+
+
+def _fetch_page(repo: MongoRepo, query: dict, after: Any, size: int) -> List[dict]:
+    page = dict(query)
+    if after is not None:
+        page['_id'] = {'$gt': after}
+    return list(repo.coll.find(page, projection=SOURCE_FIELDS).sort('_id', 1).limit(size))
+
+
+def _load_checkpoint(path: str, version: str, force: bool) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            state = json.load(fh)
+    except FileNotFoundError:
+        return {}
+    if state.get('model_version') != version or state.get('force') != force:
+        logger.info(f"Checkpoint {path} is for another run ({state.get('model_version')}); starting over")
+        return {}
+    return state
+
+
+def _save_checkpoint(path: str, state: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(state, fh, indent=2)
+    os.replace(tmp, path)
+
+
+def _decode_id(value: Any) -> Any:
+    return ObjectId(value) if isinstance(value, str) and ObjectId.is_valid(value) else value
+
+
+async def _process(docs: List[dict], repo: MongoRepo, backend: ExecutionBackend, uploads_dir: str,
+                   version: str, dtype: str, dry_run: bool) -> Counter:
+    counts: Counter = Counter(scanned=len(docs))
+    found, counts['missing'] = await backend.run_io(_read_images, docs, uploads_dir)
+    if not found:
+        return counts
+    results = await backend.run_cpu(embed_images, [data for _, data in found])
+    now = datetime.now(timezone.utc)
+    ops = []
+    for (tree_id, _), emb in zip(found, results):
+        if emb.error is not None:
+            logger.warning(f"tree {tree_id}: {emb.error}")
+            counts['failed'] += 1
+            continue
+        ops.append(UpdateOne({'_id': tree_id}, {
+            '$set': {
+                'phash': emb.phash,
+                'vector_bin': encode_vector(emb.vector, dtype),
+                'model_version': version,
+                'updatedAt': now,
+            },
+            # A legacy list would be from the previous model
+            '$unset': {'vector': ''},
+        }))
+    if ops and not dry_run:
+        await backend.run_io(partial(repo.coll.bulk_write, ops, ordered=False))
+    counts['embedded'] += len(ops)
+    return counts
+
+
+async def reembed(repo: MongoRepo, uploads_dir: str, backend: ExecutionBackend, batch_size: int = 32,
+                  checkpoint: Optional[str] = None, force: bool = False, limit: Optional[int] = None,
+                  dry_run: bool = False, dtype: str = VECTOR_STORE_DTYPE) -> dict:
+    version = embedding_version()
+    query = {} if force else {'model_version': {'$ne': version}}
+    state = _load_checkpoint(checkpoint, version, force) if checkpoint else {}
+    after = _decode_id(state.get('last_id'))
+    totals: Counter = Counter(state.get('counts', {}))  # across resumed runs
+    counts: Counter = Counter()
+    remaining = await backend.run_io(repo.coll.count_documents, {**query, '_id': {'$gt': after}} if after else query)
+    if limit:
+        remaining = min(remaining, limit)
+    logger.info(f"Re-embedding up to {remaining} trees as {version}"
+                f"{f' from after {after}' if after else ''}{' [dry run]' if dry_run else ''}")
+
+    started = time.monotonic()
+    pending: deque = deque()
+    max_in_flight = 2 * backend.pool_size
+    fetched = 0
+
+    async def finish_oldest():
+        last_id, task = pending.popleft()
+        batch = await task
+        counts.update(batch)
+        totals.update(batch)
+        if checkpoint and not dry_run:
+            # Batches are collected in order, so everything up to last_id is written
+            _save_checkpoint(checkpoint, {'model_version': version, 'force': force,
+                                          'last_id': str(last_id), 'counts': dict(totals)})
+        done = counts['scanned']
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (remaining - done) / rate if rate > 0 else 0.0
+        logger.info(f"{done}/{remaining} scanned, {counts['embedded']} embedded, {counts['missing']} without a "
+                    f"local photo, {counts['failed']} failed ({rate:.1f} trees/s, ETA {eta / 60:.0f} min)")
+
+    try:
+        while not limit or fetched < limit:
+            size = batch_size if not limit else min(batch_size, limit - fetched)
+            docs = await backend.run_io(_fetch_page, repo, query, after, size)
+            if not docs:
+                break
+            after = docs[-1]['_id']
+            fetched += len(docs)
+            pending.append((after, asyncio.ensure_future(
+                _process(docs, repo, backend, uploads_dir, version, dtype, dry_run))))
+            while len(pending) >= max_in_flight:
+                await finish_oldest()
+        while pending:
+            await finish_oldest()
+    finally:
+        for _, task in pending:
+            task.cancel()
+    return {'model_version': version, **{k: counts[k] for k in ('scanned', 'embedded', 'missing', 'failed')},
+            'seconds': round(time.monotonic() - started, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute stored tree pHashes and embeddings")
+    parser.add_argument('--uploads', required=True, help="the backend's uploads/ directory")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('EXEC_POOL_SIZE', '0')) or None,
+                        help='decode/inference workers (default: EXEC_POOL_SIZE, else CPU count)')
+    parser.add_argument('--mode', choices=('thread', 'process'), default=os.getenv('EXEC_MODE', 'process'),
+                        help='worker type (default: EXEC_MODE, else process)')
+    parser.add_argument('--batch-size', type=int, default=32, help='trees per inference batch (default: %(default)s)')
+    parser.add_argument('--checkpoint', help='JSON file to resume from and record progress in')
+    parser.add_argument('--force', action='store_true', help='also redo trees already at the current model_version')
+    parser.add_argument('--limit', type=int, help='stop after this many trees')
+    parser.add_argument('--dtype', choices=sorted(VECTOR_DTYPE_CODES), default=VECTOR_STORE_DTYPE)
+    parser.add_argument('--dry-run', action='store_true', help='compute without writing')
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+    repo = MongoRepo()
+    repo.connect()
+    if not repo.probe():
+        raise SystemExit("MONGO_URI not set or Mongo unreachable")
+    # Batches are bounded here, so the backend's admission limits never shed
+    backend = ExecutionBackend(mode=args.mode, pool_size=args.workers, shed_threshold=1 << 30)
+    try:
+        result = asyncio.run(reembed(repo, args.uploads, backend, args.batch_size, args.checkpoint,
+                                     args.force, args.limit, args.dry_run, args.dtype))
+    finally:
+        backend.shutdown()
+    logger.info(f"done: {json.dumps(result)}")
+
+
+if __name__ == '__main__':
+    main()
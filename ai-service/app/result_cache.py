@@ -0,0 +1,176 @@
+"""Content-addressed cache of per-upload analysis results.
+
+Keys are digests of the raw upload bytes combined with an analysis version
+(model identity, prompts, thresholds, decode settings), so a changed setting
+can never serve a stale result. Values are the location-independent outputs
+of `pipeline` (tree check, pHash, embedding); geofence and dedupe still run on
+every request.
+
+The memory tier is an LRU bounded by entry count with a per-entry TTL. The
+optional disk tier keeps pickles under `disk_dir`, which must be private to
+the service, and is pruned by age and total size.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+from loguru import logger
+
+
+def content_key(version: str, kind: str, digests: Iterable[str]) -> str:
+    h = hashlib.sha256()
+    for part in (version, kind, *digests):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 6 * 3600,
+                 disk_dir: Optional[str] = None, disk_max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._mem: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached value for `key`, or None. Blocking when the disk tier is on."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._mem[key]
+        value = self._disk_get(key) if self.disk_dir else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._mem_put(key, value)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        self._mem_put(key, value)
+        if self.disk_dir:
+            self._disk_put(key, value)
+
+    def _mem_put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._mem[key] = (time.monotonic() + self.ttl, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+                self.evictions += 1
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as fh:
+                return pickle.load(fh)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Result cache: dropping unreadable entry {key}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _disk_put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as fh:
+                pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Result cache: disk write failed: {e}")
+            return
+        with self._lock:
+            self._puts_since_prune += 1
+            prune = self._puts_since_prune >= 256
+            if prune:
+                self._puts_since_prune = 0
+        if prune:
+            self.prune_disk()
+
+    def prune_disk(self) -> int:
+        """Drop expired entries, then the oldest until under `disk_max_bytes`."""
+        if not self.disk_dir:
+            return 0
+        entries = []
+        for root, _dirs, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        cutoff = time.time() - self.ttl
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if mtime >= cutoff and total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "disk": self.disk_dir is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,72 @@
+"""Model weights memory-mapped from disk, so worker processes share one copy.
+
+Every worker process (EXEC_MODE=process, or several uvicorn workers) would
+otherwise hold private copies of the EfficientNet and CLIP weights. Here the
+first process to load a model writes its tensors to `weights_dir`, under a
+file lock so concurrent workers write it once. Every process then builds
+the module on the meta device (no weight allocation, no random init) and
+maps the file with `torch.load(mmap=True)`. The pages are backed by the
+file, so the kernel keeps one copy in the page cache for all processes.
+Inference never writes to parameters, so no page is ever copied.
+"""
+from __future__ import annotations
+import fcntl
+import os
+from contextlib import contextmanager
+from itertools import chain
+from typing import Callable, Dict
+
+import torch
+from loguru import logger
+
+
+@contextmanager
+def _file_lock(path: str):
+    with open(path, 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def save_weights(module: torch.nn.Module, path: str) -> None:
+    """Write every tensor of `module`, non-persistent buffers included, atomically."""
+    tensors = module.state_dict()
+    tensors.update({name: buf for name, buf in module.named_buffers() if name not in tensors})
+    tmp = f'{path}.{os.getpid()}.tmp'
+    torch.save(tensors, tmp)
+    os.replace(tmp, path)
+
+
+def assign_weights(module: torch.nn.Module, tensors: Dict[str, torch.Tensor]) -> None:
+    """Make `tensors` the module's parameters and buffers, without copying them."""
+    persistent = set(module.state_dict())
+    module.load_state_dict({k: v for k, v in tensors.items() if k in persistent}, assign=True)
+    for name, value in tensors.items():
+        if name not in persistent:
+            owner, _, leaf = name.rpartition('.')
+            module.get_submodule(owner).register_buffer(leaf, value, persistent=False)
+    missing = [name for name, t in chain(module.named_parameters(), module.named_buffers()) if t.is_meta]
+    if missing:
+        raise RuntimeError(f"shared weights lack {len(missing)} tensors, e.g. {missing[0]}")
+
+
+def load_shared(name: str, build: Callable[[], torch.nn.Module], pretrained: Callable[[], torch.nn.Module],
+                weights_dir: str) -> torch.nn.Module:
+    """`build()` with its weights mapped from `<weights_dir>/<name>.pt`.
+
+    The file is written from `pretrained()` the first time. `build` must
+    construct the same architecture and work on the meta device.
+    """
+    path = os.path.join(weights_dir, f'{name}.pt')
+    if not os.path.exists(path):
+        os.makedirs(weights_dir, exist_ok=True)
+        with _file_lock(os.path.join(weights_dir, '.lock')):
+            if not os.path.exists(path):
+                logger.info(f"Writing shared weights {path}…")
+                save_weights(pretrained(), path)
+    with torch.device('meta'):
+        module = build()
+    assign_weights(module, torch.load(path, map_location='cpu', mmap=True, weights_only=True))
+    return module.eval()
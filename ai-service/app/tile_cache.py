@@ -0,0 +1,294 @@
+"""In-process cache of geofence lookups, by grid tile.
+
+Trees are cached per square tile of the `batch.geo_cell` grid: ids, locations,
+pHashes and, when requested, the decoded L2-normalised embedding matrix of
+every tree in the tile. A geofence query is answered from the tiles its circle
+overlaps plus a haversine filter, so repeated submissions around one planting
+site need no Mongo round trip and no vector decoding.
+
+Mongo stays the source of truth. Cached tiles follow the collection's change
+stream (inserts and updates are applied in place, deletes drop the tree) and
+`upsert`/`remove` apply writes made by this service directly. Change streams
+need a replica set (Atlas always is one); without a live stream the cache is
+bypassed, unless `allow_unwatched` is set, in which case tiles are trusted
+for `ttl_seconds` and other writers' trees may be missed until they expire.
+Tiles holding `tile_limit` or more trees are not cached and always query Mongo.
+"""
+from __future__ import annotations
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from .batch import M_PER_DEG_LAT, Cell, cell_center, cell_query_radius, geo_cell
+from .database import ChangeStreamUnsupported, NearbyTrees, RepoUnavailable, TreeRecord
+from .metrics import timed
+from .vector_index import haversine_m
+
+MAX_TILES_PER_QUERY = 16
+
+
+@dataclass
+class _Tile:
+    records: List[TreeRecord]
+    lats: np.ndarray
+    lons: np.ndarray
+    has_vectors: bool
+    loaded_at: float
+    dense: bool = False  # too many trees to cache; queries go to Mongo
+
+
+class TileCache:
+    def __init__(self, cell_m: float = 250.0, max_trees: int = 200_000, ttl_seconds: float = 300.0,
+                 tile_limit: int = 2000, allow_unwatched: bool = False):
+        self.cell_m = cell_m
+        self.max_trees = max_trees
+        self.ttl_seconds = ttl_seconds
+        self.tile_limit = tile_limit
+        self.allow_unwatched = allow_unwatched
+        self._tiles: "OrderedDict[Cell, _Tile]" = OrderedDict()  # LRU order
+        self._cell_of: Dict[Any, Cell] = {}  # tree id -> cached tile, for updates and deletes
+        # Bumped by every change to a tile, so a load racing with a change is not cached
+        self._versions: Dict[Cell, int] = {}
+        self._loading: Dict[Cell, threading.Lock] = {}
+        self._trees = 0
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self.watching = False
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.changes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_trees > 0
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and (self.watching or self.allow_unwatched)
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def covering(self, lat: float, lon: float, radius_m: float) -> List[Cell]:
+        """Tiles that the circle of `radius_m` around (lat, lon) overlaps."""
+        dlat = radius_m / M_PER_DEG_LAT
+        dlon = radius_m / (M_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        (r0, _), (r1, _) = geo_cell(lat - dlat, lon, self.cell_m), geo_cell(lat + dlat, lon, self.cell_m)
+        cells = []
+        for row in range(r0, r1 + 1):
+            # Column widths vary by row, so take each row's own column span
+            lat_r = cell_center((row, 0), self.cell_m)[0]
+            c0, c1 = geo_cell(lat_r, lon - dlon, self.cell_m)[1], geo_cell(lat_r, lon + dlon, self.cell_m)[1]
+            cells.extend((row, col) for col in range(c0, c1 + 1))
+        return cells
+
+    @timed('tile_cache')
+    def find_nearby(self, repo, lat: float, lon: float, radius_m: float, with_vectors: bool = True,
+                    limit: int = 100) -> NearbyTrees:
+        """`repo.find_nearby`, answered from cached tiles when possible."""
+        cells = self.covering(lat, lon, radius_m) if self.active else []
+        if not cells or len(cells) > MAX_TILES_PER_QUERY:
+            self.bypassed += 1
+            return repo.find_nearby(lat, lon, radius_m, with_vectors, limit)
+        tiles = []
+        for cell in cells:
+            tile = self._tile(repo, cell, with_vectors)
+            if tile.dense:
+                self.bypassed += 1
+                return repo.find_nearby(lat, lon, radius_m, with_vectors, limit)
+            tiles.append(tile)
+        return self._query(tiles, lat, lon, radius_m, with_vectors, limit)
+
+    @staticmethod
+    def _query(tiles: List[_Tile], lat: float, lon: float, radius_m: float, with_vectors: bool,
+               limit: int) -> NearbyTrees:
+        records = [rec for tile in tiles for rec in tile.records]
+        if not records:
+            return NearbyTrees(vectors=np.empty((0, 0), dtype=np.float32) if with_vectors else None)
+        dists = haversine_m(lat, lon, np.concatenate([t.lats for t in tiles]), np.concatenate([t.lons for t in tiles]))
+        keep = np.nonzero(dists <= radius_m)[0]
+        # Nearest first, like $near
+        out = NearbyTrees(records=[records[i] for i in keep[np.argsort(dists[keep], kind='stable')][:limit]])
+        if with_vectors:
+            with_vec = [rec for rec in out.records if rec.vector is not None]
+            out.vectors = np.stack([rec.vector for rec in with_vec]) if with_vec else np.empty((0, 0), np.float32)
+            out.vector_ids = [rec.id for rec in with_vec]
+        return out
+
+    def _fresh(self, tile: Optional[_Tile], with_vectors: bool) -> bool:
+        return (tile is not None and time.monotonic() - tile.loaded_at < self.ttl_seconds
+                and (tile.has_vectors or tile.dense or not with_vectors))
+
+    def _tile(self, repo, cell: Cell, with_vectors: bool) -> _Tile:
+        with self._lock:
+            tile = self._tiles.get(cell)
+            if self._fresh(tile, with_vectors):
+                self._tiles.move_to_end(cell)
+                self.hits += 1
+                return tile
+            load_lock = self._loading.setdefault(cell, threading.Lock())
+        # One load per tile; concurrent requests for it wait and then hit
+        with load_lock:
+            with self._lock:
+                tile = self._tiles.get(cell)
+                if self._fresh(tile, with_vectors):
+                    self.hits += 1
+                    return tile
+                self.misses += 1
+                version = self._versions.get(cell, 0)
+            try:
+                tile = self._load(repo, cell, with_vectors)
+                with self._lock:
+                    if self._versions.get(cell, 0) == version and self.active:
+                        self._store(cell, tile)
+            finally:
+                with self._lock:
+                    self._loading.pop(cell, None)
+            return tile
+
+    def _load(self, repo, cell: Cell, with_vectors: bool) -> _Tile:
+        lat_c, lon_c = cell_center(cell, self.cell_m)
+        found = repo.find_nearby(lat_c, lon_c, cell_query_radius(self.cell_m, 0.0), with_vectors, self.tile_limit)
+        now = time.monotonic()
+        if len(found) >= self.tile_limit:
+            return _Tile([], np.empty(0), np.empty(0), with_vectors, now, dense=True)
+        # The query circle overlaps neighbouring tiles; keep this tile's trees only
+        records = [rec for rec in found if geo_cell(rec.lat, rec.lon, self.cell_m) == cell]
+        if with_vectors:
+            # Compact copy, so the tile does not pin the neighbours' rows of the query matrix
+            with_vec = [rec for rec in records if rec.vector is not None]
+            mat = np.stack([rec.vector for rec in with_vec]) if with_vec else None
+            row = 0
+            for rec in records:
+                if rec.vector is not None:
+                    rec.vector = mat[row]
+                    row += 1
+        return _Tile(records, np.asarray([r.lat for r in records], dtype=np.float64),
+                     np.asarray([r.lon for r in records], dtype=np.float64), with_vectors, now)
+
+    def _store(self, cell: Cell, tile: _Tile) -> None:
+        self._drop(cell)
+        self._tiles[cell] = tile
+        self._trees += len(tile.records)
+        for rec in tile.records:
+            self._cell_of[rec.id] = cell
+        while self._trees > self.max_trees and len(self._tiles) > 1:
+            self._drop(next(iter(self._tiles)))
+
+    def _drop(self, cell: Cell) -> None:
+        tile = self._tiles.pop(cell, None)
+        if tile is None:
+            return
+        self._trees -= len(tile.records)
+        for rec in tile.records:
+            if self._cell_of.get(rec.id) == cell:
+                del self._cell_of[rec.id]
+
+    def _bump(self, cell: Cell) -> None:
+        self._versions[cell] = self._versions.get(cell, 0) + 1
+
+    def upsert(self, rec: TreeRecord) -> None:
+        """Apply a written tree: it replaces any earlier version and joins its tile if cached."""
+        with self._lock:
+            self.remove(rec.id)
+            cell = geo_cell(rec.lat, rec.lon, self.cell_m)
+            self._bump(cell)
+            tile = self._tiles.get(cell)
+            if tile is None or tile.dense:
+                return
+            if len(tile.records) + 1 >= self.tile_limit:
+                self._drop(cell)
+                return
+            # Copy-on-write: queries in flight keep the previous lists
+            if not tile.has_vectors:
+                rec = replace(rec, vector=None)
+            self._tiles[cell] = replace(tile, records=tile.records + [rec], lats=np.append(tile.lats, rec.lat),
+                                        lons=np.append(tile.lons, rec.lon))
+            self._cell_of[rec.id] = cell
+            self._trees += 1
+
+    def remove(self, tree_id: Any) -> None:
+        """Drop a deleted (or moved) tree from its cached tile."""
+        with self._lock:
+            cell = self._cell_of.pop(tree_id, None)
+            if cell is None:
+                # A delete only carries the id: it may be in a tile still loading
+                for loading in self._loading:
+                    self._bump(loading)
+                return
+            self._bump(cell)
+            tile = self._tiles.get(cell)
+            if tile is None:
+                return
+            keep = [i for i, rec in enumerate(tile.records) if rec.id != tree_id]
+            self._tiles[cell] = replace(tile, records=[tile.records[i] for i in keep],
+                                        lats=tile.lats[keep], lons=tile.lons[keep])
+            self._trees -= len(tile.records) - len(keep)
+
+    def clear(self) -> None:
+        with self._lock:
+            for cell in list(self._tiles):
+                self._bump(cell)
+            self._tiles.clear()
+            self._cell_of.clear()
+            self._trees = 0
+
+    def watch(self, repo) -> None:
+        """Apply the collection's change stream to cached tiles until `stop()`; blocks, so run it on its own thread."""
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                for op, tree_id, rec in repo.watch_changes():
+                    if self._stop.is_set():
+                        break
+                    if not self.watching:
+                        self.watching, failures = True, 0
+                        logger.info("Tile cache following the tree change stream")
+                    if op is None:
+                        continue
+                    self.changes += 1
+                    if op != 'delete' and rec is not None:
+                        self.upsert(rec)
+                    else:
+                        self.remove(tree_id)
+            except ChangeStreamUnsupported as e:
+                self._unwatched()
+                logger.warning(f"No change streams on this deployment ({e}); tile cache "
+                               f"{'trusts tiles for the TTL' if self.allow_unwatched else 'bypassed'}")
+                return
+            except RepoUnavailable as e:
+                logger.warning(f"Tile cache change stream lost ({e}); retrying")
+            self._unwatched()
+            failures += 1
+            self._stop.wait(min(30.0, 0.5 * 2 ** min(failures, 6)))
+
+    def _unwatched(self) -> None:
+        # Changes may have been missed, so nothing cached so far can be trusted
+        if self.watching:
+            self.watching = False
+            self.clear()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "active": self.active,
+            "watching": self.watching,
+            "cell_m": self.cell_m,
+            "tiles": len(self._tiles),
+            "trees": self._trees,
+            "max_trees": self.max_trees,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "changes": self.changes
+        }
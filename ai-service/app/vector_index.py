@@ -0,0 +1,324 @@
+"""In-memory nearest-neighbour index over tree embeddings.
+
+Mongo stays the source of truth: the index is warmed from it, kept in sync
+incrementally, and optionally snapshotted to disk so restarts only need to
+fetch what changed. Trees deleted or rejected since they were indexed,
+including while a snapshot was on disk, are dropped by `reconcile`. Vectors
+are stored L2-normalised as float32, so cosine similarity is a dot product.
+
+With `hnswlib` installed, global top-k queries go through an HNSW graph;
+otherwise they fall back to an exact scan over the contiguous matrix.
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+try:
+    import hnswlib
+    HNSW_OK = True
+except Exception:
+    HNSW_OK = False
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def normalize_rows(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    def __init__(self, use_hnsw: bool = True, hnsw_m: int = 16, ef_construction: int = 200, ef_search: int = 64,
+                 model_version: Optional[str] = None):
+        # Embedding model of the vectors held; snapshots of another are not loaded
+        self.model_version = model_version
+        self.use_hnsw = use_hnsw and HNSW_OK
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.dim: Optional[int] = None
+        self._vecs = np.empty((0, 0), dtype=np.float32)
+        self._lats = np.empty(0, dtype=np.float64)
+        self._lons = np.empty(0, dtype=np.float64)
+        self._ids: List[str] = []
+        self._row: Dict[str, int] = {}
+        self._hnsw = None
+        self._lock = threading.RLock()
+        # Sync watermark: newest ObjectId / updatedAt seen
+        self.last_id: Optional[str] = None
+        self.last_ts: Optional[datetime] = None
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _grow(self, needed: int) -> None:
+        cap = self._vecs.shape[0]
+        if needed <= cap:
+            return
+        new_cap = max(needed, cap * 2, 1024)
+        vecs = np.zeros((new_cap, self.dim), dtype=np.float32)
+        vecs[:len(self._ids)] = self._vecs[:len(self._ids)]
+        lats = np.zeros(new_cap, dtype=np.float64)
+        lats[:len(self._ids)] = self._lats[:len(self._ids)]
+        lons = np.zeros(new_cap, dtype=np.float64)
+        lons[:len(self._ids)] = self._lons[:len(self._ids)]
+        self._vecs, self._lats, self._lons = vecs, lats, lons
+        if self._hnsw is not None:
+            # The graph also holds removed trees' tombstones, which can outnumber the rows
+            self._hnsw.resize_index(max(new_cap, self._hnsw.get_current_count()))
+
+    def _ensure_hnsw(self) -> None:
+        if not self.use_hnsw or self._hnsw is not None:
+            return
+        index = hnswlib.Index(space='ip', dim=self.dim)
+        index.init_index(max_elements=max(self._vecs.shape[0], 1024), ef_construction=self.ef_construction, M=self.hnsw_m)
+        index.set_ef(self.ef_search)
+        n = len(self._ids)
+        if n:
+            index.add_items(self._vecs[:n], np.arange(n))
+        self._hnsw = index
+
+    def add(self, ids: List[Any], vectors: np.ndarray, lats: np.ndarray, lons: np.ndarray) -> None:
+        """Insert or replace embeddings for the given tree ids."""
+        if not len(ids):
+            return
+        vecs = normalize_rows(vectors)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vecs.shape[1]
+                self._vecs = np.empty((0, self.dim), dtype=np.float32)
+            if vecs.shape[1] != self.dim:
+                raise ValueError(f"vector dim {vecs.shape[1]} does not match index dim {self.dim}")
+            rows = []
+            for _id in ids:
+                key = str(_id)
+                row = self._row.get(key)
+                if row is None:
+                    row = len(self._ids)
+                    self._grow(row + 1)
+                    self._ids.append(key)
+                    self._row[key] = row
+                rows.append(row)
+            rows_arr = np.asarray(rows)
+            self._vecs[rows_arr] = vecs
+            self._lats[rows_arr] = lats
+            self._lons[rows_arr] = lons
+            self._ensure_hnsw()
+            if self._hnsw is not None:
+                # Re-adding an existing label replaces its vector
+                self._hnsw.add_items(vecs, rows_arr)
+
+    def remove(self, ids: Iterable[Any]) -> int:
+        """Drop the given tree ids; the last row moves into each freed one. Returns how many were held."""
+        removed = 0
+        with self._lock:
+            for _id in ids:
+                row = self._row.pop(str(_id), None)
+                if row is None:
+                    continue
+                last = len(self._ids) - 1
+                if row != last:
+                    self._vecs[row] = self._vecs[last]
+                    self._lats[row] = self._lats[last]
+                    self._lons[row] = self._lons[last]
+                    self._ids[row] = self._ids[last]
+                    self._row[self._ids[row]] = row
+                    if self._hnsw is not None:
+                        self._hnsw.add_items(self._vecs[row:row + 1], np.asarray([row]))
+                if self._hnsw is not None:
+                    # Tombstoned until a later add reuses the label
+                    self._hnsw.mark_deleted(last)
+                self._ids.pop()
+                removed += 1
+        return removed
+
+    def get(self, ids: Iterable[Any]) -> Tuple[List[Any], np.ndarray, List[Any]]:
+        """Split `ids` into (found ids, their normalised vectors, ids not in the index)."""
+        found, rows, missing = [], [], []
+        with self._lock:
+            for _id in ids:
+                row = self._row.get(str(_id))
+                if row is None:
+                    missing.append(_id)
+                else:
+                    found.append(_id)
+                    rows.append(row)
+            dim = self.dim or 0
+            mat = self._vecs[np.asarray(rows, dtype=np.int64)] if rows else np.empty((0, dim), dtype=np.float32)
+        return found, mat, missing
+
+    def search(self, query: np.ndarray, k: int = 5, lat: Optional[float] = None, lon: Optional[float] = None,
+               radius_m: Optional[float] = None) -> List[Tuple[str, float, Optional[float]]]:
+        """Top-k (id, cosine, distance_m) for `query`.
+
+        With `radius_m`, only trees within that distance of (lat, lon) are scored
+        (exact). Without it the whole collection is searched ("global" mode).
+        `distance_m` is filled in whenever lat/lon are given.
+        """
+        q = normalize_rows(query)[0]
+        with self._lock:
+            n = len(self._ids)
+            if n == 0 or self.dim is None or q.shape[0] != self.dim:
+                return []
+            if radius_m is not None and lat is not None and lon is not None:
+                dists = haversine_m(lat, lon, self._lats[:n], self._lons[:n])
+                rows = np.nonzero(dists <= radius_m)[0]
+                if rows.size == 0:
+                    return []
+                sims = self._vecs[rows] @ q
+                order = np.argsort(-sims)[:k]
+                return [(self._ids[rows[i]], float(sims[i]), float(dists[rows[i]])) for i in order]
+            if self._hnsw is not None:
+                labels, distances = self._hnsw.knn_query(q, k=min(k, n))
+                rows = labels[0].astype(np.int64)
+                sims = 1.0 - distances[0]  # 'ip' space returns 1 - <a, b>
+            else:
+                all_sims = self._vecs[:n] @ q
+                kk = min(k, n)
+                rows = np.argpartition(-all_sims, kk - 1)[:kk]
+                rows = rows[np.argsort(-all_sims[rows])]
+                sims = all_sims[rows]
+            out = []
+            for row, sim in zip(rows, sims):
+                dist = None
+                if lat is not None and lon is not None:
+                    dist = float(haversine_m(lat, lon, self._lats[row:row + 1], self._lons[row:row + 1])[0])
+                out.append((self._ids[row], float(sim), dist))
+            return out
+
+    def sync(self, repo, chunk: int = 2000) -> int:
+        """Pull trees added or re-embedded since the last watermark from `repo`."""
+        if not repo.is_connected():
+            return 0
+        total = 0
+        buf = []
+
+        def flush():
+            nonlocal total
+            if not buf:
+                return
+            self.add([r.id for r in buf], np.asarray([r.vector for r in buf], dtype=np.float32),
+                     np.asarray([r.lat for r in buf]), np.asarray([r.lon for r in buf]))
+            total += len(buf)
+            buf.clear()
+
+        last_id, last_ts = self.last_id, self.last_ts
+        for rec in repo.iter_embeddings(since_id=self.last_id, since_ts=self.last_ts):
+            buf.append(rec)
+            sid = str(rec.id)
+            if last_id is None or sid > last_id:
+                last_id = sid
+            if rec.updated_at is not None and (last_ts is None or rec.updated_at > last_ts):
+                last_ts = rec.updated_at
+            if len(buf) >= chunk:
+                flush()
+        flush()
+        self.last_id, self.last_ts = last_id, last_ts
+        self.ready = True
+        if total:
+            logger.info(f"Vector index synced {total} embeddings ({len(self)} total)")
+        return total
+
+    def reconcile(self, repo, keep: Iterable[Any] = ()) -> int:
+        """Drop trees no longer in `repo` (deleted, rejected or re-embedded by another model), except those in `keep`.
+
+        `keep` holds trees applied before they reach Mongo (pending
+        registrations), taken before the call. Trees missing from the full scan
+        are looked up once more, so none written while it ran is dropped.
+        """
+        if not repo.is_connected():
+            return 0
+        keep = {str(k) for k in keep}
+        with self._lock:
+            held = set(self._row)
+        gone = held - repo.tree_ids('vector') - keep
+        if gone:
+            gone -= repo.tree_ids('vector', among=gone)
+        removed = self.remove(gone)
+        if removed:
+            logger.info(f"Vector index dropped {removed} deleted or rejected trees ({len(self)} total)")
+        return removed
+
+    def save(self, path: str) -> None:
+        """Snapshot to `<path>.npz` (+ `<path>.hnsw`), written atomically."""
+        with self._lock:
+            n = len(self._ids)
+            meta = {
+                "model_version": self.model_version,
+                "last_id": self.last_id,
+                "last_ts": self.last_ts.isoformat() if self.last_ts else None,
+                "count": n,
+                # Labels in the graph, removed trees' tombstones included
+                "hnsw_count": self._hnsw.get_current_count() if self._hnsw is not None else None,
+            }
+            tmp = f"{path}.tmp.npz"
+            np.savez(tmp, ids=np.asarray(self._ids, dtype=str), vectors=self._vecs[:n],
+                     lats=self._lats[:n], lons=self._lons[:n], meta=np.asarray(json.dumps(meta)))
+            os.replace(tmp, f"{path}.npz")
+            if self._hnsw is not None:
+                self._hnsw.save_index(f"{path}.hnsw.tmp")
+                os.replace(f"{path}.hnsw.tmp", f"{path}.hnsw")
+        logger.info(f"Vector index snapshot saved ({n} embeddings) to {path}.npz")
+
+    def load(self, path: str) -> bool:
+        if not os.path.exists(f"{path}.npz"):
+            return False
+        with np.load(f"{path}.npz") as snap:
+            ids = [str(i) for i in snap["ids"]]
+            vecs = snap["vectors"].astype(np.float32, copy=False)
+            lats, lons = snap["lats"], snap["lons"]
+            meta = json.loads(str(snap["meta"]))
+        if meta.get("model_version") != self.model_version:
+            logger.info(f"Vector index snapshot {path}.npz holds {meta.get('model_version')} embeddings, "
+                        f"not {self.model_version}; rebuilding from Mongo")
+            return False
+        with self._lock:
+            self.dim = vecs.shape[1] if vecs.size else None
+            self._vecs = np.empty((0, self.dim or 0), dtype=np.float32)
+            self._ids, self._row, self._hnsw = [], {}, None
+            if ids:
+                self._grow(len(ids))
+                self._vecs[:len(ids)] = vecs
+                self._lats[:len(ids)] = lats
+                self._lons[:len(ids)] = lons
+                self._ids = ids
+                self._row = {k: i for i, k in enumerate(ids)}
+            if self.use_hnsw and self.dim and os.path.exists(f"{path}.hnsw"):
+                index = hnswlib.Index(space='ip', dim=self.dim)
+                index.load_index(f"{path}.hnsw", max_elements=max(self._vecs.shape[0], meta.get("hnsw_count") or 0))
+                index.set_ef(self.ef_search)
+                if index.get_current_count() == (meta.get("hnsw_count") or len(ids)):
+                    self._hnsw = index
+            if self.dim:
+                self._ensure_hnsw()
+            self.last_id = meta.get("last_id")
+            self.last_ts = datetime.fromisoformat(meta["last_ts"]) if meta.get("last_ts") else None
+        logger.info(f"Vector index snapshot loaded ({len(ids)} embeddings) from {path}.npz")
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "count": len(self),
+            "dim": self.dim,
+            "model_version": self.model_version,
+            "backend": "hnsw" if self._hnsw is not None else "exact",
+            "last_id": self.last_id,
+        }
@@ -0,0 +1,295 @@
+"""Write-behind registration of verified trees.
+
+/register-tree hands over the artifacts of an accepted submission (pHash,
+embedding, location) for a tree the backend has stored, or for a submission
+still awaiting review, and returns at once.
+The caller applies a new registration to the in-process pHash index, vector
+index and tile cache straight away, and `nearby` answers geofence queries for
+trees whose artifacts are not yet in Mongo, so a duplicate submitted a moment
+later is caught before the write. Pending registrations are stamped onto
+their trees in one unordered bulk update per flush, by the service's flush
+loop or on shutdown by `drain`. A submission's registration is written onto
+the tree created from it at approval; until then it waits, retried on each
+flush, and it is dropped if the submission is rejected.
+
+Registrations are idempotent on the content hash (SHA-256 of the upload, as
+returned in `artifacts`): a repeat returns the tree id of the first. Mongo
+holds a unique index on it, so that also holds across restarts and workers.
+
+With `journal_path`, every accepted registration is appended to a JSON-lines
+journal and fsynced before it is acknowledged, and the journal is replayed at
+startup, so neither a crash nor a shutdown while Mongo is unreachable loses
+one; it is compacted after each flush. Without a journal, whatever the
+shutdown drain cannot write is lost (and logged).
+"""
+from __future__ import annotations
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from loguru import logger
+
+from .database import RepoUnavailable, TreeRecord
+from .vector_index import haversine_m
+
+
+@dataclass(frozen=True)
+class Registration:
+    content_hash: str
+    record: TreeRecord  # vector L2-normalised float32, or None
+    model_version: Optional[str]
+    submission: bool = False  # record.id is a submission's, not a tree's
+
+
+def _to_line(reg: Registration) -> str:
+    rec = reg.record
+    return json.dumps({
+        "content_hash": reg.content_hash,
+        "id": str(rec.id),
+        "submission": reg.submission,
+        "lat": rec.lat,
+        "lon": rec.lon,
+        "phash": rec.phash,
+        "vector": None if rec.vector is None else base64.b64encode(rec.vector.astype('<f4').tobytes()).decode('ascii'),
+        "model_version": reg.model_version
+    }) + "\n"
+
+
+def _from_line(line: str) -> Registration:
+    d = json.loads(line)
+    vector = None if d["vector"] is None else np.frombuffer(base64.b64decode(d["vector"]), dtype='<f4').astype(np.float32)
+    rec = TreeRecord(id=ObjectId(d["id"]), lat=float(d["lat"]), lon=float(d["lon"]), phash=d["phash"], vector=vector)
+    return Registration(content_hash=d["content_hash"], record=rec, model_version=d["model_version"],
+                        submission=bool(d.get("submission", False)))
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_size: int = 256, journal_path: Optional[str] = None, max_known: int = 100_000):
+        self.flush_size = flush_size
+        self.journal_path = journal_path
+        self.max_known = max_known
+        self._pending: "OrderedDict[str, Registration]" = OrderedDict()
+        self._flushing: Dict[str, Registration] = {}
+        # Submissions under review: no tree to write onto yet
+        self._waiting: "OrderedDict[str, Registration]" = OrderedDict()
+        # Content hash -> tree id of flushed registrations, for idempotency (LRU order)
+        self._known: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Held across a registration's journal append, so compaction never drops it
+        self._journal_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.registered = 0
+        self.repeats = 0
+        self.flushed = 0
+        self.flush_failures = 0
+        self.last_error: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._flushing) + len(self._waiting)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def full(self) -> bool:
+        return len(self._pending) >= self.flush_size
+
+    def lookup(self, content_hash: str) -> Optional[Any]:
+        """Tree id registered for `content_hash` by this process, pending or written."""
+        with self._lock:
+            reg = self._unwritten(content_hash)
+            if reg is not None:
+                return reg.record.id
+            return self._known.get(content_hash)
+
+    def _unwritten(self, content_hash: str) -> Optional[Registration]:
+        return (self._pending.get(content_hash) or self._flushing.get(content_hash)
+                or self._waiting.get(content_hash))
+
+    def _all_unwritten(self) -> List[Registration]:
+        return [*self._pending.values(), *self._flushing.values(), *self._waiting.values()]
+
+    def remember(self, content_hash: str, tree_id: Any) -> None:
+        """Record a registration found in Mongo, so repeats skip the lookup."""
+        with self._lock:
+            self._remember(content_hash, tree_id)
+
+    def _remember(self, content_hash: str, tree_id: Any) -> None:
+        self._known[content_hash] = tree_id
+        self._known.move_to_end(content_hash)
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    def register(self, reg: Registration) -> Tuple[Any, bool]:
+        """Queue `reg` (blocking while it is journaled): (tree id, True), or (first tree id, False) for a repeat."""
+        with self._journal_lock:
+            with self._lock:
+                first = self._unwritten(reg.content_hash)
+                first_id = first.record.id if first is not None else self._known.get(reg.content_hash)
+                if first_id is not None:
+                    self.repeats += 1
+                    return first_id, False
+                self._pending[reg.content_hash] = reg
+            if self.journal_path:
+                try:
+                    self._append(_to_line(reg))
+                except OSError:
+                    with self._lock:
+                        self._pending.pop(reg.content_hash, None)
+                    raise
+        self.registered += 1
+        return reg.record.id, True
+
+    def pending_ids(self) -> List[Any]:
+        """Ids of registered trees not yet written to Mongo."""
+        with self._lock:
+            return [reg.record.id for reg in self._all_unwritten()]
+
+    def nearby(self, lat: float, lon: float, radius_m: float) -> List[TreeRecord]:
+        """Registered trees not yet written to Mongo within `radius_m` of (lat, lon)."""
+        with self._lock:
+            records = [reg.record for reg in self._all_unwritten()]
+        if not records:
+            return []
+        dists = haversine_m(lat, lon, np.asarray([r.lat for r in records]), np.asarray([r.lon for r in records]))
+        return [records[i] for i in np.nonzero(dists <= radius_m)[0]]
+
+    def flush(self, repo) -> Tuple[List[Registration], Dict[str, Any], List[str]]:
+        """Write up to `flush_size` pending trees to `repo`, then retry waiting submissions with the room left.
+
+        Returns the registrations flushed, {content hash: stored id} for those
+        already registered in Mongo under another id, and the content hashes
+        whose tree does not exist (not written, and not remembered, so the
+        upload can be registered again). Submissions still under review are
+        in none of these: they wait for the next flush. On RepoUnavailable
+        the trees stay pending and the error propagates.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, retried = [], 0
+                while self._pending and len(batch) < self.flush_size:
+                    content_hash, reg = self._pending.popitem(last=False)
+                    self._flushing[content_hash] = reg
+                    batch.append(reg)
+                while self._waiting and len(batch) < self.flush_size:
+                    content_hash, reg = self._waiting.popitem(last=False)
+                    self._flushing[content_hash] = reg
+                    batch.append(reg)
+                    retried += 1
+            if not batch:
+                return [], {}, []
+            try:
+                stored, missing, unreviewed = repo.register_trees(
+                    [(reg.content_hash, reg.record, reg.model_version, reg.submission) for reg in batch])
+            except RepoUnavailable as e:
+                with self._lock:
+                    # Back to the front of their queues, in order
+                    fresh, waited = batch[:len(batch) - retried], batch[len(batch) - retried:]
+                    self._pending = OrderedDict([*((reg.content_hash, reg) for reg in fresh), *self._pending.items()])
+                    self._waiting = OrderedDict([*((reg.content_hash, reg) for reg in waited), *self._waiting.items()])
+                    for reg in batch:
+                        self._flushing.pop(reg.content_hash, None)
+                self.flush_failures += 1
+                self.last_error = str(e)
+                raise
+            lost, later = set(missing), set(unreviewed)
+            with self._lock:
+                for reg in batch:
+                    self._flushing.pop(reg.content_hash, None)
+                    if reg.content_hash in later:
+                        self._waiting[reg.content_hash] = reg
+                    elif reg.content_hash not in lost:
+                        self._remember(reg.content_hash, stored.get(reg.content_hash, reg.record.id))
+            batch = [reg for reg in batch if reg.content_hash not in later]
+            self.flushed += len(batch) - len(lost)
+            if self.journal_path and batch:
+                self._compact()
+            return batch, stored, missing
+
+    def drain(self, repo, timeout_s: float) -> int:
+        """Flush until nothing is pending, retrying while Mongo is unavailable, for up to `timeout_s`; returns trees left.
+
+        Submissions under review cannot be written yet and count as left.
+        """
+        deadline = time.monotonic() + timeout_s
+        while self._pending and time.monotonic() < deadline:
+            try:
+                self.flush(repo)
+            except RepoUnavailable as e:
+                logger.warning(f"Registration flush failed during drain ({e}); retrying")
+                time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+        left = len(self)
+        if left:
+            where = f"kept in {self.journal_path}" if self.journal_path else "lost"
+            logger.error(f"{left} registered trees were not written to Mongo; {where}")
+        return left
+
+    def replay(self) -> List[Registration]:
+        """Queue the registrations in the journal (left by a crash or an undrained shutdown) and return them."""
+        if not self.journal_path:
+            return []
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        if not os.path.exists(self.journal_path):
+            return []
+        regs = []
+        with open(self.journal_path, 'r', encoding='utf-8') as fh:
+            for n, line in enumerate(fh, 1):
+                if not line.strip():
+                    continue
+                try:
+                    reg = _from_line(line)
+                except (ValueError, KeyError, TypeError) as e:
+                    # e.g. a write torn by a crash; it was never acknowledged
+                    logger.warning(f"Skipping unreadable registration journal line {n}: {e}")
+                    continue
+                with self._lock:
+                    if reg.content_hash in self._pending:
+                        continue
+                    self._pending[reg.content_hash] = reg
+                regs.append(reg)
+        if regs:
+            logger.info(f"Replayed {len(regs)} unwritten tree registrations from {self.journal_path}")
+        return regs
+
+    def _append(self, line: str) -> None:
+        with open(self.journal_path, 'a', encoding='utf-8') as fh:
+            fh.write(line)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _compact(self) -> None:
+        # Rewrite the journal with what is still unwritten, atomically
+        with self._journal_lock:
+            with self._lock:
+                lines = [_to_line(reg) for reg in self._all_unwritten()]
+            tmp = f'{self.journal_path}.{os.getpid()}.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as fh:
+                    fh.writelines(lines)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(tmp, self.journal_path)
+            except OSError as e:
+                # The old journal still holds everything unwritten
+                logger.error(f"Registration journal compaction failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "flushing": len(self._flushing),
+            "waiting": len(self._waiting),
+            "registered": self.registered,
+            "repeats": self.repeats,
+            "flushed": self.flushed,
+            "flush_failures": self.flush_failures,
+            "last_error": self.last_error,
+            "journal": bool(self.journal_path)
+        }
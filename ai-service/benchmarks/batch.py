@@ -0,0 +1,85 @@
+"""Throughput of /verify-batch against a client looping over /verify-tree.
+
+Run from ai-service/ (the app runs in-process; Mongo is used when MONGO_URI is set):
+
+    python -m benchmarks.batch [--count 32] [--width 1600] [--json]
+
+Both modes verify the same distinct synthetic photos spread over a few geo
+cells, with the result cache disabled so every image is analysed. It reports
+images/s for each mode and the speed-up of the batch endpoint.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from typing import List, Tuple
+
+# Must be set before the app reads its configuration
+os.environ['RESULT_CACHE_SIZE'] = '0'
+os.environ.setdefault('MODEL_WARMUP_WAIT', '1')
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from benchmarks.decode import synthetic_jpeg  # noqa: E402
+
+
+def workload(count: int, width: int, cells: int = 4) -> List[Tuple[bytes, float, float]]:
+    height = width * 3 // 4
+    # Items cluster around `cells` sites a few km apart, as in a bulk import
+    return [(synthetic_jpeg(width, height, seed=i), 12.97 + 0.03 * (i % cells), 77.59 + 0.0005 * (i // cells))
+            for i in range(count)]
+
+
+def run_single(client: TestClient, items) -> float:
+    t0 = time.perf_counter()
+    for data, lat, lon in items:
+        r = client.post('/verify-tree', files={'image': ('tree.jpg', data, 'image/jpeg')},
+                        data={'latitude': str(lat), 'longitude': str(lon)})
+        if r.status_code not in (200, 422):
+            r.raise_for_status()
+    return time.perf_counter() - t0
+
+
+def run_batch(client: TestClient, items) -> float:
+    t0 = time.perf_counter()
+    manifest = [{"lat": lat, "lon": lon, "id": i} for i, (_, lat, lon) in enumerate(items)]
+    files = [('images', (f'{i}.jpg', data, 'image/jpeg')) for i, (data, _, _) in enumerate(items)]
+    with client.stream('POST', '/verify-batch', files=files, data={'items': json.dumps(manifest)}) as r:
+        r.raise_for_status()
+        lines = [line for line in r.iter_lines() if line]
+    if len(lines) != len(items) + 1:
+        raise RuntimeError(f"expected {len(items) + 1} NDJSON lines, got {len(lines)}")
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=32, help='images per mode (default: %(default)s)')
+    parser.add_argument('--width', type=int, default=1600, help='photo width in pixels, 4:3 (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+
+    items = workload(args.count, args.width)
+    with TestClient(app) as client:
+        run_single(client, items[:2])  # first-request costs outside the timed runs
+        single_s = run_single(client, items)
+        batch_s = run_batch(client, items)
+    result = {
+        "images": len(items),
+        "width": args.width,
+        "single_images_per_s": round(len(items) / single_s, 2),
+        "batch_images_per_s": round(len(items) / batch_s, 2),
+        "speedup": round(single_s / batch_s, 2),
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['images']} images at {args.width}px wide")
+        print(f"  /verify-tree loop: {result['single_images_per_s']:>8} images/s")
+        print(f"  /verify-batch:     {result['batch_images_per_s']:>8} images/s  ({result['speedup']}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Cost of the early-exit tree check against running every stage, per kind of upload.
+
+Run from ai-service/:
+
+    python -m benchmarks.cascade [--photos DIR] [--repeat 5] [--json]
+
+From one base photo (the first in --photos, or a synthetic green image) it
+derives uploads that the tree check should reject at different stages:
+too small, grey (low vegetation), blurred, mostly skin, plus the photo
+itself, which reaches CLIP. Each runs through `is_tree_like` as served
+(stopping at the first failing stage) and with `explain` (every stage, the
+cost before the cascade). The shared views are built before timing, as in
+`benchmarks.micro`. Reported per upload: median ms both ways, the stages
+run and the reasons. Exits non-zero when the two disagree on the decision
+or the cascade's reason is not one the full run reports.
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+from app.ai_checks import ImageBundle, Thresholds, ensure_models_loaded, is_tree_like, read_image_from_bytes
+from benchmarks.decode import synthetic_jpeg
+from benchmarks.load import IMAGE_EXTS
+
+
+def _jpeg(img: Image.Image) -> bytes:
+    bio = io.BytesIO()
+    img.save(bio, 'JPEG', quality=90)
+    return bio.getvalue()
+
+
+def base_photo(photos: str = None) -> Image.Image:
+    if photos:
+        names = sorted(f for f in os.listdir(photos) if f.lower().endswith(IMAGE_EXTS))
+        if names:
+            return Image.open(os.path.join(photos, names[0])).convert('RGB')
+    img = Image.open(io.BytesIO(synthetic_jpeg(1280, 960, seed=3)))
+    arr = np.asarray(img, dtype=np.float32) * np.float32([0.5, 1.0, 0.4])  # foliage-like greens
+    return Image.fromarray(arr.astype(np.uint8))
+
+
+def uploads(base: Image.Image) -> Dict[str, Tuple[str, bytes]]:
+    """Name -> (reason the check should stop on, JPEG bytes)."""
+    skin = base.copy()
+    w, h = skin.size
+    skin.paste((224, 172, 140), (w // 4, h * 3 // 10, w * 3 // 4, h * 7 // 10))  # a fifth of the frame
+    return {
+        "too_small": ("too_small", _jpeg(base.resize((120, 90)))),
+        "grey": ("low_vegetation", _jpeg(ImageOps.grayscale(base).convert('RGB'))),
+        "blurred": ("blur_low", _jpeg(base.filter(ImageFilter.GaussianBlur(max(base.size) / 40)))),
+        "skin": ("skin_detected", _jpeg(skin)),
+        "photo": ("clip", _jpeg(base)),
+    }
+
+
+def _median_ms(fn: Callable[[ImageBundle], object], data: bytes, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        bundle = ImageBundle(read_image_from_bytes(data))
+        bundle.working_array
+        t0 = time.perf_counter()
+        fn(bundle)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return round(statistics.median(times), 2)
+
+
+def run(base: Image.Image, repeat: int) -> Dict[str, dict]:
+    ensure_models_loaded()
+    thresholds = Thresholds()
+    out = {}
+    for name, (expect, data) in uploads(base).items():
+        ok, _, info = is_tree_like(ImageBundle(read_image_from_bytes(data)), thresholds)
+        full_ok, _, full = is_tree_like(ImageBundle(read_image_from_bytes(data)), thresholds, explain=True)
+        cascade_ms = _median_ms(lambda b: is_tree_like(b, thresholds), data, repeat)
+        full_ms = _median_ms(lambda b: is_tree_like(b, thresholds, explain=True), data, repeat)
+        out[name] = {
+            "expected": expect,
+            "passed": ok,
+            "reason": info["reason"],
+            "stages_run": [s["stage"] for s in full["stages"] if s["stage"] not in info["skipped"]],
+            "full_reasons": full["reasons"],
+            "cascade_ms": cascade_ms,
+            "full_ms": full_ms,
+            "saved_pct": round(100.0 * (1.0 - cascade_ms / full_ms), 1) if full_ms else 0.0,
+            "consistent": ok == full_ok and (ok or info["reason"] in full["reasons"]),
+        }
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--photos', help='directory of tree photos; the first is the base (default: synthetic)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per upload and mode (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+
+    rows = run(base_photo(args.photos), args.repeat)
+    inconsistent: List[str] = [name for name, row in rows.items() if not row["consistent"]]
+    if args.json:
+        print(json.dumps({"config": {"repeat": args.repeat, "photos": args.photos}, "uploads": rows}, indent=2))
+    else:
+        for name, row in rows.items():
+            outcome = "pass" if row["passed"] else row["reason"]
+            print(f"{name:<10} {outcome:<16} (expected {row['expected']:<14}) "
+                  f"{row['cascade_ms']:>8.2f} ms vs {row['full_ms']:>8.2f} ms all stages ({row['saved_pct']}% saved)  "
+                  f"ran {', '.join(row['stages_run'])}")
+        for name in inconsistent:
+            print(f"MISMATCH {name}: cascade {rows[name]['reason']!r}, full run {rows[name]['full_reasons']}")
+    sys.exit(1 if inconsistent else 0)
+
+
+if __name__ == '__main__':
+    main()
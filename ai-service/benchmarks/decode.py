@@ -0,0 +1,96 @@
+"""Full vs reduced-resolution (JPEG draft) decode of phone-sized uploads.
+
+Run from ai-service/:
+
+    python -m benchmarks.decode [--repeat 5] [--json]
+
+For each input size it reports the median time to decode the upload and the
+size of the decoded pixel buffer, once with a plain full-resolution decode and
+once through `read_image_from_bytes`.
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.ai_checks import read_image_from_bytes
+
+# (megapixels, width, height) at a 4:3 phone aspect ratio
+SIZES = [(4, 2304, 1728), (12, 4000, 3000), (24, 5664, 4248), (48, 8000, 6000)]
+
+
+def synthetic_jpeg(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    # Low-frequency structure plus fine noise, so the JPEG has realistic entropy
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 255, (height // 32, width // 32, 3), dtype=np.uint8)
+    img = Image.fromarray(base).resize((width, height), Image.BICUBIC)
+    arr = np.asarray(img, dtype=np.int16) + rng.integers(-12, 12, (height, width, 3), dtype=np.int16)
+    img = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+    bio = io.BytesIO()
+    img.save(bio, 'JPEG', quality=quality)
+    return bio.getvalue()
+
+
+def _full_decode(data: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def _reduced_decode(data: bytes) -> Image.Image:
+    img = read_image_from_bytes(data, max_pixels=0)
+    img.load()
+    return img
+
+
+def _time(fn, data: bytes, repeat: int):
+    times = []
+    img = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        img = fn(data)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), img
+
+
+def run(repeat: int = 5) -> list[dict]:
+    rows = []
+    for mp, w, h in SIZES:
+        data = synthetic_jpeg(w, h)
+        full_s, full_img = _time(_full_decode, data, repeat)
+        red_s, red_img = _time(_reduced_decode, data, repeat)
+        full_mb = full_img.width * full_img.height * len(full_img.getbands()) / 1e6
+        red_mb = red_img.width * red_img.height * len(red_img.getbands()) / 1e6
+        rows.append({
+            "megapixels": mp,
+            "upload_mb": round(len(data) / 1e6, 2),
+            "full": {"size": list(full_img.size), "ms": round(full_s * 1000, 2), "pixels_mb": round(full_mb, 1)},
+            "reduced": {"size": list(red_img.size), "ms": round(red_s * 1000, 2), "pixels_mb": round(red_mb, 1)},
+            "speedup": round(full_s / red_s, 1) if red_s > 0 else None,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+    rows = run(args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'MP':>4} {'full ms':>9} {'full MB':>8} {'reduced':>11} {'red ms':>8} {'red MB':>7} {'speedup':>8}")
+    for r in rows:
+        red_size = 'x'.join(str(v) for v in r['reduced']['size'])
+        print(f"{r['megapixels']:>4} {r['full']['ms']:>9} {r['full']['pixels_mb']:>8} {red_size:>11} "
+              f"{r['reduced']['ms']:>8} {r['reduced']['pixels_mb']:>7} {r['speedup']:>7}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Dedupe with CLIP image features (EMBEDDING_MODEL=clip) against EfficientNet-B0 vectors.
+
+Run from ai-service/:
+
+    python -m benchmarks.embedding [--photos DIR] [--count 16] [--threshold 0.95] [--clip-threshold T]
+                                   [--rounds 3] [--min-agreement 0.95] [--json]
+
+Every photo is paired with edited copies of itself, as a resubmission of
+the same tree would look (JPEG re-encode, downscale, crop, brightness,
+slight rotation): these are duplicates. Every two distinct photos form a
+non-duplicate pair. Per model the tool reports duplicate recall and the
+false-match rate. It also reports how often CLIP agrees with the EfficientNet
+decision at --threshold (VECTOR_MIN_COSINE). CLIP cosines run on a
+different scale, so unless --clip-threshold is given, CLIP is judged at the
+threshold that agrees best with EfficientNet. That threshold is the
+VECTOR_MIN_COSINE to start from with EMBEDDING_MODEL=clip.
+
+Latency is per image at batch size 1, preprocessing included: the CLIP pass
+alone (single-backbone) vs the CLIP pass plus the EfficientNet pass.
+Exits non-zero when agreement is below --min-agreement.
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+from itertools import combinations
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from app.ai_checks import ImageBundle, Models, embedding_version
+from benchmarks.inference import load_images, synthetic_images
+
+EDITS: Dict[str, Callable[[Image.Image], Image.Image]] = {
+    "jpeg_q60": lambda img: _reencode(img, 60),
+    "half_size": lambda img: img.resize((img.width // 2, img.height // 2), Image.BICUBIC),
+    "crop_85": lambda img: img.crop((round(img.width * 0.075), round(img.height * 0.075),
+                                     round(img.width * 0.925), round(img.height * 0.925))),
+    "brighter": lambda img: ImageEnhance.Brightness(img).enhance(1.15),
+    "rotate_3": lambda img: img.rotate(3, resample=Image.BICUBIC),
+}
+
+
+def _reencode(img: Image.Image, quality: int) -> Image.Image:
+    bio = io.BytesIO()
+    img.save(bio, 'JPEG', quality=quality)
+    bio.seek(0)
+    return Image.open(bio).convert('RGB')
+
+
+def embed(m: Models, images: List[Image.Image]) -> Tuple[np.ndarray, np.ndarray]:
+    """(EfficientNet, CLIP) L2-normalised embeddings of `images`, one row each."""
+    bundles = [ImageBundle(img) for img in images]
+    enc = m.encode_tensors([m.encoder_tf(b.working) for b in bundles])
+    _, clip = m.clip_forward([m.clip_preprocess(b.working) for b in bundles])
+    enc = enc / np.maximum(np.linalg.norm(enc, axis=1, keepdims=True), 1e-12)
+    return enc, clip
+
+
+def pair_cosines(m: Models, images: List[Image.Image]) -> Dict[str, np.ndarray]:
+    """Cosine per pair and model, with `duplicate` marking the photo-vs-edit pairs."""
+    originals = embed(m, images)
+    enc, clip, dup = [], [], []
+    for edit in EDITS.values():
+        edited = embed(m, [edit(img) for img in images])
+        for model, (o, e) in enumerate(zip(originals, edited)):
+            (enc, clip)[model].extend(np.sum(o * e, axis=1))
+        dup.extend([True] * len(images))
+    for i, j in combinations(range(len(images)), 2):
+        enc.append(float(originals[0][i] @ originals[0][j]))
+        clip.append(float(originals[1][i] @ originals[1][j]))
+        dup.append(False)
+    return {"efficientnet": np.asarray(enc), "clip": np.asarray(clip), "duplicate": np.asarray(dup)}
+
+
+def decisions(cos: np.ndarray, duplicate: np.ndarray, threshold: float) -> dict:
+    flagged = cos >= threshold
+    return {
+        "threshold": round(float(threshold), 3),
+        "duplicate_recall": round(float(flagged[duplicate].mean()), 4) if duplicate.any() else None,
+        "false_match_rate": round(float(flagged[~duplicate].mean()), 4) if (~duplicate).any() else None,
+        "min_duplicate_cosine": round(float(cos[duplicate].min()), 4) if duplicate.any() else None,
+        "max_distinct_cosine": round(float(cos[~duplicate].max()), 4) if (~duplicate).any() else None,
+    }
+
+
+def best_threshold(cos: np.ndarray, reference: np.ndarray) -> float:
+    # Highest agreement with the reference decisions; ties go to the middle of the best range
+    grid = np.round(np.arange(0.5, 1.0, 0.005), 3)
+    agree = np.asarray([np.mean((cos >= t) == reference) for t in grid])
+    best = grid[agree == agree.max()]
+    return float(best[len(best) // 2])
+
+
+def latency(m: Models, images: List[Image.Image], rounds: int) -> Dict[str, float]:
+    bundles = [ImageBundle(img) for img in images]
+    for b in bundles:
+        b.working  # shared by both models; not charged to either
+
+    def per_image(fn) -> float:
+        times = []
+        for _ in range(rounds):
+            for b in bundles:
+                t0 = time.perf_counter()
+                fn(b)
+                times.append((time.perf_counter() - t0) * 1000.0)
+        return statistics.median(times)
+
+    clip_ms = per_image(lambda b: m.clip_forward([m.clip_preprocess(b.working)]))
+    enc_ms = per_image(lambda b: m.encode_tensors([m.encoder_tf(b.working)]))
+    return {
+        "clip_pass_ms": round(clip_ms, 2),
+        "encoder_pass_ms": round(enc_ms, 2),
+        "two_pass_ms": round(clip_ms + enc_ms, 2),
+        "single_pass_ms": round(clip_ms, 2),
+        "saved_pct": round(100.0 * enc_ms / (clip_ms + enc_ms), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--photos', help='directory of tree photos (default: synthetic images)')
+    parser.add_argument('--count', type=int, default=16, help='photos to use (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=0.95,
+                        help='EfficientNet VECTOR_MIN_COSINE, the reference decision (default: %(default)s)')
+    parser.add_argument('--clip-threshold', type=float,
+                        help='CLIP cosine threshold to judge (default: the one agreeing best)')
+    parser.add_argument('--rounds', type=int, default=3, help='timed runs per image (default: %(default)s)')
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help='minimum share of pairs decided alike (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+
+    images = load_images(args.photos, args.count) if args.photos else synthetic_images(args.count)
+    m = Models(embedding='efficientnet')  # loads both models
+    cos = pair_cosines(m, images)
+    dup = cos["duplicate"]
+    reference = cos["efficientnet"] >= args.threshold
+    clip_threshold = args.clip_threshold if args.clip_threshold is not None else best_threshold(cos["clip"], reference)
+    flagged = cos["clip"] >= clip_threshold
+    result = {
+        "images": len(images),
+        "pairs": {"duplicate": int(dup.sum()), "distinct": int((~dup).sum()), "edits": list(EDITS)},
+        "efficientnet": {"model_version": embedding_version('efficientnet'),
+                         **decisions(cos["efficientnet"], dup, args.threshold)},
+        "clip": {"model_version": embedding_version('clip'), **decisions(cos["clip"], dup, clip_threshold)},
+        "agreement": {
+            "rate": round(float(np.mean(flagged == reference)), 4),
+            "both_duplicate": int(np.sum(flagged & reference)),
+            "efficientnet_only": int(np.sum(reference & ~flagged)),
+            "clip_only": int(np.sum(flagged & ~reference)),
+        },
+        "latency": latency(m, images, args.rounds),
+    }
+    failed = result["agreement"]["rate"] < args.min_agreement
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        p = result["pairs"]
+        print(f"{len(images)} images: {p['duplicate']} duplicate pairs ({', '.join(EDITS)}), "
+              f"{p['distinct']} distinct pairs")
+        print(f"{'model':>13} {'threshold':>9} {'recall':>7} {'false match':>11} {'min dup cos':>11} {'max other cos':>13}")
+        for name in ("efficientnet", "clip"):
+            r = result[name]
+            print(f"{name:>13} {r['threshold']:>9} {r['duplicate_recall']:>7} {r['false_match_rate']:>11} "
+                  f"{r['min_duplicate_cosine']:>11} {r['max_distinct_cosine']:>13}")
+        a, lat = result["agreement"], result["latency"]
+        print(f"agreement {a['rate']:.2%} (both flag {a['both_duplicate']}, EfficientNet only "
+              f"{a['efficientnet_only']}, CLIP only {a['clip_only']})")
+        print(f"per image: CLIP {lat['clip_pass_ms']} ms + EfficientNet {lat['encoder_pass_ms']} ms = "
+              f"{lat['two_pass_ms']} ms; single-backbone {lat['single_pass_ms']} ms ({lat['saved_pct']}% saved)")
+        if failed:
+            print(f"agreement below {args.min_agreement:.0%}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
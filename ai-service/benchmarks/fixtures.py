@@ -0,0 +1,179 @@
+"""In-memory stand-in for `MongoRepo` and tree-density fixtures for load tests.
+
+Trees are planted in clusters (parks, avenues, plantation drives) around a
+city centre: cluster centres are spread over `area_km` square and trees fall
+around each centre with a normal spread of `cluster_radius_m`. With the
+defaults a 20 m geofence around a new planting holds a handful of trees, a
+few dense spots exceed CLUSTER_MAX_IN_RADIUS and most of the city is empty,
+so every dedupe branch is exercised. Vectors are stored in the `vector_bin`
+format and decoded per query, as with Mongo.
+"""
+from __future__ import annotations
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from app.batch import M_PER_DEG_LAT
+from app.database import NearbyTrees, TreeRecord, _vector_view, decode_vectors, encode_vector
+from app.metrics import timed
+from app.vector_index import EARTH_RADIUS_M, haversine_m
+
+CITY_CENTER = (12.9716, 77.5946)
+
+
+@dataclass
+class TreeFixture:
+    ids: List[ObjectId]
+    lats: np.ndarray
+    lons: np.ndarray
+    phashes: List[str]
+    vectors: List[bytes]  # encoded `vector_bin` blobs
+    cluster_centers: np.ndarray  # (C, 2) lat, lon
+
+
+def _offsets(rng: np.random.Generator, n: int, sigma_m: float, lat: float) -> Tuple[np.ndarray, np.ndarray]:
+    dy, dx = rng.normal(0.0, sigma_m, n), rng.normal(0.0, sigma_m, n)
+    return dy / M_PER_DEG_LAT, dx / (M_PER_DEG_LAT * math.cos(math.radians(lat)))
+
+
+def make_trees(n: int = 20000, clusters: int = 60, cluster_radius_m: float = 150.0, area_km: float = 10.0,
+               dim: int = 1280, center: Tuple[float, float] = CITY_CENTER, seed: int = 0) -> TreeFixture:
+    rng = np.random.default_rng(seed)
+    c_lat, c_lon = _offsets(rng, clusters, area_km * 1000.0 / 4.0, center[0])
+    centers = np.stack([center[0] + c_lat, center[1] + c_lon], axis=1)
+    # Uneven cluster sizes: a few large parks, many small plantings
+    weights = rng.pareto(1.5, clusters) + 1.0
+    owner = rng.choice(clusters, size=n, p=weights / weights.sum())
+    d_lat, d_lon = _offsets(rng, n, cluster_radius_m, center[0])
+    lats, lons = centers[owner, 0] + d_lat, centers[owner, 1] + d_lon
+    vecs = rng.standard_normal((n, dim)).astype(np.float32)
+    hashes = rng.integers(0, 1 << 64, n, dtype=np.uint64)
+    return TreeFixture(
+        ids=[ObjectId() for _ in range(n)],
+        lats=lats, lons=lons,
+        phashes=[f"{int(h):016x}" for h in hashes],
+        vectors=[bytes(encode_vector(v)) for v in vecs],
+        cluster_centers=centers,
+    )
+
+
+def sample_sites(fixture: TreeFixture, n: int, cluster_radius_m: float = 150.0,
+                 seed: int = 1) -> List[Tuple[float, float]]:
+    """Locations of new plantings, drawn around the same clusters as the fixture."""
+    rng = np.random.default_rng(seed)
+    centers = fixture.cluster_centers
+    pick = rng.integers(0, len(centers), n)
+    d_lat, d_lon = _offsets(rng, n, cluster_radius_m, float(centers[:, 0].mean()))
+    return [(float(centers[c, 0] + a), float(centers[c, 1] + b)) for c, a, b in zip(pick, d_lat, d_lon)]
+
+
+def add_trees(fixture: TreeFixture, sites: List[Tuple[float, float]], phashes: List[str], seed: int = 2) -> None:
+    """Register extra trees, e.g. earlier uploads of photos a load test submits again."""
+    rng = np.random.default_rng(seed)
+    dim = _vector_view(fixture.vectors[0]).shape[0]
+    fixture.ids.extend(ObjectId() for _ in sites)
+    fixture.lats = np.append(fixture.lats, [lat for lat, _ in sites])
+    fixture.lons = np.append(fixture.lons, [lon for _, lon in sites])
+    fixture.phashes.extend(phashes)
+    fixture.vectors.extend(bytes(encode_vector(v)) for v in rng.standard_normal((len(sites), dim)))
+
+
+class InMemoryRepo:
+    """The read side of `MongoRepo` over a `TreeFixture`, for load tests without a database."""
+
+    def __init__(self, fixture: TreeFixture):
+        self.fixture = fixture
+        order = np.argsort(fixture.lats, kind='stable')
+        self._order = order
+        self._sorted_lats = fixture.lats[order]
+        self._row_of: Dict[Any, int] = {tree_id: i for i, tree_id in enumerate(fixture.ids)}
+        self._updated = datetime.now(timezone.utc)
+
+    indexes_ready = True
+
+    def connect(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def is_configured(self) -> bool:
+        return True
+
+    def is_connected(self) -> bool:
+        return True
+
+    def probe(self) -> bool:
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"configured": True, "connected": True, "indexes_ready": True,
+                "circuit": {"state": "closed", "errors": 0, "trips": 0}}
+
+    def __len__(self) -> int:
+        return len(self.fixture.ids)
+
+    def _record(self, row: int) -> TreeRecord:
+        f = self.fixture
+        return TreeRecord(id=f.ids[row], lat=float(f.lats[row]), lon=float(f.lons[row]),
+                          phash=f.phashes[row], vector=None, updated_at=self._updated)
+
+    @timed('find_nearby')
+    def find_nearby(self, lat: float, lon: float, radius_m: float, with_vectors: bool = True,
+                    limit: int = 100) -> NearbyTrees:
+        # Latitude band from the sorted index, then exact distances, nearest first like $near
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)  # same Earth as haversine_m, or the band clips
+        lo, hi = np.searchsorted(self._sorted_lats, [lat - dlat, lat + dlat])
+        rows = self._order[lo:hi]
+        f = self.fixture
+        dists = haversine_m(lat, lon, f.lats[rows], f.lons[rows])
+        keep = np.nonzero(dists <= radius_m)[0]
+        rows = rows[keep[np.argsort(dists[keep], kind='stable')]][:limit]
+        out = NearbyTrees(records=[self._record(int(r)) for r in rows])
+        if with_vectors:
+            mat, kept = decode_vectors([f.vectors[int(r)] for r in rows])
+            out.vectors = mat
+            out.vector_ids = [out.records[i].id for i in kept]
+            for r, i in enumerate(kept):
+                out.records[i].vector = mat[r]
+        return out
+
+    @timed('find_vectors')
+    def find_vectors(self, ids: List[Any]) -> Dict[Any, np.ndarray]:
+        rows = [self._row_of[i] for i in ids if i in self._row_of]
+        mat, kept = decode_vectors([self.fixture.vectors[r] for r in rows])
+        return {self.fixture.ids[rows[i]]: mat[r] for r, i in enumerate(kept)}
+
+    def watch_changes(self, max_await_ms: int = 1000) -> Iterator[Tuple[Optional[str], Any, Optional[TreeRecord]]]:
+        # The fixture never changes; idle heartbeats only, so the tile cache stays active
+        while True:
+            yield None, None, None
+            time.sleep(max_await_ms / 1000.0)
+
+    def _iter_trees(self, since_id: Optional[str]) -> Iterator[int]:
+        after = ObjectId(since_id) if since_id and ObjectId.is_valid(since_id) else None
+        for row, tree_id in enumerate(self.fixture.ids):
+            if after is None or tree_id > after:
+                yield row
+
+    def iter_embeddings(self, since_id: Optional[str] = None, since_ts: Optional[datetime] = None,
+                        batch_size: int = 1000) -> Iterator[TreeRecord]:
+        for row in self._iter_trees(since_id):
+            rec = self._record(row)
+            rec.vector = _vector_view(self.fixture.vectors[row])
+            yield rec
+
+    def iter_phashes(self, since_id: Optional[str] = None, since_ts: Optional[datetime] = None,
+                     batch_size: int = 5000) -> Iterator[TreeRecord]:
+        for row in self._iter_trees(since_id):
+            yield self._record(row)
+
+    def tree_ids(self, field: str, among: Optional[Iterable[Any]] = None, batch_size: int = 5000) -> Set[str]:
+        # Every fixture tree has both a pHash and a vector, and none is ever deleted
+        ids = {str(tree_id) for tree_id in self.fixture.ids}
+        return ids if among is None else ids & {str(i) for i in among}
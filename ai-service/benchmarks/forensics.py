@@ -0,0 +1,180 @@
+"""Forensics (blur and ELA) against the previous implementation: speed and agreement.
+
+Run from ai-service/:
+
+    python -m benchmarks.forensics [--sizes 640x480,1600x1200,4000x3000] [--photos DIR] [--views 4]
+                                   [--repeat 5] [--baseline forensics.json] [--save forensics.json] [--json]
+
+For every upload (synthetic JPEGs at --sizes and two qualities, plus the
+photos in --photos) the previous implementation scores a full-resolution
+decode, as the service did before reduced-resolution JPEG decoding, and the
+current one the bundle the service builds, with its EXIF-corrected and
+working views already built since the models need them anyway:
+
+- blur: previously a grayscale copy of the full decode, a 256x256 thumbnail
+  and a complex `fft2`; now a thumbnail of the working copy and a weighted
+  `rfft2` (see `app.forensics`)
+- ela: previously a PIL JPEG round trip of the whole full decode with a
+  float32 difference; now an OpenCV round trip of a bounded crop in uint8,
+  timed with the full-resolution decode it needs when the bundle's decode
+  was reduced
+
+`blur_batch` scores --views thumbnails with one FFT instead of one each.
+`ela_decode` times, per view of the largest upload, the working view plus
+ELA as the service runs them (a reduced decode, then a full one for ELA)
+against one shared full-resolution decode that both are taken from.
+Exits non-zero when a score differs from the previous one by more than the
+documented tolerance, or (with --baseline) when a timing regresses.
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageChops
+
+from app.ai_checks import ImageBundle, error_level_analysis, read_image_from_bytes
+from app.forensics import BLUR_TOLERANCE, ELA_TOLERANCE, blur_score, blur_scores, blur_thumbnail
+from benchmarks.decode import synthetic_jpeg
+from benchmarks.load import IMAGE_EXTS
+from benchmarks.report import check_baseline
+
+DEFAULT_SIZES = '640x480,1600x1200,4000x3000'
+
+
+def legacy_blur(gray_source: Image.Image) -> float:
+    arr = np.asarray(gray_source.convert('L').resize((256, 256), Image.BICUBIC), dtype=np.float32)
+    magnitude = np.abs(np.fft.fftshift(np.fft.fft2(arr)))
+    total = magnitude.sum()
+    return float((total - magnitude[96:160, 96:160].sum()) / (total + 1e-6))
+
+
+def legacy_ela(img: Image.Image, quality: int = 85) -> float:
+    bio = io.BytesIO()
+    img.save(bio, 'JPEG', quality=quality)
+    bio.seek(0)
+    diff = ImageChops.difference(img.convert('RGB'), Image.open(bio).convert('RGB'))
+    return float(np.asarray(diff).astype(np.float32).mean() / 255.0)
+
+
+def _median_ms(fn: Callable[[], object], repeat: int) -> Tuple[float, object]:
+    times, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return round(statistics.median(times), 3), out
+
+
+def uploads(sizes: List[Tuple[int, int]], photos: str = None) -> List[Tuple[str, bytes]]:
+    out = [(f"{w}x{h}_q{q}", synthetic_jpeg(w, h, seed=w + q, quality=q)) for w, h in sizes for q in (75, 92)]
+    if photos:
+        for name in sorted(f for f in os.listdir(photos) if f.lower().endswith(IMAGE_EXTS)):
+            with open(os.path.join(photos, name), 'rb') as fh:
+                out.append((name, fh.read()))
+    return out
+
+
+def _bundle(data: bytes) -> ImageBundle:
+    bundle = ImageBundle(read_image_from_bytes(data), data)
+    bundle.working  # built for the models in every request
+    return bundle
+
+
+def score(name: str, data: bytes, repeat: int) -> Dict[str, object]:
+    full = Image.open(io.BytesIO(data))
+    full.load()
+    bundle = _bundle(data)
+    old_blur_ms, old_blur = _median_ms(lambda: legacy_blur(full), repeat)
+    new_blur_ms, new_blur = _median_ms(lambda: blur_score(bundle.working), repeat)
+    old_ela_ms, old_ela = _median_ms(lambda: legacy_ela(full), repeat)
+    # A fresh bundle per run, so the full-resolution decode ELA needs is timed too
+    bundles = iter([_bundle(data) for _ in range(repeat)])
+    new_ela_ms, new_ela = _median_ms(lambda: error_level_analysis(next(bundles)), repeat)
+    return {
+        "decoded_size": list(bundle.source.size),
+        "blur": {"legacy_ms": old_blur_ms, "new_ms": new_blur_ms, "legacy": round(old_blur, 5),
+                 "new": round(new_blur, 5), "abs_diff": round(abs(new_blur - old_blur), 6)},
+        "ela": {"legacy_ms": old_ela_ms, "new_ms": new_ela_ms, "legacy": round(old_ela, 6),
+                "new": round(new_ela, 6), "abs_diff": round(abs(new_ela - old_ela), 6)},
+    }
+
+
+def blur_batch(data: bytes, views: int, repeat: int) -> Dict[str, float]:
+    bundles = [ImageBundle(read_image_from_bytes(data)) for _ in range(views)]
+    thumbs = [blur_thumbnail(b.working) for b in bundles]
+    each_ms, _ = _median_ms(lambda: [blur_scores(t[None]) for t in thumbs], repeat)
+    batch_ms, _ = _median_ms(lambda: blur_scores(np.stack(thumbs)), repeat)
+    return {"views": views, "per_view_fft_ms": each_ms, "batched_fft_ms": batch_ms}
+
+
+def ela_decode(data: bytes, repeat: int) -> Dict[str, float]:
+    def run(min_side):
+        bundle = ImageBundle(read_image_from_bytes(data, min_side=min_side), data)
+        bundle.working
+        return error_level_analysis(bundle)
+
+    two_ms, _ = _median_ms(lambda: run(None), repeat)
+    # min_side=0: no reduced decode, so ELA reuses the bundle's own pixels
+    shared_ms, _ = _median_ms(lambda: run(0), repeat)
+    return {"size": list(Image.open(io.BytesIO(data)).size), "reduced_then_full_ms": two_ms,
+            "shared_full_ms": shared_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated WxH upload sizes (default: %(default)s)')
+    parser.add_argument('--photos', help='directory of real photos to include')
+    parser.add_argument('--views', type=int, default=4, help='views in the batched blur case (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per case (default: %(default)s)')
+    parser.add_argument('--baseline', help='JSON result of an earlier run to compare against')
+    parser.add_argument('--save', help='write this run to a JSON file (e.g. to become the baseline)')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown vs the baseline (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in s.lower().split('x')) for s in args.sizes.split(',') if s.strip()]
+    inputs = uploads(sizes, args.photos)
+    rows = {name: score(name, data, args.repeat) for name, data in inputs}
+    result = {
+        "config": {"repeat": args.repeat, "views": args.views, "photos": args.photos},
+        "tolerance": {"blur": BLUR_TOLERANCE, "ela": ELA_TOLERANCE},
+        "uploads": rows,
+        "blur_batch": blur_batch(inputs[0][1], args.views, args.repeat),
+        "ela_decode": ela_decode(max((data for _, data in inputs), key=len), args.repeat),
+    }
+    mismatches = [f"{name}: {check} differs by {row[check]['abs_diff']:g} (tolerance {tol:g})"
+                  for name, row in rows.items()
+                  for check, tol in (("blur", BLUR_TOLERANCE), ("ela", ELA_TOLERANCE))
+                  if row[check]["abs_diff"] > tol]
+    regressions = check_baseline(result, args.baseline, args.tolerance, args.save)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for name, row in rows.items():
+            b, e = row["blur"], row["ela"]
+            print(f"{name:<28} decoded {row['decoded_size'][0]}x{row['decoded_size'][1]:<5} "
+                  f"blur {b['legacy_ms']:>7.2f} -> {b['new_ms']:>6.2f} ms (diff {b['abs_diff']:.5f})  "
+                  f"ela {e['legacy_ms']:>7.2f} -> {e['new_ms']:>6.2f} ms (diff {e['abs_diff']:.6f})")
+        bb = result["blur_batch"]
+        print(f"blur FFT for {bb['views']} views: {bb['per_view_fft_ms']:.2f} ms one by one, "
+              f"{bb['batched_fft_ms']:.2f} ms batched")
+        ed = result["ela_decode"]
+        print(f"working view + ELA at {ed['size'][0]}x{ed['size'][1]}: {ed['reduced_then_full_ms']:.2f} ms "
+              f"reduced then full decode, {ed['shared_full_ms']:.2f} ms one shared full decode")
+        for line in mismatches:
+            print(f"MISMATCH {line}")
+        for line in regressions:
+            print(f"REGRESSION {line}")
+    sys.exit(1 if mismatches or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Latency, throughput and parity of the inference backends (torch, ONNX, ONNX int8).
+
+Run from ai-service/ (ONNX graphs are exported into ONNX_MODEL_DIR on first use):
+
+    python -m benchmarks.inference [--backends torch,onnx,onnx-int8] [--images DIR] [--json]
+
+Eager torch is the reference. For every other backend it reports the worst
+embedding cosine drift (1 - cosine to the torch embedding) and the largest
+change in CLIP tree probability over the image set, and exits non-zero when
+either exceeds its bound. Latency is per image at batch size 1; throughput is
+images/s at --batch-size, for each encoder and both together.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+from app.ai_checks import BACKENDS, ImageBundle, Models
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def synthetic_images(n: int, seed: int = 0) -> List[Image.Image]:
+    # Smooth colour fields plus texture, so model inputs are not pure noise
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        base = rng.integers(0, 255, (12, 16, 3), dtype=np.uint8)
+        img = Image.fromarray(base).resize((640, 480), Image.BICUBIC)
+        arr = np.asarray(img, dtype=np.int16) + rng.integers(-20, 20, (480, 640, 3), dtype=np.int16)
+        out.append(Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8)))
+    return out
+
+
+def load_images(path: str, limit: int) -> List[Image.Image]:
+    names = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTS))[:limit]
+    return [Image.open(os.path.join(path, f)).convert('RGB') for f in names]
+
+
+def _outputs(m: Models, enc_in, clip_in):
+    vecs = m.encode_tensors(enc_in)
+    probs = np.asarray([p for p, _ in m.clip_stats_tensors(clip_in)])
+    return vecs, probs
+
+
+def _latency_ms(fn, items, rounds: int) -> dict:
+    times = []
+    for _ in range(rounds):
+        for item in items:
+            t0 = time.perf_counter()
+            fn([item])
+            times.append((time.perf_counter() - t0) * 1000.0)
+    times.sort()
+    return {"p50": round(statistics.median(times), 2), "p95": round(times[int(0.95 * (len(times) - 1))], 2)}
+
+
+def _throughput(fn, items, batch_size: int, rounds: int) -> float:
+    t0 = time.perf_counter()
+    n = 0
+    for _ in range(rounds):
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i + batch_size]
+            fn(batch)
+            n += len(batch)
+    return round(n / (time.perf_counter() - t0), 1)
+
+
+def run(backends: List[str], images: List[Image.Image], batch_size: int = 8, rounds: int = 3) -> dict:
+    bundles = [ImageBundle(img) for img in images]
+    reference = None
+    results = {}
+    for backend in backends:
+        m = Models(backend=backend, embedding='efficientnet')
+        enc_in = [m.encoder_tf(b.working) for b in bundles]
+        clip_in = [m.clip_preprocess(b.working) for b in bundles]
+        vecs, probs = _outputs(m, enc_in, clip_in)  # also warms the runtime
+        row = {
+            "load_ms": {k: round(v, 1) for k, v in m.timings.items()},
+            "encoder_ms": _latency_ms(m.encode_tensors, enc_in, rounds),
+            "clip_ms": _latency_ms(m.clip_stats_tensors, clip_in, rounds),
+            "encoder_images_per_s": _throughput(m.encode_tensors, enc_in, batch_size, rounds),
+            "clip_images_per_s": _throughput(m.clip_stats_tensors, clip_in, batch_size, rounds),
+        }
+        row["both_images_per_s"] = round(
+            1.0 / (1.0 / row["encoder_images_per_s"] + 1.0 / row["clip_images_per_s"]), 1)
+        if reference is None:
+            reference = (vecs, probs)
+        else:
+            ref_vecs, ref_probs = reference
+            cos = np.sum(vecs * ref_vecs, axis=1) / (
+                np.linalg.norm(vecs, axis=1) * np.linalg.norm(ref_vecs, axis=1) + 1e-12)
+            row["parity"] = {
+                "embedding_cosine_drift": float(1.0 - cos.min()),
+                "tree_prob_max_abs_diff": float(np.abs(probs - ref_probs).max()),
+            }
+        results[backend] = row
+        del m
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        help='comma-separated; the first is the parity reference (default: %(default)s)')
+    parser.add_argument('--images', help='directory of photos to use instead of synthetic images')
+    parser.add_argument('--count', type=int, default=16, help='images to run (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--max-embedding-drift', type=float, default=0.02,
+                        help='max allowed 1 - cosine vs the reference (default: %(default)s)')
+    parser.add_argument('--max-prob-drift', type=float, default=0.02,
+                        help='max allowed |tree probability difference| vs the reference (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    images = load_images(args.images, args.count) if args.images else synthetic_images(args.count)
+    results = run(backends, images, args.batch_size, args.rounds)
+
+    failed = [
+        name for name, row in results.items()
+        if 'parity' in row and (row['parity']['embedding_cosine_drift'] > args.max_embedding_drift
+                                or row['parity']['tree_prob_max_abs_diff'] > args.max_prob_drift)
+    ]
+    if args.json:
+        print(json.dumps({"images": len(images), "batch_size": args.batch_size, "backends": results,
+                          "parity_failed": failed}, indent=2))
+    else:
+        print(f"{len(images)} images, throughput at batch {args.batch_size}")
+        print(f"{'backend':>10} {'enc p50':>8} {'clip p50':>9} {'enc img/s':>10} {'clip img/s':>11} "
+              f"{'both img/s':>11} {'emb drift':>10} {'prob diff':>10}")
+        for name, r in results.items():
+            p = r.get('parity')
+            drift = f"{p['embedding_cosine_drift']:.2e}" if p else 'ref'
+            pdiff = f"{p['tree_prob_max_abs_diff']:.2e}" if p else 'ref'
+            print(f"{name:>10} {r['encoder_ms']['p50']:>8} {r['clip_ms']['p50']:>9} {r['encoder_images_per_s']:>10} "
+                  f"{r['clip_images_per_s']:>11} {r['both_images_per_s']:>11} {drift:>10} {pdiff:>10}")
+        if failed:
+            print(f"parity bound exceeded: {', '.join(failed)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
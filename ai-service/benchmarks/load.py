@@ -0,0 +1,241 @@
+"""End-to-end load test of /verify-tree and /verify-tree-multi.
+
+Run from ai-service/ (the app runs in-process against an in-memory tree fixture):
+
+    python -m benchmarks.load [--requests 200] [--concurrency 8] [--multi-ratio 0.2] [--trees 20000]
+                              [--photos DIR] [--full-path] [--repo memory|mongo] [--url URL]
+                              [--baseline load.json] [--save load.json] [--tolerance 0.15] [--json]
+
+A closed loop of --concurrency clients sends a fixed, seeded request mix:
+single photos at new planting sites drawn around the fixture's clusters (see
+`benchmarks.fixtures`), a share of re-uploads of photos already registered
+nearby, and multi-view submissions. --photos uses real tree photos instead
+of synthetic ones; --full-path zeroes the tree-check thresholds so every
+request reaches geofence and dedupe even with synthetic photos. With
+--repo mongo the configured MONGO_URI is used as is; --url drives a running
+service instead of the in-process app (RSS is then not reported).
+
+The result cache is off unless RESULT_CACHE_SIZE is set. Output: throughput,
+p50/p95/p99 latency and response mix per endpoint, plus peak RSS of the
+service process and of its largest worker process. With --baseline, exits
+non-zero when throughput drops, latency or RSS grows by more than
+--tolerance, or any request fails.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from benchmarks.decode import synthetic_jpeg
+from benchmarks.report import check_baseline, peak_rss_mb, percentiles
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+
+Request = Tuple[str, Dict[str, str], List[bytes]]  # endpoint, form fields, photos
+
+
+def load_photos(path: Optional[str], count: int, width: int) -> List[bytes]:
+    if path:
+        names = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTS))[:count]
+        photos = []
+        for name in names:
+            with open(os.path.join(path, name), 'rb') as fh:
+                photos.append(fh.read())
+        return photos
+    return [synthetic_jpeg(width, width * 3 // 4, seed=i) for i in range(count)]
+
+
+def plan(photos: List[bytes], sites: List[Tuple[float, float]], multi_ratio: float, dup_ratio: float,
+         views: int, seed: int = 3) -> Tuple[List[Request], List[Tuple[Tuple[float, float], bytes]]]:
+    """The request mix, and the (site, photo) pairs to register beforehand as earlier uploads."""
+    rng = np.random.default_rng(seed)
+    # Photos registered beforehand are only ever sent as re-uploads
+    n_dup = max(1, int(len(photos) * dup_ratio)) if dup_ratio > 0 and len(photos) > 1 else 0
+    dup_photos, fresh = photos[:n_dup], photos[n_dup:]
+    requests: List[Request] = []
+    registered = []
+    for i, (lat, lon) in enumerate(sites):
+        form = {'latitude': str(lat), 'longitude': str(lon)}
+        roll = rng.random()
+        if roll < multi_ratio and len(fresh) >= views:
+            start = int(rng.integers(0, len(fresh) - views + 1))
+            requests.append(('/verify-tree-multi', form, fresh[start:start + views]))
+        elif roll < multi_ratio + dup_ratio and dup_photos:
+            photo = dup_photos[i % len(dup_photos)]
+            registered.append(((lat, lon), photo))
+            requests.append(('/verify-tree', form, [photo]))
+        else:
+            requests.append(('/verify-tree', form, [fresh[int(rng.integers(0, len(fresh)))]]))
+    return requests, registered
+
+
+async def _send(client: httpx.AsyncClient, req: Request) -> Tuple[int, Optional[str]]:
+    endpoint, form, photos = req
+    if endpoint == '/verify-tree':
+        files = [('image', ('tree.jpg', photos[0], 'image/jpeg'))]
+    else:
+        files = [('images', (f'view{i}.jpg', p, 'image/jpeg')) for i, p in enumerate(photos)]
+    r = await client.post(endpoint, data=form, files=files)
+    try:
+        status = r.json().get('status')
+    except ValueError:
+        status = None
+    return r.status_code, status
+
+
+async def drive(client: httpx.AsyncClient, requests: List[Request], concurrency: int, warmup: int) -> dict:
+    for req in requests[:warmup]:
+        await _send(client, req)
+    queue = list(reversed(requests[warmup:]))
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    http: Dict[str, Counter] = defaultdict(Counter)
+    errors: List[str] = []
+
+    async def worker():
+        while queue:
+            req = queue.pop()
+            t0 = time.perf_counter()
+            try:
+                code, status = await _send(client, req)
+            except httpx.HTTPError as e:
+                errors.append(f"{req[0]}: {e!r}")
+                continue
+            latencies[req[0]].append((time.perf_counter() - t0) * 1000.0)
+            http[req[0]][str(code)] += 1
+            statuses[req[0]][status or 'none'] += 1
+            if code >= 500 and code != 503:
+                errors.append(f"{req[0]}: HTTP {code}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done = sum(len(v) for v in latencies.values())
+    return {
+        "throughput_per_s": round(done / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": percentiles([t for v in latencies.values() for t in v]),
+        "endpoints": {
+            endpoint: {
+                "requests": len(times),
+                "throughput_per_s": round(len(times) / elapsed, 2) if elapsed > 0 else 0.0,
+                "latency_ms": percentiles(times),
+                "statuses": dict(statuses[endpoint]),
+                "http": dict(http[endpoint]),
+            } for endpoint, times in sorted(latencies.items())
+        },
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }
+
+
+async def run_in_process(args, requests: List[Request], fixture) -> dict:
+    # Imported here: the app reads its configuration from the environment set up in main()
+    from app import main as service
+    from app.ai_checks import compute_phash, read_image_from_bytes
+    from benchmarks.fixtures import InMemoryRepo, add_trees
+
+    if args.full_path:
+        service.THRESHOLDS.min_clip_margin = -1.0
+    if fixture is not None:
+        tree_fixture, registered = fixture
+        add_trees(tree_fixture, [site for site, _ in registered],
+                  [compute_phash(read_image_from_bytes(photo)) for _, photo in registered])
+        service.repo = InMemoryRepo(tree_fixture)
+    async with service.app.router.lifespan_context(service.app):
+        # Index sync runs in the background; wait for it like a warmed-up replica would
+        while service.repo.is_connected() and not (service.vector_index.ready and service.phash_index.ready):
+            await asyncio.sleep(0.1)
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            result = await drive(client, requests, args.concurrency, args.warmup)
+        result["execution"] = {"mode": service.backend.mode, "pool_size": service.backend.pool_size}
+    return result
+
+
+async def run_remote(args, requests: List[Request]) -> dict:
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        return await drive(client, requests, args.concurrency, args.warmup)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='timed requests (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=4, help='untimed requests first (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8, help='clients in the closed loop (default: %(default)s)')
+    parser.add_argument('--multi-ratio', type=float, default=0.2, help='share of multi-view requests (default: %(default)s)')
+    parser.add_argument('--dup-ratio', type=float, default=0.1,
+                        help='share of re-uploads of already registered photos (default: %(default)s)')
+    parser.add_argument('--views', type=int, default=3, help='photos per multi-view request (default: %(default)s)')
+    parser.add_argument('--photos', help='directory of tree photos to use instead of synthetic ones')
+    parser.add_argument('--photo-pool', type=int, default=32, help='distinct photos (default: %(default)s)')
+    parser.add_argument('--width', type=int, default=1600, help='synthetic photo width, 4:3 (default: %(default)s)')
+    parser.add_argument('--trees', type=int, default=20000, help='trees in the in-memory fixture (default: %(default)s)')
+    parser.add_argument('--clusters', type=int, default=60, help='planting clusters in the fixture (default: %(default)s)')
+    parser.add_argument('--dim', type=int, default=1280,
+                        help="fixture embedding width; must match the encoder's (default: %(default)s)")
+    parser.add_argument('--repo', choices=('memory', 'mongo'), default='memory',
+                        help='in-memory fixture, or the database at MONGO_URI (default: %(default)s)')
+    parser.add_argument('--url', help='base URL of a running service to load instead of the in-process app')
+    parser.add_argument('--full-path', action='store_true',
+                        help='zero the tree-check thresholds so every request reaches dedupe')
+    parser.add_argument('--baseline', help='JSON result of an earlier run to compare against')
+    parser.add_argument('--save', help='write this run to a JSON file (e.g. to become the baseline)')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='allowed relative regression vs the baseline (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+
+    os.environ.setdefault('RESULT_CACHE_SIZE', '0')
+    os.environ.setdefault('MODEL_WARMUP_WAIT', '1')
+    if args.full_path:
+        os.environ.update(TREE_CONFIDENCE_MIN='0', MIN_VEG_RATIO='0', MIN_BLUR_SCORE='0')
+    if args.repo == 'memory':
+        # Keep the app from connecting anywhere; the fixture is swapped in before startup
+        os.environ.pop('MONGO_URI', None)
+
+    from benchmarks.fixtures import make_trees, sample_sites
+    photos = load_photos(args.photos, args.photo_pool, args.width)
+    tree_fixture = make_trees(args.trees, args.clusters, dim=args.dim)
+    sites = sample_sites(tree_fixture, args.warmup + args.requests)
+    requests, registered = plan(photos, sites, args.multi_ratio, args.dup_ratio, args.views)
+
+    if args.url:
+        result = asyncio.run(run_remote(args, requests))
+    else:
+        fixture = (tree_fixture, registered) if args.repo == 'memory' else None
+        result = asyncio.run(run_in_process(args, requests, fixture))
+        result.update(peak_rss_mb())  # after shutdown, so process workers have been reaped
+    result = {
+        "config": {"requests": args.requests, "concurrency": args.concurrency, "multi_ratio": args.multi_ratio,
+                   "dup_ratio": args.dup_ratio, "trees": args.trees if args.repo == 'memory' and not args.url else None,
+                   "photos": args.photos or f"synthetic {args.width}px", "full_path": args.full_path},
+        **result,
+    }
+    regressions = check_baseline(result, args.baseline, args.tolerance, args.save)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{args.requests} requests, concurrency {args.concurrency}: {result['throughput_per_s']} req/s, "
+              f"latency {result['latency_ms']}")
+        for endpoint, row in result["endpoints"].items():
+            print(f"  {endpoint:<18} {row['requests']:>5} req {row['throughput_per_s']:>8} req/s  "
+                  f"{row['latency_ms']}  {row['statuses']}")
+        if 'peak_rss_mb' in result:
+            print(f"  peak RSS {result['peak_rss_mb']} MB (largest worker process {result['peak_worker_rss_mb']} MB)")
+        for line in result["error_samples"]:
+            print(f"ERROR {line}")
+        for line in regressions:
+            print(f"REGRESSION {line}")
+    sys.exit(1 if regressions or result["errors"] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Worker memory with private vs memory-mapped (shared) model weights.
+
+Run from ai-service/ (Linux: reads /proc):
+
+    python -m benchmarks.memory [--workers 1,2,4] [--weights-dir DIR] [--json]
+
+For each worker count the EXEC_MODE=process pool is started twice: once
+with every worker loading its own weights, and once with SHARED_WEIGHTS_DIR.
+Once every worker has loaded and warmed its models, RSS and PSS are summed
+over the workers. RSS counts a shared page in every process that maps it.
+PSS splits it between them, so total PSS is what the workers really cost
+the node. With shared weights, each extra worker should add its own
+activations and runtime but not another copy of the weights. Without
+--weights-dir the weights are written to a temporary directory first.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from app.executor import ExecutionBackend
+
+
+def _rollup_mb(pid: int) -> Dict[str, float]:
+    out = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r', encoding='ascii') as fh:
+        for line in fh:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss', 'Shared_Clean', 'Private_Dirty'):
+                out[key.lower()] = int(rest.split()[0]) / 1024.0
+    return out
+
+
+def _pid_after(seconds: float) -> int:
+    # Every idle worker picks up one of these, so the results cover the pool
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def measure(workers: int, weights_dir: Optional[str]) -> dict:
+    """Summed memory (MB) of a warmed process pool of `workers`; shared weights from `weights_dir` if given."""
+    if weights_dir:
+        os.environ['SHARED_WEIGHTS_DIR'] = weights_dir
+    else:
+        os.environ.pop('SHARED_WEIGHTS_DIR', None)  # read by each worker as it imports the models
+    backend = ExecutionBackend(mode='process', pool_size=workers)
+    backend.start()
+    try:
+        pids = set()
+        while len(pids) < workers:
+            pids.update(f.result() for f in [backend.cpu_pool.submit(_pid_after, 0.5) for _ in range(workers)])
+        per_worker = [_rollup_mb(pid) for pid in sorted(pids)]
+    finally:
+        backend.shutdown()
+    total = {k: round(sum(w[k] for w in per_worker), 1) for k in per_worker[0]}
+    return {"workers": workers, "total_mb": total, "pss_per_worker_mb": round(total["pss"] / workers, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated pool sizes (default: %(default)s)')
+    parser.add_argument('--weights-dir', help='SHARED_WEIGHTS_DIR to use (default: a temporary one)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+
+    counts: List[int] = [int(n) for n in args.workers.split(',') if n.strip()]
+    weights_dir = args.weights_dir or tempfile.mkdtemp(prefix='shared-weights-')
+    try:
+        measure(1, weights_dir)  # writes the weight files, so the timed runs only map them
+        rows = [{"private": measure(n, None), "shared": measure(n, weights_dir)} for n in counts]
+    finally:
+        if not args.weights_dir:
+            shutil.rmtree(weights_dir, ignore_errors=True)
+    if args.json:
+        print(json.dumps({"rows": rows}, indent=2))
+    else:
+        print(f"{'workers':>7} {'private RSS':>12} {'private PSS':>12} {'shared RSS':>11} {'shared PSS':>11} {'PSS saved':>10}")
+        for row in rows:
+            p, s = row["private"]["total_mb"], row["shared"]["total_mb"]
+            print(f"{row['private']['workers']:>7} {p['rss']:>9.0f} MB {p['pss']:>9.0f} MB {s['rss']:>8.0f} MB "
+                  f"{s['pss']:>8.0f} MB {100.0 * (1.0 - s['pss'] / p['pss']):>9.0f}%")
+
+
+if __name__ == '__main__':
+    main()
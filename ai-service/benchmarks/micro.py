@@ -0,0 +1,132 @@
+"""Per-check microbenchmarks of `ai_checks` at several upload resolutions.
+
+Run from ai-service/:
+
+    python -m benchmarks.micro [--sizes 640x480,1600x1200,4000x3000] [--repeat 5]
+                               [--baseline micro.json] [--save micro.json] [--tolerance 0.2] [--json]
+
+Each check runs on a fresh `ImageBundle` whose shared views (EXIF-corrected
+RGB and the downscaled working copy) are built before timing, so a check
+is charged only for its own work; building those views is reported as
+`views`. `decode` is `read_image_from_bytes` plus the pixel decode of the
+synthetic JPEG upload. Reported per size: median and p95 ms per check. With
+--baseline, exits non-zero when a median or p95 is slower than the baseline
+by more than --tolerance.
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from app.ai_checks import (
+    ImageBundle, Thresholds, blur_score_fft, clip_tree_stats, compute_phash, encode_feature_vector,
+    ensure_models_loaded, error_level_analysis, is_tree_like, orb_features, orb_match_ratio,
+    read_image_from_bytes,
+)
+from benchmarks.decode import synthetic_jpeg
+from benchmarks.report import check_baseline, percentiles
+
+DEFAULT_SIZES = '640x480,1600x1200,4000x3000'
+
+
+def _decode(data: bytes):
+    img = read_image_from_bytes(data)
+    img.load()
+    return img
+
+
+def _build_views(bundle: ImageBundle) -> None:
+    # The array view builds the rgb and working views it depends on
+    bundle.working_array
+
+
+def _prepared(data: bytes) -> ImageBundle:
+    bundle = ImageBundle(_decode(data))
+    _build_views(bundle)
+    return bundle
+
+
+def checks() -> Dict[str, Callable[[ImageBundle, ImageBundle], object]]:
+    m = ensure_models_loaded()
+    thresholds = Thresholds(min_blur_score=0.0)  # no early exit, so every signal is computed
+    return {
+        "blur": lambda b, _: blur_score_fft(b),
+        "phash": lambda b, _: compute_phash(b),
+        "person": lambda b, _: b.person,
+        "vegetation": lambda b, _: m.vegetation_ratio(b),
+        "clip": lambda b, _: clip_tree_stats(b),
+        "encoder": lambda b, _: encode_feature_vector(b),
+        "ela": lambda b, _: error_level_analysis(b),
+        "orb": lambda b, _: orb_features(b),
+        "orb_match": lambda b, other: orb_match_ratio(b, other),
+        "is_tree_like": lambda b, _: is_tree_like(b, thresholds, explain=True),
+    }
+
+
+def _time(fn: Callable[[], object], setup: Callable[[], Tuple], repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        t0 = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return {"median": round(statistics.median(times), 2), "p95": percentiles(times, (95,))["p95"]}
+
+
+def run(sizes: List[Tuple[int, int]], repeat: int = 5) -> dict:
+    table = checks()
+    out = {}
+    for w, h in sizes:
+        data, other = synthetic_jpeg(w, h, seed=1), synthetic_jpeg(w, h, seed=2)
+        peer = _prepared(other)
+        orb_features(peer)
+        decoded = _decode(data).size
+        row = {
+            "decode": _time(_decode, lambda: (data,), repeat),
+            "views": _time(_build_views, lambda: (ImageBundle(_decode(data)),), repeat),
+        }
+        # One untimed call per check first: lazy model loading and first-call allocations
+        for name, fn in table.items():
+            fn(_prepared(data), peer)
+
+            def setup():
+                bundle = _prepared(data)
+                if name == "orb_match":
+                    orb_features(bundle)  # time the matching only
+                return bundle, peer
+            row[name] = _time(fn, setup, repeat)
+        out[f"{w}x{h}"] = {"decoded_size": list(decoded), "checks_ms": row}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated WxH upload sizes (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per check and size (default: %(default)s)')
+    parser.add_argument('--baseline', help='JSON result of an earlier run to compare against')
+    parser.add_argument('--save', help='write this run to a JSON file (e.g. to become the baseline)')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown vs the baseline (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable JSON')
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in s.lower().split('x')) for s in args.sizes.split(',') if s.strip()]
+    result = {"config": {"repeat": args.repeat}, "sizes": run(sizes, args.repeat)}
+    regressions = check_baseline(result, args.baseline, args.tolerance, args.save)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for size, row in result["sizes"].items():
+            print(f"{size} (decoded {row['decoded_size'][0]}x{row['decoded_size'][1]})")
+            for name, t in row["checks_ms"].items():
+                print(f"  {name:<13} {t['median']:>9.2f} ms  p95 {t['p95']:>9.2f} ms")
+        for line in regressions:
+            print(f"REGRESSION {line}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Shared helpers for the benchmark suite: percentiles, peak RSS and baselines.
+
+Results are nested dicts of numbers. A saved result can serve as the baseline
+of a later run: every metric present in both is compared, using the key to
+tell which direction is worse (`*_per_s` must not drop; `*_ms`, `*_mb` and
+`*_s` must not grow).
+"""
+from __future__ import annotations
+import json
+import resource
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+HIGHER_IS_BETTER = ('_per_s',)
+LOWER_IS_BETTER = ('_ms', '_mb', '_s')
+
+
+def percentiles(values: Sequence[float], points: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+    """Nearest-rank percentiles, as {"p50": ..., ...}, rounded to 0.01."""
+    if not values:
+        return {f"p{p}": 0.0 for p in points}
+    ordered = sorted(values)
+    return {f"p{p}": round(ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))], 2)
+            for p in points}
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Peak resident set size of this process and of its largest reaped child (process workers)."""
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"peak_rss_mb": round(own / unit, 1), "peak_worker_rss_mb": round(children / unit, 1)}
+
+
+def _flatten(result: Dict[str, Any], prefix: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in result.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{path}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, float(value)
+
+
+def _direction(path: str) -> int:
+    # +1: higher is better, -1: lower is better, 0: informational. A unit-less key
+    # (e.g. "p95" under "latency_ms") takes the unit of its nearest ancestor that has one.
+    for part in reversed(path.split('.')):
+        if part.endswith(HIGHER_IS_BETTER):
+            return 1
+        if part.endswith(LOWER_IS_BETTER):
+            return -1
+    return 0
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of `current` against `baseline` beyond the relative `tolerance`."""
+    base = dict(_flatten(baseline))
+    regressions = []
+    for path, value in _flatten(current):
+        direction = _direction(path)
+        ref = base.get(path)
+        if not direction or ref is None or ref <= 0:
+            continue
+        change = (value - ref) / ref
+        if -direction * change > tolerance:
+            regressions.append(f"{path}: {value:g} vs baseline {ref:g} ({change:+.0%})")
+    return regressions
+
+
+def load_baseline(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not path:
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def save_result(path: str, result: Dict[str, Any]) -> None:
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(result, fh, indent=2)
+        fh.write('\n')
+
+
+def check_baseline(result: Dict[str, Any], baseline_path: Optional[str], tolerance: float,
+                   save_path: Optional[str] = None) -> List[str]:
+    """Compare against the baseline file (if it exists), then optionally save `result`.
+
+    The comparison is recorded in `result["baseline"]`, including whether both
+    runs used the same `config`; returns the regressions.
+    """
+    baseline = load_baseline(baseline_path)
+    regressions = compare(result, baseline, tolerance) if baseline is not None else []
+    if baseline_path:
+        result["baseline"] = {"path": baseline_path, "found": baseline is not None,
+                              "same_config": baseline is not None and baseline.get("config") == result.get("config"),
+                              "tolerance": tolerance, "regressions": regressions}
+    if save_path:
+        save_result(save_path, {k: v for k, v in result.items() if k != "baseline"})
+    return regressions
@@ -0,0 +1,51 @@
+"""Shared fixtures. The service runs without a database and loads no models up front."""
+import os
+
+import pytest
+
+os.environ.setdefault('MONGO_URI', '')
+os.environ.setdefault('MODEL_WARMUP', '0')
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope='session')
+def untrained_weights():
+    """Model constructors build the real architectures with seeded random weights, no download."""
+    import open_clip
+    import timm
+    import torch
+
+    create_model, create_clip = timm.create_model, open_clip.create_model_and_transforms
+
+    def encoder(name, pretrained=False, **kwargs):
+        torch.manual_seed(0)
+        return create_model(name, pretrained=False, **kwargs)
+
+    def clip(name, pretrained=None, **kwargs):
+        torch.manual_seed(1)
+        return create_clip(name, pretrained=None, **kwargs)
+
+    patch = pytest.MonkeyPatch()
+    patch.setattr(timm, 'create_model', encoder)
+    patch.setattr(open_clip, 'create_model_and_transforms', clip)
+    yield
+    patch.undo()
+
+
+@pytest.fixture(scope='session')
+def models(untrained_weights):
+    """The torch models `ensure_models_loaded` returns, with untrained weights."""
+    from app import ai_checks
+
+    previous = ai_checks.MODELS
+    ai_checks.MODELS = ai_checks.Models(artifact_dir=None, backend='torch')
+    yield ai_checks.MODELS
+    ai_checks.MODELS = previous
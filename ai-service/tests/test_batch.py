@@ -0,0 +1,89 @@
+"""`/verify-batch` planning: manifest validation, path resolution, geo-cell chunking."""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.batch import BatchItem, cell_center, cell_query_radius, geo_cell, parse_items, plan_chunks, resolve_path
+from app.vector_index import haversine_m
+
+
+def _items(coords):
+    return [BatchItem(index=i, ref=None, lat=lat, lon=lon, image=i) for i, (lat, lon) in enumerate(coords)]
+
+
+def test_chunks_never_span_cells_and_keep_input_order():
+    rng = np.random.default_rng(0)
+    coords = [(12.0 + float(a), 77.0 + float(b)) for a, b in rng.uniform(0, 0.01, (60, 2))]
+    chunks = plan_chunks(_items(coords), cell_m=250.0, chunk_size=4)
+    assert sorted(it.index for chunk in chunks for it in chunk) == list(range(60))
+    for chunk in chunks:
+        assert 1 <= len(chunk) <= 4
+        assert len({it.cell for it in chunk}) == 1
+        assert [it.index for it in chunk] == sorted(it.index for it in chunk)
+    cells = [chunk[0].cell for chunk in chunks]
+    assert cells == sorted(cells)
+
+
+def test_same_cell_items_share_chunks():
+    items = _items([(10.0, 20.0)] * 5)
+    assert [[it.index for it in chunk] for chunk in plan_chunks(items, 250.0, 2)] == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.parametrize('lat', [0.0, 45.0, -60.0, 80.0])
+def test_cell_query_radius_covers_the_cell(lat):
+    cell_m, radius_m = 250.0, 100.0
+    rng = np.random.default_rng(1)
+    center = cell_center(geo_cell(lat, 30.0, cell_m), cell_m)
+    for _ in range(200):
+        p_lat, p_lon = lat + rng.uniform(-0.01, 0.01), 30.0 + rng.uniform(-0.01, 0.01)
+        if geo_cell(p_lat, p_lon, cell_m) != geo_cell(lat, 30.0, cell_m):
+            continue
+        # Every point of the cell is within its query radius (minus the geofence) of the centre
+        dist = haversine_m(center[0], center[1], np.asarray([p_lat]), np.asarray([p_lon]))[0]
+        assert dist + radius_m <= cell_query_radius(cell_m, radius_m)
+
+
+def test_parse_items_defaults_and_errors():
+    items = parse_items([{'lat': 1, 'lon': 2, 'id': 'a'}, {'lat': '3', 'lon': 4, 'path': 'x/y.jpg'}], 1, 10)
+    assert (items[0].image, items[0].ref, items[1].path, items[1].image) == (0, 'a', 'x/y.jpg', None)
+    for raw, n_files, message in [
+        ([], 1, 'non-empty'),
+        ([{'lat': 1, 'lon': 2}] * 3, 3, 'at most'),
+        ([{'lat': 1}], 1, 'numeric lat and lon'),
+        ([{'lat': 91, 'lon': 0}], 1, 'out of range'),
+        ([{'lat': 1, 'lon': 2, 'image': 5}], 1, 'does not match'),
+        ([{'lat': 1, 'lon': 2, 'image': True}], 2, 'does not match'),
+        ([{'lat': 1, 'lon': 2, 'path': ''}], 0, 'non-empty string'),
+    ]:
+        with pytest.raises(ValueError, match=message):
+            parse_items(raw, n_files, 2)
+
+
+def test_resolve_path_stays_under_root(tmp_path):
+    root = tmp_path / 'root'
+    (root / 'a').mkdir(parents=True)
+    assert resolve_path(str(root), 'a/b.jpg') == os.path.join(os.path.realpath(root), 'a', 'b.jpg')
+    for bad in ['../x.jpg', 'a/../../x.jpg', str(tmp_path / 'x.jpg')]:
+        with pytest.raises(ValueError):
+            resolve_path(str(root), bad)
+    # A symlink out of the root is refused too
+    (root / 'out').symlink_to(tmp_path)
+    with pytest.raises(ValueError):
+        resolve_path(str(root), 'out/x.jpg')
+
+
+def test_unreadable_uploads_fail_only_their_items(client):
+    corrupt = b'\xff\xd8\xff' + b'0' * 100  # sniffs as JPEG, does not decode
+    files = [('images', (f'{i}.jpg', data, 'image/jpeg'))
+             for i, data in enumerate([corrupt, corrupt, b'garbage-data'])]
+    items = [{'lat': 10.0 + i, 'lon': 20.0, 'id': str(i)} for i in range(3)]
+    r = client.post('/verify-batch', files=files, data={'items': json.dumps(items)})
+    assert r.status_code == 200
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    by_id = {line['id']: line for line in lines[:-1]}
+    assert sorted(by_id) == ['0', '1', '2']
+    assert all(line['status_code'] == 422 and line['reason'] == 'Unreadable image' for line in by_id.values())
+    assert 'not a JPEG' in by_id['2']['detail']
+    assert lines[-1]['summary']['statuses'] == {'ERROR': 3}
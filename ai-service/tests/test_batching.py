@@ -0,0 +1,75 @@
+"""MicroBatcher: coalescing, per-caller rows, failures; configure_batching."""
+import threading
+import time
+
+import pytest
+
+from app import ai_checks
+from app.batching import MicroBatcher
+
+
+def _recording(sizes, fail_on=None):
+    def fn(items):
+        sizes.append(len(items))
+        if fail_on is not None and fail_on in items:
+            raise ValueError(f"bad item {fail_on}")
+        return [item * 10 for item in items]
+    return fn
+
+
+def test_batches_fill_up_then_close_on_timeout():
+    sizes = []
+    batcher = MicroBatcher(_recording(sizes), max_batch_size=3, max_wait_ms=200)
+    start = time.monotonic()
+    futures = [batcher.submit(i) for i in range(7)]
+    assert [f.result(timeout=5) for f in futures] == [i * 10 for i in range(7)]
+    assert sizes == [3, 3, 1]
+    # Only the last, partial batch waited out the window
+    assert time.monotonic() - start >= 0.2
+    assert batcher.stats()['max_batch_seen'] == 3 and batcher.items == 7
+
+
+def test_concurrent_callers_get_their_own_rows():
+    sizes = []
+    batcher = MicroBatcher(_recording(sizes), max_batch_size=8, max_wait_ms=50)
+    results = {}
+    barrier = threading.Barrier(8)
+
+    def call(i):
+        barrier.wait()
+        results[i] = batcher(i)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert results == {i: i * 10 for i in range(8)}
+    assert sum(sizes) == 8 and len(sizes) < 8
+
+
+def test_failure_reaches_every_waiter_and_the_batcher_keeps_going():
+    sizes = []
+    batcher = MicroBatcher(_recording(sizes, fail_on=2), max_batch_size=4, max_wait_ms=100)
+    futures = [batcher.submit(i) for i in range(4)]
+    for f in futures:
+        with pytest.raises(ValueError, match='bad item 2'):
+            f.result(timeout=5)
+    assert batcher.submit(5).result(timeout=5) == 50
+
+
+def test_wrong_row_count_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=2, max_wait_ms=100)
+    futures = [batcher.submit(i) for i in range(2)]
+    for f in futures:
+        with pytest.raises(RuntimeError, match='returned 1 rows for 2 items'):
+            f.result(timeout=5)
+
+
+def test_configure_batching(monkeypatch):
+    monkeypatch.setattr(ai_checks, 'CLIP_BATCHER', None)
+    monkeypatch.setattr(ai_checks, 'ENCODER_BATCHER', None)
+    ai_checks.configure_batching(4, 2.5)
+    assert ai_checks.CLIP_BATCHER.max_batch_size == 4 and ai_checks.ENCODER_BATCHER.max_wait_s == 0.0025
+    ai_checks.configure_batching(1, 2.5)
+    assert ai_checks.CLIP_BATCHER is None and ai_checks.ENCODER_BATCHER is None
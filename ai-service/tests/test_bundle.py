@@ -0,0 +1,39 @@
+"""ImageBundle: one shared decode gives the signals of one decode per check."""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.ai_checks import TREE_CHECK, ImageBundle, Thresholds, is_tree_like, read_image_from_bytes
+
+
+def _jpeg(rng, size, green):
+    w, h = size
+    base = rng.integers(0, 255, (h // 16, w // 16, 3), dtype=np.uint8)
+    if green:
+        base[..., 1] = np.maximum(base[..., 1], 170)
+    img = Image.fromarray(base).resize(size, Image.BICUBIC)
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def _per_check(data):
+    # Every stage measured on its own fresh decode, as each check once decoded the upload itself
+    signals = {}
+    for st in TREE_CHECK.stages:
+        signals.update(st.measure(ImageBundle(read_image_from_bytes(data), data)))
+    return signals
+
+
+@pytest.mark.parametrize('size', [(640, 480), (2400, 1800)])
+@pytest.mark.parametrize('green', [False, True])
+def test_shared_bundle_matches_per_check_decode(models, size, green):
+    data = _jpeg(np.random.default_rng(size[0] + green), size, green)
+    thresholds = Thresholds(min_veg_ratio=0.0, min_blur_score=0.0, tree_confidence_min=0.0, min_clip_margin=-1.0)
+    _, _, info = is_tree_like(ImageBundle(read_image_from_bytes(data), data), thresholds, explain=True)
+    expected = _per_check(data)
+    for key, value in expected.items():
+        assert info[key] == pytest.approx(value, abs=1e-5), key
+    assert info['skipped'] == []
@@ -0,0 +1,115 @@
+"""Cascade: cost order, early exit, known signals, screens and explain."""
+from app.cascade import Cascade, Stage
+
+
+def _cascade(calls):
+    def measure(name, value):
+        def fn(subject):
+            calls.append(name)
+            return {name: subject[name] if name in subject else value}
+        return fn
+
+    def below(name, key):
+        return lambda s, t: [name] if s[name] < getattr(t, key) else []
+
+    return Cascade([
+        Stage('model', 100.0, ('model',), measure('model', 1.0), below('model', 'min_model')),
+        Stage('size', 0.0, ('size',), measure('size', 1.0), below('size', 'min_size')),
+        Stage('blur', 3.0, ('blur',), measure('blur', 1.0), below('blur', 'min_blur')),
+    ])
+
+
+class T:
+    min_model = 0.5
+    min_size = 0.5
+    min_blur = 0.5
+
+
+def test_stages_run_cheapest_first():
+    calls = []
+    reasons, info = _cascade(calls).run({}, T())
+    assert reasons == [] and info['reason'] is None and info['skipped'] == []
+    assert calls == ['size', 'blur', 'model']
+
+
+def test_first_failure_ends_the_run():
+    calls = []
+    reasons, info = _cascade(calls).run({'blur': 0.1}, T())
+    assert reasons == ['blur'] and info['reason'] == 'blur'
+    assert calls == ['size', 'blur']
+    assert info['skipped'] == ['model'] and 'model' not in info
+
+
+def test_explain_runs_every_stage():
+    calls = []
+    reasons, info = _cascade(calls).run({'size': 0.1, 'blur': 0.1}, T(), explain=True)
+    assert reasons == ['size', 'blur'] and info['reason'] == 'size'
+    assert calls == ['size', 'blur', 'model']
+    assert [(s['stage'], s['reasons']) for s in info['stages']] == [('size', ['size']), ('blur', ['blur']), ('model', [])]
+    assert all(s['ms'] >= 0 for s in info['stages'])
+
+
+def test_known_signals_are_not_measured_again():
+    calls = []
+    reasons, info = _cascade(calls).run({}, T(), known={'size': 1.0, 'blur': 0.9})
+    assert reasons == [] and calls == ['model'] and info['blur'] == 0.9
+    # Known signals still reject
+    reasons, _ = _cascade([]).run({}, T(), known={'size': 0.1})
+    assert reasons == ['size']
+
+
+def test_screen_skips_expensive_stages_then_resumes():
+    calls = []
+    cascade = _cascade(calls)
+    reasons, screen = cascade.run({}, T(), max_cost_ms=10.0)
+    assert reasons == [] and screen['skipped'] == ['model'] and calls == ['size', 'blur']
+    reasons, full = cascade.run({'model': 0.1}, T(), known=screen)
+    assert reasons == ['model'] and calls == ['size', 'blur', 'model']
+    assert full['skipped'] == []
+
+
+def test_tree_check_order():
+    from app.ai_checks import TREE_CHECK
+    assert [s.name for s in TREE_CHECK.stages] == ['size', 'vegetation', 'blur', 'person', 'clip']
+
+
+def test_blurry_low_green_photo_is_rejected_for_vegetation():
+    # Vegetation is cheaper than blur, so it decides what the user reads
+    import asyncio
+    from types import SimpleNamespace
+    from app.ai_checks import TREE_CHECK, Thresholds
+    from app.main import _decide_single
+
+    t = Thresholds()
+    known = {'w': 1024, 'h': 768, 'vegetation_ratio': t.min_veg_ratio / 2, 'blur': t.min_blur_score / 2}
+    reasons, info = TREE_CHECK.run(None, t, known=known)
+    assert reasons == ['low_vegetation'] and info['skipped'] == ['blur', 'person', 'clip']
+    analysis = SimpleNamespace(tree_ok=False, tree_score=0.0, tree_info=info)
+    status, body = asyncio.run(_decide_single(analysis, 0.0, 0.0))
+    assert status == 422 and body['reason'] == "Not enough vegetation signal"
+
+
+def test_early_phash_lookup_checks_the_geofence_trees():
+    import asyncio
+    from app import main
+    from app.database import NearbyTrees, TreeRecord
+
+    ph = 'f0f0f0f0f0f0f0f0'
+    trees = NearbyTrees([TreeRecord('t1', 0.0, 0.0, 'f0f0f0f0f0f0f0f1', None),
+                         TreeRecord('t2', 0.0, 0.0, None, None)])
+
+    async def run(result):
+        async def query():
+            return result
+        task = asyncio.ensure_future(query())
+        duplicate_of = main._early_phash_lookup(task)
+        before = duplicate_of(ph)  # the query has not answered yet
+        await task
+        await asyncio.sleep(0)  # done callbacks run on the next loop turn
+        return before, duplicate_of(ph), main._finished_trees(task)
+
+    before, after, finished = asyncio.run(run(trees))
+    assert before is None and after == ('t1', 1) and finished is trees
+    # A dense cluster is left to the dedupe step
+    crowd = NearbyTrees([TreeRecord(str(i), 0.0, 0.0, ph, None) for i in range(main.CLUSTER_MAX_IN_RADIUS + 1)])
+    assert asyncio.run(run(crowd))[1] is None
@@ -0,0 +1,92 @@
+"""Mongo circuit breaker: opening, refusing queries, half-open and closing."""
+import pytest
+from pymongo.errors import AutoReconnect
+
+from app import database
+from app.database import CircuitBreaker, MongoRepo, RepoUnavailable
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(database.time, 'time', lambda: now[0])
+    return now
+
+
+class UntouchableCollection:
+    """Fails the test on any use: an open circuit must not reach the driver."""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"driver used while the circuit is open: {name}")
+
+
+def _failing(breaker, n):
+    for _ in range(n):
+        breaker.record_failure(AutoReconnect("connection refused"))
+
+
+def test_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown_s=30)
+    _failing(breaker, 2)
+    assert breaker.state == 'closed'
+    _failing(breaker, 1)
+    assert breaker.state == 'open' and breaker.trips == 1
+    assert breaker.stats()['last_error'] == 'AutoReconnect: connection refused'
+
+
+def test_success_resets_the_count(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown_s=30)
+    _failing(breaker, 2)
+    breaker.record_success()
+    _failing(breaker, 2)
+    assert breaker.state == 'closed'
+
+
+def test_open_circuit_refuses_without_the_driver(clock):
+    repo = MongoRepo()
+    repo.coll = UntouchableCollection()
+    repo.breaker = CircuitBreaker(threshold=1, cooldown_s=30)
+    repo.breaker.record_failure(AutoReconnect("down"))
+    assert not repo.is_connected()
+    for call in (lambda: repo.find_nearby(1.0, 2.0, 20.0), lambda: repo.find_vectors(['a']),
+                 lambda: repo.find_registered(['ab'])):
+        with pytest.raises(RepoUnavailable, match='circuit open'):
+            call()
+
+
+def test_half_open_after_cooldown_then_closes(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown_s=30)
+    _failing(breaker, 1)
+    clock[0] += 29
+    assert breaker.is_open
+    clock[0] += 1
+    assert breaker.state == 'half_open' and not breaker.is_open
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+
+
+def test_failure_while_half_open_reopens(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown_s=30)
+    _failing(breaker, 3)
+    clock[0] += 30
+    assert breaker.state == 'half_open'
+    _failing(breaker, 1)  # one failure is enough
+    assert breaker.state == 'open' and breaker.trips == 1
+    clock[0] += 30
+    assert breaker.state == 'half_open'
+
+
+def test_failed_probes_hold_it_open(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown_s=30)
+    breaker.record_failure(AutoReconnect("ping failed"), trip=True)
+    for _ in range(10):
+        clock[0] += 5
+        breaker.record_failure(AutoReconnect("ping failed"), trip=True)
+    assert breaker.is_open and breaker.trips == 1
+
+
+def test_zero_cooldown_waits_for_a_probe(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown_s=0)
+    _failing(breaker, 1)
+    clock[0] += 3600
+    assert breaker.is_open
@@ -0,0 +1,73 @@
+"""Upload decoding: reduced-resolution JPEG decodes, the pixel cap and undecodable bodies."""
+import io
+
+import pytest
+from PIL import Image
+
+from app import ai_checks
+from app.ai_checks import DECODE_MIN_SIDE, ImageBundle, ImageTooLarge, read_image_from_bytes
+from app.ingest import UnsupportedImage
+
+CORRUPT_JPEG = b'\xff\xd8\xff' + b'0' * 100  # a JPEG signature, then garbage
+
+
+def _jpeg(size=(64, 48)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (40, 160, 60)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def test_corrupt_body_is_unsupported():
+    with pytest.raises(UnsupportedImage, match='could not be decoded'):
+        read_image_from_bytes(CORRUPT_JPEG)
+
+
+def test_failed_decode_is_unsupported():
+    # The header parses; the pixel data does not
+    data = _jpeg()
+    img = read_image_from_bytes(data)
+
+    def load():
+        raise OSError("broken data stream")
+    img.load = load
+    with pytest.raises(UnsupportedImage, match='broken data stream'):
+        ImageBundle(img, data).rgb
+
+
+def test_verify_tree_rejects_corrupt_body(client):
+    r = client.post('/verify-tree', files={'image': ('x.jpg', CORRUPT_JPEG, 'image/jpeg')},
+                    data={'latitude': '1', 'longitude': '2'})
+    assert r.status_code == 400
+    assert r.json()['detail'].startswith('Invalid file type')
+
+
+@pytest.mark.parametrize('size', [(1030, 1025), (2000, 1500), (4000, 3000), (3000, 4000), (5000, 1100), (1023, 1023)])
+def test_draft_decode_keeps_min_side(size):
+    data = _jpeg(size)
+    bundle = ImageBundle(read_image_from_bytes(data), data)
+    decoded = bundle.source.size
+    assert min(decoded) >= DECODE_MIN_SIDE
+    # Only ever scaled down, by a DCT factor, and the uploaded size is still reported
+    scale = size[0] / decoded[0]
+    assert scale in (1, 2, 4, 8) and decoded[1] == -(-size[1] // int(scale))
+    assert bundle.size == size
+
+
+def test_small_and_non_jpeg_uploads_decode_in_full():
+    buf = io.BytesIO()
+    Image.new('RGB', (3000, 2000), (10, 120, 30)).save(buf, 'PNG')
+    assert ImageBundle(read_image_from_bytes(buf.getvalue())).source.size == (3000, 2000)
+    assert ImageBundle(read_image_from_bytes(_jpeg((900, 700)))).source.size == (900, 700)
+
+
+def test_pixel_cap_is_checked_on_the_header():
+    with pytest.raises(ImageTooLarge, match='limit is 1000'):
+        read_image_from_bytes(_jpeg(), max_pixels=1000)
+    assert read_image_from_bytes(_jpeg(), max_pixels=64 * 48).size == (64, 48)
+
+
+def test_verify_tree_rejects_too_many_pixels(client, monkeypatch):
+    monkeypatch.setattr(ai_checks, 'MAX_DECODE_PIXELS', 1000)
+    r = client.post('/verify-tree', files={'image': ('big.jpg', _jpeg((80, 60)), 'image/jpeg')},
+                    data={'latitude': '1', 'longitude': '2'})
+    assert r.status_code == 413
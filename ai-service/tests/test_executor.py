@@ -0,0 +1,63 @@
+"""ExecutionBackend admission: shedding past the queue limit and slot release."""
+import asyncio
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+from app import main
+from app.executor import ExecutionBackend, Overloaded
+
+
+@pytest.fixture
+def backend():
+    b = ExecutionBackend(mode='thread', pool_size=1, queue_depth=0, shed_threshold=1, io_workers=1)
+    yield b
+    b.shutdown()
+
+
+def test_excess_call_is_shed(backend):
+    gate = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(backend.run_cpu(gate.wait, 5))
+        waiting = asyncio.ensure_future(backend.run_cpu(lambda: 'second'))
+        while backend.in_flight < 1 or backend.waiting < 1:
+            await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await backend.run_cpu(lambda: 'third')
+        gate.set()
+        return await running, await waiting
+
+    assert asyncio.run(scenario()) == (True, 'second')
+    assert backend.shed == 1 and backend.in_flight == 0 and backend.waiting == 0
+
+
+def test_slot_released_when_fn_raises(backend):
+    def fail():
+        raise ValueError("boom")
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                await backend.run_cpu(fail)
+        return await backend.run_cpu(lambda: 'ok')
+
+    assert asyncio.run(scenario()) == 'ok'
+    assert not backend._admission.locked() and backend.in_flight == 0
+
+
+def test_overloaded_endpoint_answers_503(client, monkeypatch):
+    async def shed(fn, *args):
+        raise Overloaded("32 requests already waiting for a worker")
+
+    monkeypatch.setattr(main.backend, 'run_cpu', shed)
+    monkeypatch.setattr(main.result_cache, 'max_entries', 0)
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), (30, 140, 40)).save(buf, 'JPEG')
+    r = client.post('/verify-tree', files={'image': ('t.jpg', buf.getvalue(), 'image/jpeg')},
+                    data={'latitude': '1', 'longitude': '2'})
+    assert r.status_code == 503
+    assert r.headers['Retry-After'] == '1'
+    assert r.json()['status'] == 'UNAVAILABLE'
@@ -0,0 +1,46 @@
+"""Blur score: the real-FFT form against the full fft2/fftshift formula."""
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.forensics import BLUR_SIZE, BLUR_TOLERANCE, blur_score, blur_scores, blur_thumbnail
+
+
+def fft2_blur(thumb: np.ndarray) -> float:
+    # The previous formula: complex FFT, centred, minus the central 64x64 box
+    magnitude = np.abs(np.fft.fftshift(np.fft.fft2(thumb)))
+    total = magnitude.sum()
+    c = BLUR_SIZE // 2
+    return float((total - magnitude[c - 32:c + 32, c - 32:c + 32].sum()) / (total + 1e-6))
+
+
+def _random_image(rng, size, smooth):
+    w, h = size
+    base = rng.integers(0, 255, (max(1, h // smooth), max(1, w // smooth), 3), dtype=np.uint8)
+    img = Image.fromarray(base).resize((w, h), Image.BICUBIC)
+    noise = rng.integers(-10, 10, (h, w, 3), dtype=np.int16)
+    return Image.fromarray(np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8))
+
+
+@pytest.mark.parametrize('size', [(256, 256), (640, 480), (333, 517), (1024, 768)])
+@pytest.mark.parametrize('smooth', [1, 8, 64])
+def test_matches_fft2_formula(size, smooth):
+    rng = np.random.default_rng(size[0] * smooth)
+    img = _random_image(rng, size, smooth)
+    old = fft2_blur(blur_thumbnail(img))
+    assert abs(blur_score(img) - old) <= BLUR_TOLERANCE
+    # Same thumbnail: the same number up to float rounding
+    assert blur_score(img) == pytest.approx(old, abs=1e-5)
+
+
+def test_batched_scores_match_single():
+    rng = np.random.default_rng(3)
+    imgs = [_random_image(rng, (320, 240), s) for s in (1, 4, 16, 64)]
+    thumbs = np.stack([blur_thumbnail(img) for img in imgs])
+    np.testing.assert_allclose(blur_scores(thumbs), [blur_score(img) for img in imgs], atol=1e-6)
+
+
+def test_sharper_scores_higher():
+    rng = np.random.default_rng(4)
+    sharp = _random_image(rng, (512, 512), 1)
+    assert blur_score(sharp) > blur_score(sharp.resize((32, 32)).resize((512, 512), Image.BICUBIC))
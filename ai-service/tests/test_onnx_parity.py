@@ -0,0 +1,62 @@
+"""ONNX Runtime encoders (INFER_BACKEND=onnx and onnx-int8) against the torch reference.
+
+The graphs are exported by the test itself from the real architectures with
+seeded random weights (`untrained_weights`), the same path `Models` takes on
+first use, into a temporary ONNX_MODEL_DIR. Needs onnxruntime; skipped
+otherwise. Tolerances are those of `benchmarks.inference`.
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from app import ai_checks
+from app.onnx_backend import ORT_OK
+
+MAX_EMBEDDING_DRIFT = 0.02  # 1 - cosine
+MAX_SCORE_DIFF = 0.02  # CLIP tree probability and margin
+
+pytestmark = pytest.mark.skipif(not ORT_OK, reason="onnxruntime is not installed")
+
+
+def _images(n=6, seed=0):
+    # Smooth colour fields plus texture, greener in half of them
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(n):
+        base = rng.integers(0, 255, (12, 16, 3), dtype=np.uint8)
+        if i % 2:
+            base[..., 1] = np.maximum(base[..., 1], 150)
+        img = Image.fromarray(base).resize((640, 480), Image.BICUBIC)
+        arr = np.asarray(img, dtype=np.int16) + rng.integers(-20, 20, (480, 640, 3), dtype=np.int16)
+        out.append(ai_checks.ImageBundle(Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))))
+    return out
+
+
+
+def _outputs(backend, bundles, onnx_dir):
+    m = ai_checks.Models(artifact_dir=None, backend=backend, onnx_dir=onnx_dir, embedding='efficientnet')
+    assert m.backend == backend
+    vecs = m.encode_tensors([m.encoder_tf(b.working) for b in bundles])
+    stats = np.asarray(m.clip_stats_tensors([m.clip_preprocess(b.working) for b in bundles]))
+    return vecs, stats
+
+
+@pytest.fixture(scope='module')
+def outputs(untrained_weights, tmp_path_factory):
+    bundles = _images()
+    onnx_dir = str(tmp_path_factory.mktemp('onnx'))
+    return {backend: _outputs(backend, bundles, onnx_dir) for backend in ('torch', 'onnx', 'onnx-int8')}
+
+
+@pytest.mark.parametrize('backend', ['onnx', 'onnx-int8'])
+def test_embeddings_match(outputs, backend):
+    (ref, _), (vecs, _) = outputs['torch'], outputs[backend]
+    cos = np.sum(vecs * ref, axis=1) / (np.linalg.norm(vecs, axis=1) * np.linalg.norm(ref, axis=1) + 1e-12)
+    assert float(1.0 - cos.min()) <= MAX_EMBEDDING_DRIFT
+
+
+@pytest.mark.parametrize('backend', ['onnx', 'onnx-int8'])
+def test_tree_scores_match(outputs, backend):
+    (_, ref), (_, stats) = outputs['torch'], outputs[backend]
+    # Columns: tree probability, margin vs the negative prompts
+    np.testing.assert_allclose(stats, ref, atol=MAX_SCORE_DIFF)
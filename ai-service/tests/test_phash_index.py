@@ -0,0 +1,94 @@
+"""PHashIndex radius queries against brute-force Hamming distance.
+
+Run from ai-service/: python -m pytest tests
+"""
+import numpy as np
+import pytest
+
+from app.phash_index import CHUNKS, MAX_PROBE_RADIUS, PHashIndex, first_similar_pair
+
+
+def _hex(code: int) -> str:
+    return f"{code:016x}"
+
+
+def _flip(code: int, bits) -> int:
+    for b in bits:
+        code ^= 1 << int(b)
+    return code
+
+
+@pytest.fixture(scope='module')
+def hashes():
+    rng = np.random.default_rng(7)
+    base = [int(c) for c in rng.integers(0, 2 ** 63, 400, dtype=np.int64)]
+    # Near-copies of some of them, so every radius has hits
+    near = [_flip(base[i], rng.choice(64, size=i % 12, replace=False)) for i in range(200)]
+    return {f"t{i}": code for i, code in enumerate(base + near)}
+
+
+def _brute(hashes, query: int, max_dist: int):
+    return {k: (c ^ query).bit_count() for k, c in hashes.items() if (c ^ query).bit_count() <= max_dist}
+
+
+def _index(hashes) -> PHashIndex:
+    idx = PHashIndex()
+    for k, code in hashes.items():
+        idx.add(k, _hex(code))
+    return idx
+
+
+# Radii probed by multi-index hashing, and one past MAX_PROBE_RADIUS that scans
+@pytest.mark.parametrize('max_dist', [0, 4, 8, 11, CHUNKS * (MAX_PROBE_RADIUS + 1)])
+def test_query_matches_brute_force(hashes, max_dist):
+    idx = _index(hashes)
+    rng = np.random.default_rng(max_dist)
+    for key in list(hashes)[::7]:
+        query = _flip(hashes[key], rng.choice(64, size=int(rng.integers(0, 6)), replace=False))
+        got = idx.query(_hex(query), max_dist, limit=len(hashes))
+        assert dict(got) == _brute(hashes, query, max_dist)
+        assert [d for _, d in got] == sorted(d for _, d in got)
+
+
+def test_query_limit_keeps_nearest(hashes):
+    idx = _index(hashes)
+    query = hashes['t3']
+    got = idx.query(_hex(query), 11, limit=2)
+    assert got[0] == ('t3', 0)
+    assert len(got) <= 2
+
+
+def test_readd_rehashes(hashes):
+    idx = _index(hashes)
+    idx.add('t0', _hex(hashes['t1']))
+    assert len(idx) == len(hashes)
+    assert 't0' in dict(idx.query(_hex(hashes['t1']), 0))
+    assert 't0' not in dict(idx.query(_hex(hashes['t0']), 0))
+
+
+def test_remove_matches_brute_force(hashes):
+    idx = _index(hashes)
+    rng = np.random.default_rng(3)
+    gone = set(rng.choice(list(hashes), 250, replace=False).tolist())
+    assert idx.remove([*gone, 'unknown']) == len(gone)
+    live = {k: c for k, c in hashes.items() if k not in gone}
+    assert len(idx) == len(live)
+    for key in list(hashes)[::5]:
+        got = idx.query(_hex(hashes[key]), 8, limit=len(hashes))
+        assert dict(got) == _brute(live, hashes[key], 8)
+    # Freed rows are reused
+    idx.add('new', _hex(hashes['t2']))
+    assert ('new', 0) in idx.query(_hex(hashes['t2']), 0)
+
+
+def test_bad_hash_is_ignored():
+    idx = PHashIndex()
+    idx.add('x', 'not a hash')
+    assert len(idx) == 0
+    assert idx.query('not a hash', 8) == []
+
+
+def test_first_similar_pair():
+    a = 0x0123456789abcdef
+    assert first_similar_pair([_hex(a), _hex(~a & (2 ** 64 - 1)), _hex(_flip(a, [1, 2]))], 4) == (0, 2)
+    assert first_similar_pair([_hex(a), _hex(~a & (2 ** 64 - 1))], 4) is None
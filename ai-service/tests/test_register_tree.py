@@ -0,0 +1,60 @@
+"""/register-tree: a registered submission is deduplicated against before anything is written to Mongo."""
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from app import main
+from app.database import NearbyTrees
+from app.write_behind import WriteBehindBuffer
+
+PHASH = '8f373714acfcf4d0'
+CONTENT_HASH = 'ab' * 32
+LAT, LON = 12.9716, 77.5946
+
+
+@pytest.fixture
+def registrations(client, monkeypatch):
+    """A Mongo that is reachable but holds no trees and never sees a flush."""
+    buf = WriteBehindBuffer()
+    monkeypatch.setattr(main, 'registrations', buf)
+    monkeypatch.setattr(main.repo, 'is_configured', lambda: True)
+    monkeypatch.setattr(main.repo, 'is_connected', lambda: True)
+    monkeypatch.setattr(main.repo, 'find_registered', lambda hashes: {})
+    monkeypatch.setattr(main.tile_cache, 'find_nearby', lambda *args: NearbyTrees())
+    yield buf
+    for rec in buf.nearby(LAT, LON, 1.0):
+        main._unapply_registration(rec)
+
+
+def _register(client, **fields):
+    data = {'content_hash': CONTENT_HASH, 'latitude': LAT, 'longitude': LON, 'phash': PHASH, **fields}
+    return client.post('/register-tree', data=data)
+
+
+def test_second_submission_is_rejected_before_the_first_is_written(client, registrations):
+    first = str(ObjectId())
+    resp = _register(client, submission_id=first)
+    assert resp.status_code == 202 and resp.json()['tree_id'] == first
+    assert len(registrations) == 1 and registrations.flushed == 0
+
+    # The same tree photographed again, a pixel off: one bit of the pHash differs
+    second = SimpleNamespace(tree_ok=True, tree_score=0.9, tree_info={}, phash=PHASH[:-1] + '1',
+                             vector=np.ones((1, 8), dtype=np.float32))
+    status, body = asyncio.run(main._decide_single(second, LAT, LON))
+    assert status == 200 and body['status'] == 'REJECTED'
+    assert body['reason'] == main.PHASH_LOCAL_REASON and body['duplicate_of'] == first
+    assert registrations.flushed == 0
+
+    # The same upload registered again names the first submission
+    resp = _register(client, submission_id=str(ObjectId()))
+    assert resp.status_code == 200 and resp.json() == {'status': 'EXISTS', 'tree_id': first}
+
+
+@pytest.mark.parametrize('ids', [{}, {'tree_id': str(ObjectId()), 'submission_id': str(ObjectId())},
+                                 {'submission_id': 'not-an-id'}])
+def test_exactly_one_valid_id(client, registrations, ids):
+    assert _register(client, **ids).status_code == 400
+    assert len(registrations) == 0
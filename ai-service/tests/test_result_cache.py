@@ -0,0 +1,127 @@
+"""ResultCache tiers and in-flight coalescing of identical analyses."""
+import asyncio
+import os
+
+import pytest
+
+from app import main, result_cache
+from app.result_cache import ResultCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # now most recent
+    cache.put('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.evictions == 1 and len(cache) == 2
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    cache = ResultCache(max_entries=4, ttl_seconds=10)
+    cache.put('a', 1)
+    now[0] += 9
+    assert cache.get('a') == 1
+    now[0] += 2
+    assert cache.get('a') is None and len(cache) == 0
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ResultCache(max_entries=4, disk_dir=str(tmp_path)).put('ab' * 32, {'score': 0.9})
+    restarted = ResultCache(max_entries=4, disk_dir=str(tmp_path))
+    assert restarted.get('ab' * 32) == {'score': 0.9}
+    assert restarted.disk_hits == 1
+    # Promoted to memory
+    assert restarted.get('ab' * 32) == {'score': 0.9} and restarted.hits == 1
+
+
+def test_corrupt_pickle_is_a_miss(tmp_path):
+    cache = ResultCache(max_entries=4, disk_dir=str(tmp_path))
+    key = 'cd' * 32
+    cache.put(key, [1, 2, 3])
+    path = cache._path(key)
+    with open(path, 'wb') as fh:
+        fh.write(b'not a pickle')
+    assert ResultCache(max_entries=4, disk_dir=str(tmp_path)).get(key) is None
+    assert not os.path.exists(path)
+
+
+def analysis(data, thresholds):
+    return len(data)
+
+
+@pytest.fixture
+def coalescing(monkeypatch):
+    """A fresh cache and a CPU backend that counts calls and runs once released."""
+    calls, release = [], []
+
+    async def run_cpu(fn, *args):
+        calls.append(args[0])
+        await release[0].wait()
+        return fn(*args)
+
+    async def run_io(fn, *args):
+        return fn(*args)
+
+    monkeypatch.setattr(main, 'result_cache', ResultCache(max_entries=8))
+    monkeypatch.setattr(main.backend, 'run_cpu', run_cpu)
+    monkeypatch.setattr(main.backend, 'run_io', run_io)
+    return calls, release
+
+
+def test_identical_uploads_share_one_analysis(coalescing):
+    calls, release = coalescing
+
+    async def scenario():
+        release.append(asyncio.Event())
+        first = asyncio.ensure_future(main._cached_analysis(analysis, b'abc', ['d1']))
+        second = asyncio.ensure_future(main._cached_analysis(analysis, b'abc', ['d1']))
+        await asyncio.sleep(0)
+        release[0].set()
+        return await first, await second, await main._cached_analysis(analysis, b'abc', ['d1'])
+
+    first, second, third = asyncio.run(scenario())
+    assert calls == [b'abc']
+    assert (first, second, third) == ((3, 'MISS'), (3, 'COALESCED'), (3, 'HIT'))
+    assert main._inflight == {}
+
+
+def test_cancelled_waiter_does_not_cancel_the_other(coalescing):
+    calls, release = coalescing
+
+    async def scenario():
+        release.append(asyncio.Event())
+        first = asyncio.ensure_future(main._cached_analysis(analysis, b'abcd', ['d2']))
+        second = asyncio.ensure_future(main._cached_analysis(analysis, b'abcd', ['d2']))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release[0].set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == (4, 'COALESCED')
+    assert calls == [b'abcd'] and main._inflight == {}
+
+
+def failing_analysis(data, thresholds):
+    raise ValueError("undecodable")
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached(coalescing):
+    calls, release = coalescing
+
+    async def scenario():
+        release.append(asyncio.Event())
+        waiters = [asyncio.ensure_future(main._cached_analysis(failing_analysis, b'x', ['d3'])) for _ in range(2)]
+        await asyncio.sleep(0)
+        release[0].set()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert calls == [b'x'] and main._inflight == {} and len(main.result_cache) == 0
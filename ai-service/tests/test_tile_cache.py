@@ -0,0 +1,178 @@
+"""TileCache: per-tile versions, change-stream invalidation, LRU bound, dense tiles."""
+import queue
+import threading
+import time
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from app.batch import cell_center
+from app.database import NearbyTrees, RepoUnavailable, TreeRecord
+from app.tile_cache import TileCache
+from app.vector_index import haversine_m
+
+CELL_M = 250.0
+LOST = object()  # fed to the stream to break it
+
+
+class FakeRepo:
+    """Trees in memory; counts geofence queries and replays fed change events."""
+
+    def __init__(self, trees=()):
+        self.trees = {rec.id: rec for rec in trees}
+        self.queries = 0
+        self.on_query = None  # called mid-query, as a change racing a tile load
+        self.events = queue.Queue()
+
+    def find_nearby(self, lat, lon, radius_m, with_vectors=True, limit=100):
+        self.queries += 1
+        recs = list(self.trees.values())
+        dists = haversine_m(lat, lon, np.asarray([r.lat for r in recs]), np.asarray([r.lon for r in recs]))
+        found = [replace(recs[i], vector=recs[i].vector if with_vectors else None)
+                 for i in np.argsort(dists, kind='stable') if dists[i] <= radius_m][:limit]
+        if self.on_query is not None:
+            hook, self.on_query = self.on_query, None
+            hook()
+        return NearbyTrees(records=found)
+
+    def watch_changes(self):
+        yield None, None, None  # stream open
+        while True:
+            try:
+                event = self.events.get(timeout=0.02)
+            except queue.Empty:
+                yield None, None, None
+                continue
+            if event is LOST:
+                raise RepoUnavailable("change stream failed: connection reset")
+            yield event
+
+
+def _tree(tree_id, cell, offset_m=0.0):
+    lat, lon = cell_center(cell, CELL_M)
+    return TreeRecord(id=tree_id, lat=lat + offset_m / 111_320.0, lon=lon, phash=None, vector=None)
+
+
+def _ids(cache, repo, cell):
+    lat, lon = cell_center(cell, CELL_M)
+    return sorted(rec.id for rec in cache.find_nearby(repo, lat, lon, 50.0, with_vectors=False))
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+A, B, C = (1000, 1000), (1000, 1010), (1000, 1020)
+
+
+@pytest.fixture
+def watched():
+    repo = FakeRepo([_tree('a1', A), _tree('b1', B)])
+    cache = TileCache(cell_m=CELL_M)
+    thread = threading.Thread(target=cache.watch, args=(repo,), daemon=True)
+    thread.start()
+    _wait_for(lambda: cache.watching)
+    yield cache, repo
+    cache.stop()
+    thread.join(5)
+
+
+def test_tiles_are_cached_until_changed(watched):
+    cache, repo = watched
+    assert _ids(cache, repo, A) == ['a1'] and _ids(cache, repo, A) == ['a1']
+    assert repo.queries == 1 and (cache.hits, cache.misses) == (1, 1)
+
+
+def test_change_stream_updates_cached_tiles(watched):
+    cache, repo = watched
+    _ids(cache, repo, A)
+    repo.events.put(('insert', 'a2', _tree('a2', A, 10.0)))
+    _wait_for(lambda: cache.changes == 1)
+    assert _ids(cache, repo, A) == ['a1', 'a2']
+    repo.events.put(('delete', 'a1', None))
+    _wait_for(lambda: cache.changes == 2)
+    assert _ids(cache, repo, A) == ['a2']
+    # A tree moved out of the tile by an update leaves it
+    repo.events.put(('update', 'a2', _tree('a2', B)))
+    _wait_for(lambda: cache.changes == 3)
+    assert _ids(cache, repo, A) == [] and repo.queries == 1
+
+
+def test_stream_loss_clears_and_bypasses(watched):
+    cache, repo = watched
+    _ids(cache, repo, A)
+    _ids(cache, repo, B)
+    assert len(cache) == 2
+    repo.events.put(LOST)
+    _wait_for(lambda: not cache.watching)
+    assert len(cache) == 0 and cache.stats()['trees'] == 0 and not cache.active
+    before = repo.queries
+    _ids(cache, repo, A)
+    assert repo.queries == before + 1 and cache.bypassed == 1
+    # Back to cached once the stream reopens
+    _wait_for(lambda: cache.watching)
+    _ids(cache, repo, A)
+    _ids(cache, repo, A)
+    assert repo.queries == before + 2
+
+
+def test_lru_bound_by_tree_count():
+    repo = FakeRepo([_tree(f'{name}{i}', cell, 10.0 * i) for name, cell in (('a', A), ('b', B), ('c', C))
+                     for i in range(2)])
+    cache = TileCache(cell_m=CELL_M, max_trees=5, allow_unwatched=True)
+    _ids(cache, repo, A)
+    _ids(cache, repo, B)
+    _ids(cache, repo, A)  # B is now least recently used
+    _ids(cache, repo, C)
+    assert len(cache) == 2 and cache.stats()['trees'] == 4
+    queries = repo.queries
+    _ids(cache, repo, A)
+    assert repo.queries == queries
+    _ids(cache, repo, B)
+    assert repo.queries == queries + 1
+
+
+def test_dense_tiles_go_to_mongo():
+    repo = FakeRepo([_tree(f'a{i}', A, 5.0 * i) for i in range(3)] + [_tree('b1', B)])
+    cache = TileCache(cell_m=CELL_M, tile_limit=3, allow_unwatched=True)
+    for _ in range(3):
+        assert _ids(cache, repo, A) == ['a0', 'a1', 'a2']
+    # One load finds the tile dense; every query after it bypasses the cache
+    assert repo.queries == 4 and cache.bypassed == 3
+    assert _ids(cache, repo, B) == ['b1'] and _ids(cache, repo, B) == ['b1']
+    assert repo.queries == 5 and cache.stats()['trees'] == 1
+
+
+@pytest.mark.parametrize('change', ['insert', 'delete'])
+def test_load_racing_a_change_is_not_cached(change):
+    repo = FakeRepo([_tree('a1', A)])
+    cache = TileCache(cell_m=CELL_M, allow_unwatched=True)
+
+    def racing():
+        # Applied by the stream while the tile is being read
+        if change == 'insert':
+            repo.trees['a2'] = _tree('a2', A)
+            cache.upsert(repo.trees['a2'])
+        else:
+            del repo.trees['a1']
+            cache.remove('a1')
+
+    repo.on_query = racing
+    assert _ids(cache, repo, A) == ['a1']  # served once, stale, but not kept
+    assert len(cache) == 0
+    assert _ids(cache, repo, A) == sorted(repo.trees) and len(cache) == 1
+
+
+def test_versions_are_per_tile():
+    repo = FakeRepo([_tree('a1', A), _tree('b1', B)])
+    cache = TileCache(cell_m=CELL_M, allow_unwatched=True)
+    _ids(cache, repo, A)
+    # A change to a tree of another cached tile during the load does not stop this one being cached
+    repo.on_query = lambda: cache.upsert(_tree('a1', A, 10.0))
+    _ids(cache, repo, B)
+    queries = repo.queries
+    assert _ids(cache, repo, B) == ['b1'] and repo.queries == queries
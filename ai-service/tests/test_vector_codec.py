@@ -0,0 +1,60 @@
+"""`vector_bin` encoding: round trips, legacy lists and unreadable blobs."""
+import numpy as np
+import pytest
+from bson import BSON, Binary
+
+from app.database import VECTOR_HEADER, decode_vectors, encode_vector
+
+
+def _unit(rng, dim=1280):
+    vec = rng.normal(size=dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+@pytest.mark.parametrize('dtype, atol', [('float32', 1e-6), ('float16', 1e-3)])
+def test_round_trip(dtype, atol):
+    rng = np.random.default_rng(0)
+    vecs = [_unit(rng) for _ in range(5)]
+    blobs = [encode_vector(v, dtype) for v in vecs]
+    # Through BSON, as stored
+    blobs = [BSON.encode({'v': b}).decode()['v'] for b in blobs]
+    mat, rows = decode_vectors(blobs)
+    assert rows == list(range(5))
+    assert mat.dtype == np.float32 and mat.flags['C_CONTIGUOUS']
+    np.testing.assert_allclose(mat, np.stack(vecs), atol=atol)
+    np.testing.assert_allclose(np.linalg.norm(mat, axis=1), 1.0, atol=1e-5)
+
+
+def test_header_and_size():
+    blob = encode_vector(np.arange(1, 9, dtype=np.float32), 'float16')
+    magic, version, code, dim = VECTOR_HEADER.unpack_from(blob)
+    assert (magic, dim) == (b'MV', 8)
+    assert len(blob) == VECTOR_HEADER.size + 8 * 2
+
+
+def test_encode_normalises():
+    mat, _ = decode_vectors([encode_vector([3.0, 4.0], 'float32')])
+    np.testing.assert_allclose(mat[0], [0.6, 0.8], rtol=1e-6)
+
+
+def test_legacy_lists_mix_with_blobs():
+    rng = np.random.default_rng(1)
+    a, b = _unit(rng, 16), _unit(rng, 16)
+    mat, rows = decode_vectors([(a * 3).tolist(), encode_vector(b, 'float32')])
+    assert rows == [0, 1]
+    np.testing.assert_allclose(mat, np.stack([a, b]), atol=1e-6)
+
+
+def test_skips_missing_unreadable_and_other_dims():
+    rng = np.random.default_rng(2)
+    good = encode_vector(_unit(rng, 16), 'float32')
+    bad_magic = Binary(b'XX' + bytes(good)[2:])
+    other_dim = encode_vector(_unit(rng, 8), 'float32')
+    mat, rows = decode_vectors([None, [], bad_magic, good, other_dim, good])
+    assert rows == [3, 5]
+    assert mat.shape == (2, 16)
+
+
+def test_nothing_decodable():
+    mat, rows = decode_vectors([None, []])
+    assert rows == [] and mat.shape == (0, 0)
@@ -0,0 +1,84 @@
+"""VectorIndex: removal, reconciliation and snapshots with HNSW tombstones."""
+import numpy as np
+import pytest
+
+from app.vector_index import HNSW_OK, VectorIndex
+
+
+class FakeRepo:
+    """Stands in for MongoRepo.tree_ids over a set of stored tree ids."""
+
+    def __init__(self, ids):
+        self.ids = {str(i) for i in ids}
+
+    def is_connected(self):
+        return True
+
+    def tree_ids(self, field, among=None):
+        return set(self.ids) if among is None else self.ids & {str(i) for i in among}
+
+
+def _vectors(n, dim=8, seed=0):
+    vecs = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def _filled(n, use_hnsw=True, seed=0):
+    index = VectorIndex(use_hnsw=use_hnsw, model_version='m')
+    vecs = _vectors(n, seed=seed)
+    index.add([f"t{i}" for i in range(n)], vecs, np.full(n, 10.0), np.full(n, 20.0))
+    return index, vecs
+
+
+@pytest.fixture(params=[True, False] if HNSW_OK else [False], ids=lambda h: 'hnsw' if h else 'exact')
+def use_hnsw(request):
+    return request.param
+
+
+def test_removed_trees_are_not_found(use_hnsw):
+    index, vecs = _filled(50, use_hnsw)
+    assert index.remove(['t3', 't49', 'missing']) == 2
+    assert len(index) == 48
+    for i in (3, 49):
+        assert all(hit[0] not in ('t3', 't49') for hit in index.search(vecs[i], k=48))
+    # The tree moved into a freed row is still found as itself
+    assert index.search(vecs[48], k=1)[0][0] == 't48'
+    assert index.search(vecs[48], k=1, lat=10.0, lon=20.0, radius_m=5.0)[0][0] == 't48'
+    found, mat, missing = index.get(['t48', 't3'])
+    assert found == ['t48'] and missing == ['t3']
+    np.testing.assert_allclose(mat[0], vecs[48], atol=1e-6)
+
+
+def test_reconcile_drops_out_of_band_deletes(use_hnsw):
+    index, vecs = _filled(20, use_hnsw)
+    stored = {f"t{i}" for i in range(20)} - {'t1', 't2', 't7'}
+    # t7 is a pending registration, not yet in Mongo
+    assert index.reconcile(FakeRepo(stored), keep=['t7']) == 2
+    assert len(index) == 18
+    assert index.search(vecs[1], k=1)[0][0] != 't1'
+    assert index.search(vecs[7], k=1)[0][0] == 't7'
+
+
+def test_snapshot_round_trip_with_tombstones(tmp_path, use_hnsw):
+    index, vecs = _filled(3000, use_hnsw)
+    index.remove([f"t{i}" for i in range(100, 3000)])
+    path = str(tmp_path / 'snap')
+    index.save(path)
+
+    loaded = VectorIndex(use_hnsw=use_hnsw, model_version='m')
+    assert loaded.load(path)
+    assert len(loaded) == 100 and loaded.stats()['backend'] == ('hnsw' if use_hnsw else 'exact')
+    for i in (0, 57, 99):
+        assert loaded.search(vecs[i], k=1)[0][0] == f"t{i}"
+    # Growing past the loaded capacity keeps the graph's tombstones in range
+    more = _vectors(1500, seed=1)
+    loaded.add([f"n{i}" for i in range(1500)], more, np.zeros(1500), np.zeros(1500))
+    assert len(loaded) == 1600
+    assert loaded.search(more[1499], k=1)[0][0] == 'n1499'
+    assert loaded.search(vecs[42], k=1)[0][0] == 't42'
+
+
+def test_snapshot_of_another_model_is_not_loaded(tmp_path):
+    index, _ = _filled(5)
+    index.save(str(tmp_path / 'snap'))
+    assert not VectorIndex(model_version='other').load(str(tmp_path / 'snap'))
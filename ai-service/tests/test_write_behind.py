@@ -0,0 +1,189 @@
+"""WriteBehindBuffer: journaling, replay after a crash, flushing and compaction."""
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from app.database import RepoUnavailable, TreeRecord
+from app.write_behind import Registration, WriteBehindBuffer
+
+
+class FakeRepo:
+    """Stands in for MongoRepo.register_trees over existing tree ids and submissions under review."""
+
+    def __init__(self, tree_ids=(), down=False, under_review=()):
+        self.tree_ids = set(tree_ids)  # for submissions, the submission ids their trees were created from
+        self.under_review = set(under_review)
+        self.down = down
+        self.written = {}  # content hash -> (tree id, model version)
+
+    def register_trees(self, trees):
+        if self.down:
+            raise RepoUnavailable("circuit open")
+        stored, missing, unreviewed = {}, [], []
+        for content_hash, rec, model_version, submission in trees:
+            if submission and rec.id in self.under_review:
+                unreviewed.append(content_hash)
+            elif rec.id not in self.tree_ids:
+                missing.append(content_hash)
+            elif content_hash in self.written and self.written[content_hash][0] != rec.id:
+                stored[content_hash] = self.written[content_hash][0]
+            else:
+                self.written[content_hash] = (rec.id, model_version)
+        return stored, missing, unreviewed
+
+
+def _reg(i, vector=True, submission=False):
+    vec = None
+    if vector:
+        vec = np.random.default_rng(i).normal(size=8).astype(np.float32)
+        vec /= np.linalg.norm(vec)
+    rec = TreeRecord(id=ObjectId(), lat=10.0 + i, lon=20.0 + i, phash=f"{i:016x}", vector=vec)
+    return Registration(content_hash=f"{i:064x}", record=rec, model_version='efficientnet_b0' if vector else None,
+                        submission=submission)
+
+
+def _lines(path):
+    return [line for line in path.read_text().splitlines() if line.strip()]
+
+
+def test_replay_restores_unwritten_registrations(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    buf = WriteBehindBuffer(journal_path=str(journal))
+    regs = [_reg(1), _reg(2, vector=False), _reg(3, submission=True)]
+    for reg in regs:
+        assert buf.register(reg) == (reg.record.id, True)
+    assert len(_lines(journal)) == 3
+
+    # A new process after a crash
+    replayed = WriteBehindBuffer(journal_path=str(journal)).replay()
+    assert [r.content_hash for r in replayed] == [r.content_hash for r in regs]
+    for got, want in zip(replayed, regs):
+        assert got.record.id == want.record.id and isinstance(got.record.id, ObjectId)
+        assert (got.record.lat, got.record.lon, got.record.phash) == (want.record.lat, want.record.lon, want.record.phash)
+        assert got.model_version == want.model_version and got.submission == want.submission
+        if want.record.vector is None:
+            assert got.record.vector is None
+        else:
+            np.testing.assert_array_equal(got.record.vector, want.record.vector)
+
+
+def test_replay_skips_torn_line(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    buf = WriteBehindBuffer(journal_path=str(journal))
+    buf.register(_reg(1))
+    with open(journal, 'a', encoding='utf-8') as fh:
+        fh.write('{"content_hash": "ab')  # a write cut short by a crash
+    replayed = WriteBehindBuffer(journal_path=str(journal)).replay()
+    assert [r.content_hash for r in replayed] == [_reg(1).content_hash]
+
+
+def test_replay_without_journal(tmp_path):
+    assert WriteBehindBuffer(journal_path=str(tmp_path / 'none' / 'journal.jsonl')).replay() == []
+    assert WriteBehindBuffer().replay() == []
+
+
+def test_flush_compacts_journal(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    buf = WriteBehindBuffer(flush_size=2, journal_path=str(journal))
+    regs = [_reg(i) for i in range(3)]
+    for reg in regs:
+        buf.register(reg)
+    repo = FakeRepo(r.record.id for r in regs)
+    flushed, stored, missing = buf.flush(repo)
+    assert [r.content_hash for r in flushed] == [r.content_hash for r in regs[:2]]
+    assert stored == {} and missing == []
+    # Only the registration still pending is left to replay
+    assert [r.content_hash for r in WriteBehindBuffer(journal_path=str(journal)).replay()] == [regs[2].content_hash]
+    buf.flush(repo)
+    assert _lines(journal) == []
+    assert buf.lookup(regs[0].content_hash) == regs[0].record.id
+
+
+def test_unavailable_repo_keeps_order_and_journal(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    buf = WriteBehindBuffer(flush_size=2, journal_path=str(journal))
+    regs = [_reg(i) for i in range(3)]
+    for reg in regs:
+        buf.register(reg)
+    with pytest.raises(RepoUnavailable):
+        buf.flush(FakeRepo(down=True))
+    assert len(buf) == 3 and buf.flush_failures == 1
+    assert len(_lines(journal)) == 3
+    flushed, _, _ = buf.flush(FakeRepo(r.record.id for r in regs))
+    assert [r.content_hash for r in flushed] == [r.content_hash for r in regs[:2]]
+
+
+def test_repeats_and_missing_trees(tmp_path):
+    buf = WriteBehindBuffer(journal_path=str(tmp_path / 'journal.jsonl'))
+    first, again, lost = _reg(1), _reg(1), _reg(2)
+    buf.register(first)
+    assert buf.register(again) == (first.record.id, False)
+    buf.register(lost)
+    _, _, missing = buf.flush(FakeRepo([first.record.id]))
+    assert missing == [lost.content_hash]
+    # Not remembered, so the upload can be registered again against an existing tree
+    assert buf.lookup(lost.content_hash) is None
+    assert buf.lookup(first.content_hash) == first.record.id
+    assert buf.flushed == 1
+
+
+def test_drain_gives_up_after_timeout(tmp_path):
+    buf = WriteBehindBuffer(journal_path=str(tmp_path / 'journal.jsonl'))
+    buf.register(_reg(1))
+    assert buf.drain(FakeRepo(down=True), timeout_s=0.2) == 1
+    assert WriteBehindBuffer(journal_path=buf.journal_path).replay()
+
+
+def test_nearby_only_unwritten():
+    buf = WriteBehindBuffer()
+    near, far = _reg(0), _reg(5)
+    buf.register(near)
+    buf.register(far)
+    assert [r.id for r in buf.nearby(10.0, 20.0, 100.0)] == [near.record.id]
+    buf.flush(FakeRepo([near.record.id, far.record.id]))
+    assert buf.nearby(10.0, 20.0, 100.0) == []
+
+
+def test_submission_waits_for_its_tree(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    buf = WriteBehindBuffer(flush_size=2, journal_path=str(journal))
+    sub, tree = _reg(1, submission=True), _reg(2)
+    buf.register(sub)
+    buf.register(tree)
+    repo = FakeRepo([tree.record.id], under_review=[sub.record.id])
+    flushed, stored, missing = buf.flush(repo)
+    assert [r.content_hash for r in flushed] == [tree.content_hash] and missing == []
+    # Still deduplicated against and journaled, but not a reason to flush or to keep draining
+    assert buf.waiting == 1 and not buf.full
+    assert buf.lookup(sub.content_hash) == sub.record.id and sub.record.id in buf.pending_ids()
+    assert [r.id for r in buf.nearby(11.0, 21.0, 100.0)] == [sub.record.id]
+    assert [r.content_hash for r in WriteBehindBuffer(journal_path=str(journal)).replay()] == [sub.content_hash]
+    assert buf.drain(repo, timeout_s=5.0) == 1
+
+    # Approved: the tree created from the submission gets the artifacts
+    repo.under_review.clear()
+    repo.tree_ids.add(sub.record.id)
+    flushed, _, missing = buf.flush(repo)
+    assert [r.content_hash for r in flushed] == [sub.content_hash] and missing == []
+    assert len(buf) == 0 and _lines(journal) == []
+
+
+def test_rejected_submission_is_dropped():
+    buf = WriteBehindBuffer()
+    sub = _reg(1, submission=True)
+    buf.register(sub)
+    assert buf.flush(FakeRepo(under_review=[sub.record.id]))[0] == []
+    _, _, missing = buf.flush(FakeRepo())
+    assert missing == [sub.content_hash] and len(buf) == 0
+    assert buf.lookup(sub.content_hash) is None
+
+
+def test_unavailable_repo_keeps_waiting_submissions():
+    buf = WriteBehindBuffer(flush_size=4)
+    sub, tree = _reg(1, submission=True), _reg(2)
+    buf.register(sub)
+    buf.flush(FakeRepo(under_review=[sub.record.id]))
+    buf.register(tree)
+    with pytest.raises(RepoUnavailable):
+        buf.flush(FakeRepo(down=True))
+    assert buf.waiting == 1 and len(buf) == 2 and not buf.full
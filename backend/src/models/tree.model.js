@@ -12,6 +12,7 @@ const TreeSchema = new mongoose.Schema({
   metadataUri: String, // IPFS or other metadata URI
   phash: String,
   vector: { type: [Number], index: false },
+  model_version: String, // embedding model behind phash/vector (AI service `model_version`)
   ratePpm: Number, // Carbon credit rate in parts per million
   cctGranted: Number, // CCT amount granted
   status: { type: String, enum: ['PENDING', 'APPROVED', 'REJECTED'], default: 'APPROVED' },
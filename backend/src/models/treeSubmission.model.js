@@ -10,6 +10,7 @@ const TreeSubmissionSchema = new mongoose.Schema({
   },
   phash: String,
   vector: { type: [Number], index: false },
+  model_version: String, // embedding model behind phash/vector (AI service `model_version`)
   aiDecision: Object,
   createdAt: { type: Date, default: Date.now },
   reviewedBy: String, // Can be adminId or username
@@ -8,6 +8,36 @@ const router = Router();
 const upload = multer();
 const AI_BASE_URL = process.env.AI_BASE_URL || (process.env.DOCKER || process.env.CONTAINER ? 'http://miko_ai:8000' : 'http://localhost:8000');
 
+// Hand a pending submission's artifacts to the AI service, so the same tree
+// submitted again is rejected before anyone reviews this one. Best effort:
+// the submission is already saved, and the AI service writes the artifacts
+// onto the tree created from it at approval.
+async function registerSubmission(sub, ai, phash){
+  const artifacts = ai.artifacts;
+  if (sub.status !== 'PENDING' || !artifacts?.content_hash) return;
+  const [longitude, latitude] = sub.location.coordinates;
+  const form = new FormData();
+  form.append('submission_id', String(sub._id));
+  form.append('content_hash', artifacts.content_hash);
+  form.append('latitude', String(latitude));
+  form.append('longitude', String(longitude));
+  if (phash) form.append('phash', phash);
+  if (Array.isArray(artifacts.vector)){
+    form.append('vector', JSON.stringify(artifacts.vector));
+    form.append('model_version', artifacts.model_version);
+  }
+  const controller = new AbortController();
+  const timeout = setTimeout(() => controller.abort(), 5000);
+  try {
+    const resp = await fetch(`${AI_BASE_URL}/register-tree`, { method: 'POST', body: form, signal: controller.signal });
+    if (resp.status >= 400) console.error('[mint.register] AI service refused', sub._id, resp.status, await resp.text());
+  } catch (e){
+    console.error('[mint.register] AI service unavailable', sub._id, e);
+  } finally {
+    clearTimeout(timeout);
+  }
+}
+
 // Submit mint for verification
 router.post('/submit', requireAuth, upload.single('image'), async (req,res)=>{
   try {
@@ -33,8 +63,10 @@ router.post('/submit', requireAuth, upload.single('image'), async (req,res)=>{
       location: { type:'Point', coordinates: [Number(longitude), Number(latitude)] },
       phash: ai.artifacts?.phash,
       vector: ai.artifacts?.vector,
+      model_version: ai.artifacts?.model_version,
       aiDecision: ai
     });
+    await registerSubmission(sub, ai, sub.phash);
     res.json({ ok:true, submissionId: sub._id, status: sub.status, ai });
   } catch (e){
     console.error('[mint.submit] error', e);
@@ -69,8 +101,10 @@ router.post('/submit-multi', requireAuth, upload.array('images', 6), async (req,
       location: { type:'Point', coordinates: [Number(longitude), Number(latitude)] },
       phash: Array.isArray(ai.artifacts?.phashes) ? ai.artifacts.phashes[0] : undefined,
       vector: ai.artifacts?.vector,
+      model_version: ai.artifacts?.model_version,
       aiDecision: ai
     });
+    await registerSubmission(sub, ai, sub.phash);
     res.json({ ok:true, submissionId: sub._id, status: sub.status, ai });
   } catch (e){
     console.error('[mint.submit-multi] error', e);
@@ -95,7 +129,8 @@ router.post('/:id/approve', requireAuth, requireRole('ADMIN','VALIDATOR'), async
     userId: doc.userId,
     location: doc.location,
     phash: doc.phash,
-    vector: doc.vector
+    vector: doc.vector,
+    model_version: doc.model_version
   });
   // TODO: trigger on-chain mint workflow here
   res.json({ ok:true, submission: doc });